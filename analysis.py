@@ -0,0 +1,110 @@
+import threading
+
+from chess_ai import analyse, MATE_SCORE, MATE_THRESHOLD
+from moves import move_start, move_end, move_promotion
+from position import Position
+from util import EMPTY, WHITE, PAWN, PROMOTION_CODES, print_move_notation
+
+
+def move_san(position, move):
+    """Notation for a packed move in the same style as the move log (the position is left unchanged)."""
+    start, end = move_start(move), move_end(move)
+    piece = position.board[start[0]][start[1]]
+    capture = position.board[end[0]][end[1]] != EMPTY or ((piece & 7) == PAWN and end == position.en_passant_target)
+    notation = print_move_notation(piece, start, end, capture)
+    if move_promotion(move):
+        notation += f"={PROMOTION_CODES[move_promotion(move)]}"
+    undo = position.make_packed_move(move)
+    if position.is_in_check():
+        notation += "+" if position.has_legal_move() else "#"
+    position.unmake_move(undo)
+    return notation
+
+
+def line_san(position, line):
+    """A principal variation as numbered notation, e.g. '12. Nf3 Nc6 13. Bb5' or '12... Nc6 13. Bb5'."""
+    parts = []
+    undos = []
+    for i, move in enumerate(line):
+        if position.color == WHITE:
+            parts.append(f"{position.fullmove}.")
+        elif i == 0:
+            parts.append(f"{position.fullmove}...")
+        parts.append(move_san(position, move))
+        undos.append(position.make_packed_move(move))
+    while undos:
+        position.unmake_move(undos.pop())
+    return " ".join(parts)
+
+
+def format_score(score, color):
+    """A side-to-move score as White-relative text: '+0.35', '-1.20', '#3' or '#-2'."""
+    if color != WHITE:
+        score = -score
+    if abs(score) >= MATE_THRESHOLD:
+        moves = (MATE_SCORE - abs(score) + 1) // 2
+        return f"#{moves}" if score > 0 else f"#-{moves}"
+    return f"{score / 100:+.2f}"
+
+
+class AnalysisWorker:
+    """
+    Runs chess_ai.analyse on a background thread. set_position() interrupts
+    the running analysis and starts on the new position; the transposition
+    table is kept between positions, so after a move most of the previous
+    work is reused. Every completed depth is published as (depth, lines)
+    with lines of (score text, notation) and a new version number, so the
+    GUI only re-renders when something changed.
+    """
+    def __init__(self, multipv=3, pv_length=8):
+        self.multipv = multipv
+        self.pv_length = pv_length
+        self.version = 0
+        self.result = None  # (fen, depth, lines) for the latest completed depth
+        self._fen = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._interrupt = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_position(self, fen):
+        """Analyses `fen` from now on; None pauses the analysis."""
+        with self._lock:
+            if fen == self._fen:
+                return
+            self._fen = fen
+            self.result = None
+            self.version += 1
+        self._interrupt.set()
+        self._wake.set()
+
+    def latest(self):
+        """Returns (version, result); result is None until the first depth completes."""
+        with self._lock:
+            return self.version, self.result
+
+    def stop(self):
+        self._running = False
+        self._interrupt.set()
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            self._wake.wait()
+            with self._lock:
+                fen = self._fen
+                self._wake.clear()
+                self._interrupt.clear()
+            if fen is None:
+                continue
+            position = Position.from_fen(fen)
+            for depth, lines in analyse(position, self.multipv, stop_event=self._interrupt):
+                text = [(format_score(score, position.color), line_san(position, line[:self.pv_length]))
+                        for score, line in lines]
+                with self._lock:
+                    if self._fen != fen:
+                        break
+                    self.result = (fen, depth, text)
+                    self.version += 1
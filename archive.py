@@ -0,0 +1,175 @@
+import argparse
+import sqlite3
+import time
+from array import array
+
+from moves import encode_move
+from position import Position
+from util import starting_fen
+
+DEFAULT_ARCHIVE = "games.db"
+
+# Final move log line -> (result, termination), matching the messages chess.py appends.
+GAME_ENDINGS = {
+    "White won by checkmate": ("1-0", "checkmate"),
+    "Black won by checkmate": ("0-1", "checkmate"),
+    "Draw by stalemate": ("1/2-1/2", "stalemate"),
+    "Draw by insufficient material": ("1/2-1/2", "insufficient_material"),
+    "Draw by three-fold repetition": ("1/2-1/2", "repetition"),
+    "White won on time": ("1-0", "timeout"),
+    "Black won on time": ("0-1", "timeout"),
+}
+
+# positions is a WITHOUT ROWID table clustered on the hash, so looking up a
+# position is a single index range scan however many games are stored.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    mode TEXT NOT NULL,
+    white TEXT NOT NULL,
+    black TEXT NOT NULL,
+    start_fen TEXT NOT NULL,
+    result TEXT NOT NULL,
+    termination TEXT NOT NULL,
+    plies INTEGER NOT NULL,
+    moves BLOB NOT NULL,
+    notation TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER NOT NULL,
+    game_id INTEGER NOT NULL,
+    ply INTEGER NOT NULL,
+    PRIMARY KEY (hash, game_id, ply)
+) WITHOUT ROWID;
+"""
+
+
+def to_signed(position_hash):
+    """SQLite integers are signed 64-bit; map an unsigned Zobrist hash onto that range."""
+    return position_hash - (1 << 64) if position_hash >= (1 << 63) else position_hash
+
+
+def result_from_log(move_log):
+    """Returns (result, termination) from the last line of a move log, or ('*', 'unfinished')."""
+    if move_log and move_log[-1] in GAME_ENDINGS:
+        return GAME_ENDINGS[move_log[-1]]
+    return "*", "unfinished"
+
+
+class GameRecord:
+    """
+    Collects one game as it is played: the packed moves (see moves.py), their
+    notation and the Zobrist hash of every position reached, starting with
+    the initial position at ply 0.
+    """
+    def __init__(self, start_fen=starting_fen, mode="", white="", black=""):
+        self.start_fen = start_fen
+        self.mode = mode
+        self.white = white
+        self.black = black
+        self.moves = array('H')
+        self.notation = []
+        self.hashes = [Position.from_fen(start_fen).hash]
+        self.started_at = time.time()
+        self.finished_at = None
+        self.result = "*"
+        self.termination = "unfinished"
+
+    def add_move(self, start, end, promotion, notation, position_hash):
+        self.moves.append(encode_move(start, end, promotion))
+        self.notation.append(notation)
+        self.hashes.append(position_hash)
+
+    def truncate(self, plies):
+        """Drops the moves after the first `plies`, when a move is taken back and replaced."""
+        del self.moves[plies:]
+        del self.notation[plies:]
+        del self.hashes[plies + 1:]
+
+    def finish(self, move_log, termination=None):
+        """Takes the result from the move log; `termination` overrides it for unfinished games."""
+        self.result, self.termination = result_from_log(move_log)
+        if termination is not None and self.result == "*":
+            self.termination = termination
+        self.finished_at = time.time()
+
+
+class GameArchive:
+    """A SQLite database of finished games with an index from position hash to (game, ply)."""
+    def __init__(self, path=DEFAULT_ARCHIVE):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def _insert(self, record):
+        finished_at = record.finished_at or time.time()
+        cursor = self.conn.execute(
+            "INSERT INTO games (started_at, finished_at, duration, mode, white, black, start_fen, "
+            "result, termination, plies, moves, notation) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record.started_at, finished_at, finished_at - record.started_at, record.mode, record.white,
+             record.black, record.start_fen, record.result, record.termination, len(record.moves),
+             record.moves.tobytes(), " ".join(record.notation)))
+        game_id = cursor.lastrowid
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO positions (hash, game_id, ply) VALUES (?, ?, ?)",
+            [(to_signed(h), game_id, ply) for ply, h in enumerate(record.hashes)])
+        return game_id
+
+    def save_game(self, record):
+        with self.conn:
+            return self._insert(record)
+
+    def save_games(self, records):
+        """Saves a batch of games in a single transaction and returns their ids."""
+        with self.conn:
+            return [self._insert(record) for record in records]
+
+    def games_with_position(self, position_hash, limit=1000):
+        """Returns (game_id, ply, result, termination) for games that reached the position."""
+        return self.conn.execute(
+            "SELECT p.game_id, p.ply, g.result, g.termination FROM positions p "
+            "JOIN games g ON g.id = p.game_id WHERE p.hash = ? ORDER BY p.game_id LIMIT ?",
+            (to_signed(position_hash), limit)).fetchall()
+
+    def position_results(self, position_hash):
+        """Returns {result: number of games} over the distinct games that reached the position."""
+        rows = self.conn.execute(
+            "SELECT g.result, COUNT(*) FROM games g WHERE g.id IN "
+            "(SELECT game_id FROM positions WHERE hash = ?) GROUP BY g.result",
+            (to_signed(position_hash),)).fetchall()
+        return dict(rows)
+
+    def game_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up a position in the game archive.")
+    parser.add_argument("fen", help="position to look up")
+    parser.add_argument("--db", default=DEFAULT_ARCHIVE, help="archive database")
+    parser.add_argument("--limit", type=int, default=20, help="number of games to list")
+    args = parser.parse_args()
+
+    archive = GameArchive(args.db)
+    position_hash = Position.from_fen(args.fen).hash
+    start = time.perf_counter()
+    results = archive.position_results(position_hash)
+    games = archive.games_with_position(position_hash, args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{sum(results.values())} of {archive.game_count()} games reached this position ({elapsed:.1f} ms)")
+    for result, count in sorted(results.items()):
+        print(f"  {result}: {count}")
+    for game_id, ply, result, termination in games:
+        print(f"  game {game_id} at ply {ply}: {result} ({termination})")
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
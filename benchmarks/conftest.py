@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# Render offscreen and keep the mixer quiet; must be set before pygame is imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+# The game loads pieces/ and audio/ relative to the working directory.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+
+# Fixed positions every benchmark runs over, so results stay comparable between runs.
+BENCH_FENS = {
+    "opening_start": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "opening_italian": "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "opening_mated": "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3",
+    "middlegame_kiwipete": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "middlegame_castled": "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 7",
+    "endgame_rook": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "endgame_pawn": "8/8/8/4k3/8/8/4P3/4K3 w - - 0 1",
+}
+
+
+@pytest.fixture(params=list(BENCH_FENS.values()), ids=list(BENCH_FENS))
+def fen(request):
+    return request.param
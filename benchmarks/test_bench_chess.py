@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("pygame")
+pytest.importorskip("pytest_benchmark")
+
+import pygame
+import chess
+from position import Position
+from util import WINDOW_WIDTH, WINDOW_HEIGHT, Layout, SpriteCache, parse_fen, load_pieces
+
+
+def test_is_insufficient_material(benchmark, fen):
+    # The game keeps one Position and asks it directly after each move.
+    position = Position.from_fen(fen)
+    benchmark(position.is_insufficient_material)
+
+
+def test_add_check_symbols(benchmark, fen):
+    # The position is the one just reached, so the side to move is the opponent being checked.
+    position = Position.from_fen(fen)
+    benchmark(chess.add_check_symbols, "Qh4", position)
+
+
+@pytest.fixture(scope="module")
+def window():
+    pygame.init()
+    win = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    pieces, small_pieces = load_pieces()
+    yield win, pieces
+    pygame.quit()
+
+
+def test_render_frame(benchmark, fen, window, monkeypatch):
+    win, pieces = window
+    # draw_pieces reads the module level board, like the game loop does.
+    monkeypatch.setattr(chess, "board", parse_fen(fen)[0])
+
+    def frame():
+        chess.draw_board(win)
+        chess.draw_pieces(win, pieces)
+
+    benchmark(frame)
+
+
+def test_render_frame_resized(benchmark, fen, window, monkeypatch):
+    # A window 1.5 times the default size, once its sprites have been scaled.
+    win, _ = window
+    layout = Layout(WINDOW_WIDTH * 3 // 2, WINDOW_HEIGHT * 3 // 2)
+    pieces, small_pieces = SpriteCache().get(layout.square_size, layout.small_size)
+    monkeypatch.setattr(chess, "board", parse_fen(fen)[0])
+    monkeypatch.setattr(chess, "layout", layout)
+
+    def frame():
+        chess.draw_board(win)
+        chess.draw_pieces(win, pieces)
+
+    benchmark(frame)
+
+
+def test_sprite_cache_hit(benchmark, window):
+    # Resizing back to a recent size reuses its sprites.
+    cache = SpriteCache()
+    sprites = cache.get(96, 48)
+    cache.get(80, 40)
+    assert benchmark(cache.get, 96, 48) is sprites
@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("pygame")
+pytest.importorskip("pytest_benchmark")
+
+import chess_ai
+from position import Position
+
+
+def test_pawn_structure(benchmark, fen):
+    benchmark(chess_ai.pawn_structure, Position.from_fen(fen))
+
+
+def test_evaluate_uncached(benchmark, fen):
+    search = chess_ai.Search(Position.from_fen(fen), float("inf"))
+
+    def evaluate():
+        chess_ai.eval_cache[search.position.hash & chess_ai.EVAL_CACHE_MASK] = None
+        chess_ai.pawn_table[search.position.pawn_hash & chess_ai.PAWN_TABLE_MASK] = None
+        return search.evaluate()
+
+    benchmark(evaluate)
+
+
+def test_evaluate_pawn_table_hit(benchmark, fen):
+    # A new position with known pawns: the common case at the leaves.
+    search = chess_ai.Search(Position.from_fen(fen), float("inf"))
+    search.evaluate()
+
+    def evaluate():
+        chess_ai.eval_cache[search.position.hash & chess_ai.EVAL_CACHE_MASK] = None
+        return search.evaluate()
+
+    benchmark(evaluate)
+
+
+def test_evaluate_cached(benchmark, fen):
+    search = chess_ai.Search(Position.from_fen(fen), float("inf"))
+    score = search.evaluate()
+    assert benchmark(search.evaluate) == score
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("pygame")
+pytest.importorskip("pytest_benchmark")
+
+from mate_solver import MateSolver, parse_epd, san_matches
+from position import Position
+
+# Puzzles as EPD with the mate length and, where it is unique, the key move.
+MATE_PUZZLES = {
+    "mate_in_1": 'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - bm Qxf7#; dm 1;',
+    "mate_in_2": 'r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - bm Nf6+; dm 2;',
+    "mate_in_3_queen": '8/1k6/7P/B1P5/3Q4/P1NP4/6P1/R3K1N1 w - - dm 3;',
+    "mate_in_3_minor_pieces": 'N2k4/8/8/PN1P3P/1P1P4/2P1B3/8/4KR1B w - - dm 3;',
+}
+
+
+@pytest.fixture(params=list(MATE_PUZZLES.values()), ids=list(MATE_PUZZLES))
+def puzzle(request):
+    return parse_epd(request.param)
+
+
+def test_mate_solver_proves_mate(benchmark, puzzle):
+    fen, operations = puzzle
+    position = Position.from_fen(fen)
+    mate_in = int(operations["dm"])
+    result, line = benchmark(lambda: MateSolver().solve(position, mate_in))
+    assert result is True
+    assert len(line) <= 2 * mate_in - 1
+    if "bm" in operations:
+        assert san_matches(position, line[0], operations["bm"])
+
+
+def test_mate_solver_refutes_shorter_mate(benchmark, puzzle):
+    fen, operations = puzzle
+    position = Position.from_fen(fen)
+    mate_in = int(operations["dm"])
+    if mate_in == 1:
+        pytest.skip("no shorter mate to refute")
+    result, line = benchmark(lambda: MateSolver().solve(position, mate_in - 1))
+    assert result is False
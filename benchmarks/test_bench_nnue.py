@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("pygame")
+pytest.importorskip("pytest_benchmark")
+pytest.importorskip("numpy")
+
+import nnue
+from position import Position
+from conftest import BENCH_FENS
+
+
+@pytest.fixture(scope="module")
+def network():
+    return nnue.random_network(seed=0)
+
+
+def test_nnue_incremental_update(benchmark, fen, network):
+    position = Position.from_fen(fen)
+    accumulator = nnue.Accumulator(network)
+    accumulator.refresh(position)
+    moves = position.generate_moves()
+
+    def push_evaluate_pop_all():
+        for move in moves:
+            undo = position.make_packed_move(move)
+            accumulator.push(position, undo)
+            accumulator.evaluate(position.color)
+            accumulator.pop()
+            position.unmake_move(undo)
+
+    benchmark(push_evaluate_pop_all)
+
+
+def test_nnue_full_refresh(benchmark, fen, network):
+    position = Position.from_fen(fen)
+    accumulator = nnue.Accumulator(network)
+    moves = position.generate_moves()
+
+    def refresh_evaluate_all():
+        for move in moves:
+            undo = position.make_packed_move(move)
+            accumulator.refresh(position)
+            accumulator.evaluate(position.color)
+            position.unmake_move(undo)
+
+    benchmark(refresh_evaluate_all)
+
+
+def test_nnue_evaluate_batch(benchmark, network):
+    positions = [Position.from_fen(fen) for fen in BENCH_FENS.values()] * 32
+    benchmark(network.evaluate_batch, positions)
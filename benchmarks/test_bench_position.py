@@ -0,0 +1,109 @@
+import pytest
+
+pytest.importorskip("pygame")
+pytest.importorskip("pytest_benchmark")
+
+import position as position_module
+from position import Position
+from moves import new_move_buffer
+
+# Reference perft node counts (https://www.chessprogramming.org/Perft_Results), plus two
+# positions the square-by-square util.get_legal_moves gets wrong: an en passant capture
+# that exposes the king along the rank, and castling through squares a pawn attacks.
+PERFT_CASES = {
+    "startpos": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 3, 8902),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 3, 97862),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 4, 43238),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 3, 9467),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 3, 62379),
+    "en_passant_discovered_check": ("8/8/8/KPp4r/8/8/8/7k w - c6 0 1", 1, 4),
+    "castle_through_pawn_attack_white": ("r3k2r/8/8/8/8/8/4p3/R3K2R w KQkq - 0 1", 1, 22),
+    "castle_through_pawn_attack_black": ("r3k2r/4P3/8/8/8/8/8/R3K2R b KQkq - 0 1", 2, 486),
+}
+
+
+@pytest.fixture(params=list(PERFT_CASES.values()), ids=list(PERFT_CASES))
+def perft_case(request):
+    return request.param
+
+
+def perft(position, depth):
+    """Leaf nodes `depth` plies below `position`, counting the last ply without making its moves."""
+    moves = position.generate_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = position.make_packed_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move(undo)
+    return nodes
+
+
+def test_position_from_fen(benchmark, fen):
+    benchmark(Position.from_fen, fen)
+
+
+def test_position_legal_moves(benchmark, fen):
+    position = Position.from_fen(fen)
+    benchmark(position.legal_moves)
+
+
+def test_position_perft(benchmark, perft_case):
+    fen, depth, nodes = perft_case
+    position = Position.from_fen(fen)
+    assert benchmark(perft, position, depth) == nodes
+    assert position.to_fen() == fen
+
+
+def test_position_make_unmake(benchmark, fen):
+    position = Position.from_fen(fen)
+    moves = position.legal_moves()
+
+    def make_unmake_all():
+        for start, end in moves:
+            position.unmake_move(position.make_move(start, end))
+
+    benchmark(make_unmake_all)
+
+
+def test_position_generate_packed_moves(benchmark, fen):
+    position = Position.from_fen(fen)
+    buffer = new_move_buffer()
+    count = benchmark(position.generate_packed_moves, buffer)
+    assert sorted(buffer[:count]) == sorted(position.generate_moves())
+
+
+def test_position_move_table(benchmark, fen):
+    position = Position.from_fen(fen)
+
+    def build():
+        position_module._move_tables.clear()
+        return position.move_table()
+
+    table = benchmark(build)
+    assert sorted((start, end) for start, ends in table.items() for end in ends) == sorted(position.legal_moves())
+
+
+def test_position_legal_moves_from_cached(benchmark, fen):
+    # Piece pick-up in the GUI: the table was built by the status checks after the last move.
+    position = Position.from_fen(fen)
+    start = next(iter(position.move_table()), (0, 0))
+    benchmark(position.legal_moves_from, start)
+
+
+def test_position_iter_moves_all(benchmark, fen):
+    position = Position.from_fen(fen)
+    moves = benchmark(lambda: list(position.iter_moves()))
+    assert sorted(moves) == sorted(position.generate_moves())
+
+
+def test_position_has_legal_move(benchmark, fen):
+    # A status check after a move, before anything has built the move table.
+    position = Position.from_fen(fen)
+
+    def check():
+        position_module._move_tables.clear()
+        return position.has_legal_move()
+
+    assert benchmark(check) == bool(position.generate_moves())
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("pygame")
+pytest.importorskip("pytest_benchmark")
+
+import chess_ai
+import searchtrace
+from position import Position
+
+
+@pytest.fixture(params=["trace.bin", "trace.jsonl"])
+def trace_path(request, tmp_path):
+    return str(tmp_path / request.param)
+
+
+def test_traced_search(benchmark, fen, trace_path):
+    # Fixed depth, so the traced tree is the same on every round.
+    position = Position.from_fen(fen)
+
+    def search():
+        chess_ai.transposition_table.clear()
+        chess_ai.start_trace(trace_path)
+        try:
+            return chess_ai.search_best_move(position, float("inf"), max_depth=3)
+        finally:
+            chess_ai.stop_trace()
+
+    move, score, depth = benchmark(search)
+    summary = searchtrace.summarize(searchtrace.read_events(trace_path))
+    assert summary["searches"] == 1
+    assert [row["depth"] for row in summary["iterations"]] == list(range(1, depth + 1))
+    if depth:
+        assert summary["depths"][0]["nodes"] == 1  # The root, at the last iteration's depth
+
+
+def test_summarize(benchmark, trace_path):
+    position = Position.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    chess_ai.transposition_table.clear()
+    chess_ai.start_trace(trace_path)
+    chess_ai.search_best_move(position, float("inf"), max_depth=3)
+    chess_ai.stop_trace()
+    summary = benchmark(lambda: searchtrace.summarize(searchtrace.read_events(trace_path)))
+    assert summary["hotspots"]
@@ -0,0 +1,68 @@
+import itertools
+
+import pytest
+
+pytest.importorskip("pygame")
+pytest.importorskip("pytest_benchmark")
+np = pytest.importorskip("numpy")
+
+import selfplay
+
+
+def random_records(count, seed=0):
+    rng = np.random.default_rng(seed)
+    records = np.zeros(count, selfplay.RECORD_DTYPE)
+    records["hash"] = rng.integers(0, 1 << 63, count, dtype=np.uint64)
+    records["score"] = rng.integers(-selfplay.MAX_SCORE, selfplay.MAX_SCORE, count)
+    return records
+
+
+def test_selfplay_game(benchmark):
+    selfplay.init_worker({"move_time": float("inf"), "depth": 1, "min_depth": 1, "sample_rate": 1.0,
+                          "random_plies": 4, "max_plies": 40})
+    records, summary = benchmark(lambda: selfplay.play_game((1, 7)))
+    assert summary["plies"] <= 40
+    assert len(records) <= summary["plies"] - 4
+    assert set(records["result"].tolist()) <= {-1, 0, 1}
+    assert (records["depth"] >= 1).all()
+    for record, position in zip(records, selfplay.positions(records)):
+        assert position.hash == int(record["hash"])
+
+
+def test_shard_writer(benchmark, tmp_path):
+    records = random_records(5000)
+    runs = itertools.count()
+
+    def write():
+        writer = selfplay.ShardWriter(str(tmp_path / str(next(runs))), shard_size=1024)
+        for start in range(0, len(records), 100):
+            writer.add(records[start:start + 100])
+            writer.commit()
+        writer.close()
+        return writer
+
+    writer = benchmark(write)
+    assert writer.records == len(records)
+    assert len(writer.shards) == 5
+
+    # A second run over the same directory continues the last shard and skips what is stored.
+    more = np.concatenate([records[:1000], random_records(500, seed=1)])
+    resumed = selfplay.ShardWriter(writer.directory)
+    assert resumed.add(more) == 500
+    resumed.close()
+    assert resumed.records == 5500
+    assert len(resumed.shards) == 6
+
+
+def test_shard_dataset_epoch(benchmark, tmp_path):
+    records = random_records(20000)
+    writer = selfplay.ShardWriter(str(tmp_path), shard_size=4096)
+    writer.add(records)
+    writer.close()
+    dataset = selfplay.ShardDataset(str(tmp_path))
+    assert len(dataset) == len(records)
+
+    epoch = benchmark(lambda: list(dataset.batches(256, rng=0)))
+    assert sorted(np.concatenate(epoch)["hash"].tolist()) == sorted(records["hash"].tolist())
+    batch = dataset.take([19999, 0, 4096])
+    assert batch["hash"].tolist() == records["hash"][[19999, 0, 4096]].tolist()
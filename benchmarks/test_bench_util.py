@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("pygame")
+pytest.importorskip("pytest_benchmark")
+
+from util import (WHITE, BLACK, EMPTY, parse_fen, generate_fen, encode_position, decode_position, find_king, get_pseudo_legal_moves,
+                  get_legal_moves, is_in_check, is_square_under_attack, moved_positions_from_castling)
+
+
+def setup_position(fen):
+    board, active_color, castling, en_passant_target, halfmove, fullmove = parse_fen(fen)
+    color = WHITE if active_color == 'w' else BLACK
+    squares = [(r, c) for r in range(8) for c in range(8)
+               if board[r][c] != EMPTY and (board[r][c] & 24) == color]
+    return board, color, castling, en_passant_target, squares
+
+
+def test_parse_fen(benchmark, fen):
+    benchmark(parse_fen, fen)
+
+
+def test_generate_fen(benchmark, fen):
+    board, active_color, castling, en_passant_target, halfmove, fullmove = parse_fen(fen)
+    benchmark(generate_fen, board, active_color, castling, en_passant_target, halfmove, fullmove)
+
+
+def test_encode_position(benchmark, fen):
+    benchmark(encode_position, *parse_fen(fen))
+
+
+def test_decode_position(benchmark, fen):
+    benchmark(decode_position, encode_position(*parse_fen(fen)))
+
+
+def test_get_pseudo_legal_moves(benchmark, fen):
+    board, color, castling, en_passant_target, squares = setup_position(fen)
+    moved_positions = moved_positions_from_castling(castling)
+
+    def all_moves():
+        for pos in squares:
+            get_pseudo_legal_moves(board, pos, moved_positions, en_passant_target)
+
+    benchmark(all_moves)
+
+
+def test_get_legal_moves(benchmark, fen):
+    board, color, castling, en_passant_target, squares = setup_position(fen)
+    moved_positions = moved_positions_from_castling(castling)
+
+    def all_moves():
+        for pos in squares:
+            get_legal_moves(board, pos, moved_positions, en_passant_target)
+
+    benchmark(all_moves)
+
+
+def test_is_in_check(benchmark, fen):
+    board, color, castling, en_passant_target, squares = setup_position(fen)
+    moved_positions = moved_positions_from_castling(castling)
+    benchmark(is_in_check, board, color, moved_positions, en_passant_target)
+
+
+def test_is_square_under_attack(benchmark, fen):
+    board, color, castling, en_passant_target, squares = setup_position(fen)
+    moved_positions = moved_positions_from_castling(castling)
+    attacker_color = BLACK if color == WHITE else WHITE
+    benchmark(is_square_under_attack, board, find_king(board, color), attacker_color,
+              moved_positions, en_passant_target)
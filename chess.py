@@ -2,39 +2,104 @@ import pygame
 import os
 import sys
 import random
+import time
+import stats
 from util import *
 from chess_ai import get_ai_move
+from game_clock import ChessClock, TIME_CONTROLS, format_clock
+from position import Position
+from archive import GameArchive, GameRecord
+from analysis import AnalysisWorker
+from history import GameHistory
+from memprofile import MemoryProfiler, format_bytes
 
 # Global bonus variables for promotions.
 bonus_white = 0
 bonus_black = 0
 
+# Screen geometry for the current window size; main() replaces it once a resize has settled.
+layout = Layout()
+
+# With bounded history (for long unattended sessions) the repetition history only keeps the
+# positions since the last capture or pawn move, the move log only its last BOUNDED_LOG_LINES
+# lines, and takeback is off, so a game runs in constant memory. Set CHESS_BOUNDED_HISTORY=1
+# to turn it on in the GUI.
+BOUNDED_HISTORY_ENV = "CHESS_BOUNDED_HISTORY"
+bounded_history = os.environ.get(BOUNDED_HISTORY_ENV, "0") not in ("", "0")
+
+# Set CHESS_MEMPROFILE to a number of seconds to print the top allocation growth sites that
+# often (see memprofile.py), and the peak RSS when the game ends.
+MEMPROFILE_ENV = "CHESS_MEMPROFILE"
+
+# (white, black) player names stored in the game archive for each mode.
+GAME_MODE_PLAYERS = {
+    "pvp": ("Human", "Human"),
+    "white_vs_ai": ("Human", "AI"),
+    "black_vs_ai": ("AI", "Human"),
+    "ai_vs_ai": ("AI", "AI"),
+}
+
+# Keys for moving through the game history: one ply back / forward, first / last position.
+NAVIGATION_KEYS = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1, pygame.K_HOME: None, pygame.K_END: None}
+
 #############################################
 #         HELPER FUNCTIONS                #
 #############################################
 
-def add_check_symbols(move_notation, board, moved_positions, en_passant_target, opponent_color):
+def game_position(board, color, moved_positions, en_passant_target):
+    """
+    Wraps the game state in a Position with `color` to move, so status checks
+    walk that side's piece list instead of scanning the whole board.
+    """
+    active_color = "w" if color == WHITE else "b"
+    return Position(board, active_color, get_castling_rights(board, moved_positions), en_passant_target)
+
+def save_game_record(game_record, move_log, termination=None):
+    """Finishes the record from the move log and stores it in the local game archive."""
+    game_record.finish(move_log, termination)
+    archive = GameArchive()
+    archive.save_game(game_record)
+    archive.close()
+
+def add_check_symbols(move_notation, position):
     """
     Returns the move notation string appended with '+' if the move gives check
-    and with '#' if it gives checkmate.
+    and with '#' if it gives checkmate; `position` is the game position after it.
     """
-    if is_in_check(board, opponent_color, moved_positions, en_passant_target):
-        has_moves = False
-        for r in range(8):
-            for c in range(8):
-                p = board[r][c]
-                if p != EMPTY and (p & 24) == opponent_color:
-                    if get_legal_moves(board, (r, c), moved_positions, en_passant_target):
-                        has_moves = True
-                        break
-            if has_moves:
-                break
-        if has_moves:
+    if position.is_in_check():
+        if position.has_legal_move():
             return move_notation + "+"
         else:
             return move_notation + "#"
     return move_notation
 
+def check_game_end(position, move_log, position_history, irreversible):
+    """
+    Checks the game position after a move for checkmate, stalemate, insufficient
+    material and three-fold repetition, appending the result to the move log.
+    Adds the position's hash to the repetition history first (emptied with bounded
+    history after an `irreversible` capture or pawn move, since no earlier
+    position can come back). Returns True if the game is over.
+    """
+    if not position.has_legal_move():
+        if position.is_in_check():
+            winner = "White" if position.color == BLACK else "Black"
+            move_log.append(f"{winner} won by checkmate")
+            checkmate_sound.play()
+        else:
+            move_log.append("Draw by stalemate")
+        return True
+    if position.is_insufficient_material():
+        move_log.append("Draw by insufficient material")
+        return True
+    if bounded_history and irreversible:
+        position_history.clear()
+    position_history.append(position.hash)
+    if position_history.count(position.hash) >= 3:
+        move_log.append("Draw by three-fold repetition")
+        return True
+    return False
+
 def get_castling_rights(board, moved_positions):
     rights = ""
     # White castling rights.
@@ -84,59 +149,100 @@ def draw_menu(win, font, buttons):
         win.blit(text_surf, text_rect)
 
 def menu_loop(win):
-    """Loops until a menu button is clicked and returns a mode code."""
-    menu_font = pygame.font.Font(None, 36)
-    button_width = 300
-    button_height = 50
-    gap = 20
-    start_y = (WINDOW_HEIGHT - (4 * button_height + 3 * gap)) // 2
-    buttons = []
+    """
+    Loops until a mode button is clicked and returns (mode code, time control).
+    The time control button cycles through TIME_CONTROLS; the returned control
+    is a (label, base seconds, increment seconds) tuple.
+    """
     modes = ["Player vs Player", "White vs AI", "Black vs AI", "AI vs AI"]
-    for i, mode in enumerate(modes):
-        rect = pygame.Rect((WINDOW_WIDTH - button_width) // 2,
-                           start_y + i*(button_height+gap),
-                           button_width, button_height)
-        buttons.append((mode, rect))
+    control_index = 0
     selected_mode = None
+    menu_layout = None
     while selected_mode is None:
+        if menu_layout is None or menu_layout.width != win.get_width() or menu_layout.height != win.get_height():
+            # The menu has no sprites, so it follows the window straight away.
+            menu_layout = Layout(win.get_width(), win.get_height())
+            menu_font = menu_layout.font(36)
+            button_width = menu_layout.scaled(300)
+            button_height = menu_layout.scaled(50)
+            gap = menu_layout.scaled(20)
+            start_y = (menu_layout.height - ((len(modes) + 1) * button_height + len(modes) * gap)) // 2
+            buttons = []
+            for i, mode in enumerate(modes):
+                rect = pygame.Rect((menu_layout.width - button_width) // 2,
+                                   start_y + i*(button_height+gap),
+                                   button_width, button_height)
+                buttons.append((mode, rect))
+            clock_rect = pygame.Rect((menu_layout.width - button_width) // 2,
+                                     start_y + len(modes)*(button_height+gap),
+                                     button_width, button_height)
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             if event.type == pygame.MOUSEBUTTONDOWN:
                 mx, my = pygame.mouse.get_pos()
+                if clock_rect.collidepoint(mx, my):
+                    control_index = (control_index + 1) % len(TIME_CONTROLS)
                 for mode_text, rect in buttons:
                     if rect.collidepoint(mx, my):
                         selected_mode = mode_text
-        draw_menu(win, menu_font, buttons)
+        clock_button = (f"Clock: {TIME_CONTROLS[control_index][0]}", clock_rect)
+        draw_menu(win, menu_font, buttons + [clock_button])
         pygame.display.flip()
+    time_control = TIME_CONTROLS[control_index]
     # Map the selected mode to a simpler code:
     if selected_mode == "Player vs Player":
-        return "pvp"
+        return "pvp", time_control
     elif selected_mode == "White vs AI":
-        return "white_vs_ai"
+        return "white_vs_ai", time_control
     elif selected_mode == "Black vs AI":
-        return "black_vs_ai"
+        return "black_vs_ai", time_control
     elif selected_mode == "AI vs AI":
-        return "ai_vs_ai"
-    
+        return "ai_vs_ai", time_control
+
+def update_clock(game_clock, white_to_move, move_log):
+    """
+    Hands the clock over once the side to move has changed and checks both
+    flags. Appends the result to the move log and returns True if a side has
+    run out of time.
+    """
+    side_to_move = WHITE if white_to_move else BLACK
+    if game_clock.running is not None and game_clock.running != side_to_move:
+        game_clock.press()
+    for color, winner in ((WHITE, "Black"), (BLACK, "White")):
+        if game_clock.flagged(color):
+            game_clock.stop()
+            move_log.append(f"{winner} won on time")
+            return True
+    return False
+
 def ai_move_function(color, board, moved_positions, en_passant_target,
-                     captured_pieces, move_log, position_history, current_move_number, white_to_move):
+                     captured_pieces, move_log, position_history, current_move_number, white_to_move,
+                     game_record=None, game_clock=None, position=None):
     """
-    This function converts the current state into a FEN string,
-    calls get_ai_move(fen) from your separate AI module to decide on a move,
-    then applies that move (handling en passant, castling, random promotion, etc.),
-    plays appropriate sound effects (for move, capture, check, or checkmate),
-    updates captured pieces, move log, and FEN history (for three‑fold repetition),
+    This function calls get_ai_move from your separate AI module to decide on
+    a move for the game position (budgeting its time from game_clock, a
+    game_clock.ChessClock, if given), then plays it on that position (which
+    handles en passant, castling and the random promotion piece on the board
+    it shares), plays appropriate sound effects (for move, capture, check, or
+    checkmate), updates captured pieces, move log, and repetition history,
+    adds the move to game_record (an archive.GameRecord) if one is given,
     and returns the updated game state.
+
+    `position` is the Position kept for the whole game over `board`; one is
+    built from the game state if it is not given.
     """
-    # 1. Convert the current state to a FEN string.
-    active_color = "w" if white_to_move else "b"
-    castling_rights = get_castling_rights(board, moved_positions)
-    current_fen = generate_fen(board, active_color, castling_rights, en_passant_target, halfmove=0, fullmove=1)
-    
-    # 2. Get the AI move from the external module.
-    best_move = get_ai_move(current_fen)
+    if position is None:
+        position = game_position(board, color, moved_positions, en_passant_target)
+
+    # 1. Get the AI move from the external module, handing it the position in packed form and the
+    #    hashes of the positions so far, so it can see repetitions coming.
+    if game_clock is not None:
+        best_move = get_ai_move(position.to_bytes(), remaining=game_clock.time_left(color),
+                                increment=game_clock.increment, history=position_history)
+    else:
+        best_move = get_ai_move(position.to_bytes(), history=position_history)
     if best_move is None:
         # No legal moves available.
         return board, moved_positions, en_passant_target, captured_pieces, move_log, position_history, current_move_number, True
@@ -144,75 +250,51 @@ def ai_move_function(color, board, moved_positions, en_passant_target,
     # Unpack the move.
     start, end = best_move
     piece = board[start[0]][start[1]]
-    capture = board[end[0]][end[1]] != EMPTY
+
+    # 2. The captured piece, which is beside the destination for en passant.
     captured_piece_code = None
-    start_row, start_col = start
-    end_row, end_col = end
-    
-    # 3. En passant check.
-    if (piece & 7) == PAWN and (end_row, end_col) == en_passant_target:
-        direction = -1 if (piece & 24) == WHITE else 1
-        captured_pawn_row = end_row - direction
-        captured_piece_code = board[captured_pawn_row][end_col]
-        board[captured_pawn_row][end_col] = EMPTY
-        capture = True
-    else:
-        if capture:
-            captured_piece_code = board[end_row][end_col]
-            
-    # 4. Apply the move.
-    board[start_row][start_col] = EMPTY
-    board[end_row][end_col] = piece
-
-    # 5. Castling check.
-    if (piece & 7) == KING and abs(end_col - start_col) == 2:
-        rook_from, rook_to = CASTLING_ROOK_MOVES[(start_row, start_col)][(end_row, end_col)]
-        board[rook_to[0]][rook_to[1]] = board[rook_from[0]][rook_from[1]]
-        board[rook_from[0]][rook_from[1]] = EMPTY
-        moved_positions.add(rook_from)
-
-    # 6. Update en passant target.
-    if (piece & 7) == PAWN and abs(start_row - end_row) == 2:
-        direction = -1 if (piece & 24) == WHITE else 1
-        en_passant_target = (start_row + direction, start_col)
-    else:
-        en_passant_target = None
-
-    # 7. Promotion check: choose a random promotion piece.
-    if (piece & 7) == PAWN:
-        color_piece = piece & 24
-        if (color_piece == WHITE and end_row == 0) or (color_piece == BLACK and end_row == 7):
-            promoted_piece_type = random.choice(PROMOTION_PIECES)
-            new_piece = color_piece | promoted_piece_type
-            board[end_row][end_col] = new_piece
-            if color_piece == WHITE:
-                captured_pieces['black'].append(WHITE | PAWN)
-                global bonus_white, bonus_black
-                bonus_white += PIECE_VALUES[new_piece & 7]
-            else:
-                captured_pieces['white'].append(BLACK | PAWN)
-                bonus_black += PIECE_VALUES[new_piece & 7]
+    if (piece & 7) == PAWN and end == en_passant_target:
+        captured_piece_code = board[start[0]][end[1]]
+    elif board[end[0]][end[1]] != EMPTY:
+        captured_piece_code = board[end[0]][end[1]]
+    capture = captured_piece_code is not None
+
+    # 3. Promotion check: choose a random promotion piece.
+    promoted_piece_type = None
+    if (piece & 7) == PAWN and end[0] in (0, 7):
+        promoted_piece_type = random.choice(PROMOTION_PIECES)
+        if color == WHITE:
+            captured_pieces['black'].append(WHITE | PAWN)
+            global bonus_white, bonus_black
+            bonus_white += PIECE_VALUES[promoted_piece_type]
+        else:
+            captured_pieces['white'].append(BLACK | PAWN)
+            bonus_black += PIECE_VALUES[promoted_piece_type]
+
+    # 4. Apply the move; the position moves the castling rook and removes a pawn taken en passant.
+    position.make_move(start, end, promoted_piece_type)
+    moved_positions.add(start)
+    if (piece & 7) == KING and abs(end[1] - start[1]) == 2:
+        moved_positions.add(CASTLING_ROOK_MOVES[start][end][0])
+    en_passant_target = position.en_passant_target
 
-    # 8. Record captured piece if a capture occurred.
-    if capture and captured_piece_code is not None:
+    # 5. Record captured piece if a capture occurred.
+    if capture:
         if color == WHITE:
             captured_pieces['white'].append(captured_piece_code)
         else:
             captured_pieces['black'].append(captured_piece_code)
 
-    moved_positions.add((start_row, start_col))
-    
-    # 9. Play sound effects.
+    # 6. Play sound effects.
     if capture:
         capture_sound.play()
     else:
         move_sound.play()
-    
-    # 10. Create move notation (including check or checkmate symbols).
+
+    # 7. Create move notation (including check or checkmate symbols).
     move_notation = print_move_notation(piece, start, end, capture)
-    opponent_color = BLACK if color == WHITE else WHITE
-    move_notation = add_check_symbols(move_notation, board, moved_positions, en_passant_target, opponent_color)
-    
+    move_notation = add_check_symbols(move_notation, position)
+
     if color == WHITE:
         move_log.append(f"{current_move_number}. {move_notation}")
     else:
@@ -221,47 +303,15 @@ def ai_move_function(color, board, moved_positions, en_passant_target,
         else:
             move_log.append(f"{current_move_number}. ... {move_notation}")
         current_move_number += 1
-    
-    # 11. Check for game termination conditions.
-    # First, check for insufficient material.
-    if is_insufficient_material():
-        move_log.append("Draw by insufficient material")
-        game_over = True
-    else:
-        has_legal_moves = False
-        for r in range(8):
-            for c in range(8):
-                p = board[r][c]
-                if p != EMPTY and (p & 24) == opponent_color:
-                    if get_legal_moves(board, (r, c), moved_positions, en_passant_target):
-                        has_legal_moves = True
-                        break
-            if has_legal_moves:
-                break
-
-        if not has_legal_moves:
-            in_check = is_in_check(board, opponent_color, moved_positions, en_passant_target)
-            if in_check:
-                winner = "White" if opponent_color == BLACK else "Black"
-                move_log.append(f"{winner} won by checkmate")
-                checkmate_sound.play()
-            else:
-                move_log.append("Draw by stalemate")
-            game_over = True
-        else:
-            # If the move gives check (but not mate), play the check sound.
-            if is_in_check(board, opponent_color, moved_positions, en_passant_target):
-                check_sound.play()
-            active_color = "w" if white_to_move else "b"
-            castling_rights = get_castling_rights(board, moved_positions)
-            current_fen = generate_fen(board, active_color, castling_rights, en_passant_target, halfmove=0, fullmove=1)
-            fen_part = ' '.join(current_fen.split()[:4])
-            position_history.append(fen_part)
-            if position_history.count(fen_part) >= 3:
-                move_log.append("Draw by three-fold repetition")
-                game_over = True
-            else:
-                game_over = False  # Explicitly set game_over to False if no termination condition was met.
+
+    # 8. Check for game termination conditions.
+    if game_record is not None:
+        game_record.add_move(start, end, promoted_piece_type, move_notation, position.hash)
+    game_over = check_game_end(position, move_log, position_history, capture or (piece & 7) == PAWN)
+    if not game_over and position.is_in_check():
+        check_sound.play()
+    if bounded_history:
+        del move_log[:-BOUNDED_LOG_LINES]
 
     return board, moved_positions, en_passant_target, captured_pieces, move_log, position_history, current_move_number, game_over
 
@@ -271,9 +321,10 @@ def ai_move_function(color, board, moved_positions, en_passant_target,
 #############################################
 
 def draw_board(win, legal_moves=None, selected_pos=None, in_check_pos=None):
-    font = pygame.font.Font(None, FONT_SIZE)
-    board_x = MARGIN_WIDTH
-    board_y = MARGIN_HEIGHT
+    font = layout.font(FONT_SIZE)
+    board_x = layout.board_x
+    board_y = layout.board_y
+    square_size = layout.square_size
 
     for row in range(8):
         for col in range(8):
@@ -285,61 +336,66 @@ def draw_board(win, legal_moves=None, selected_pos=None, in_check_pos=None):
             else:
                 color = base_color
 
-            pygame.draw.rect(win, color, (board_x + col * SQUARE_SIZE,
-                                          board_y + row * SQUARE_SIZE,
-                                          SQUARE_SIZE, SQUARE_SIZE))
+            pygame.draw.rect(win, color, (board_x + col * square_size,
+                                          board_y + row * square_size,
+                                          square_size, square_size))
 
             # Draw check indicator.
             if in_check_pos and (row, col) == in_check_pos:
                 pygame.draw.rect(win, CHECK_COLOR,
-                                (board_x + col * SQUARE_SIZE,
-                                 board_y + row * SQUARE_SIZE,
-                                 SQUARE_SIZE, SQUARE_SIZE), 3)
+                                (board_x + col * square_size,
+                                 board_y + row * square_size,
+                                 square_size, square_size), 3)
 
     # Draw row and column labels.
     for i in range(8):
         label = font.render(str(8 - i), True, TEXT_COLOR)
-        win.blit(label, (board_x - 30, board_y + i * SQUARE_SIZE + SQUARE_SIZE // 2))
+        win.blit(label, (board_x - layout.scaled(30), board_y + i * square_size + square_size // 2))
         label = font.render(chr(65 + i), True, TEXT_COLOR)
-        win.blit(label, (board_x + i * SQUARE_SIZE + SQUARE_SIZE // 2.5,
-                        board_y + BOARD_SIZE + 10))
+        win.blit(label, (board_x + i * square_size + square_size // 2.5,
+                        board_y + layout.board_size + layout.scaled(10)))
 
 def draw_pieces(win, pieces, selected_pos=None):
-    board_x = MARGIN_WIDTH
-    board_y = MARGIN_HEIGHT
+    board_x = layout.board_x
+    board_y = layout.board_y
+    square_size = layout.square_size
 
     for row in range(8):
         for col in range(8):
             piece = board[row][col]
             if piece != EMPTY and (row, col) != selected_pos:
-                win.blit(pieces[piece], (board_x + col * SQUARE_SIZE,
-                                          board_y + row * SQUARE_SIZE))
+                win.blit(pieces[piece], (board_x + col * square_size,
+                                          board_y + row * square_size))
 
-def draw_promotion_menu(win, pieces, pos, color):
+def promotion_menu_origin(pos):
+    """Top left of the promotion menu for a pawn promoting on `pos`: below the square on the top ranks, else above."""
     row, col = pos
-    menu_x = MARGIN_WIDTH + col * SQUARE_SIZE
-    menu_y = MARGIN_HEIGHT + row * SQUARE_SIZE
-
+    menu_x, menu_y = layout.square_origin(row, col)
     if row <= 1:
-        menu_y += SQUARE_SIZE
+        menu_y += layout.square_size
     else:
-        menu_y -= SQUARE_SIZE * 4
+        menu_y -= layout.square_size * 4
+    return menu_x, menu_y
+
+def draw_promotion_menu(win, pieces, pos, color):
+    menu_x, menu_y = promotion_menu_origin(pos)
+    square_size = layout.square_size
 
     pygame.draw.rect(win, (200, 200, 200),
-                     (menu_x, menu_y, SQUARE_SIZE, SQUARE_SIZE * 4))
+                     (menu_x, menu_y, square_size, square_size * 4))
 
     for i, piece_type in enumerate(PROMOTION_PIECES):
         piece_code = color | piece_type
-        win.blit(pieces[piece_code], (menu_x, menu_y + i * SQUARE_SIZE))
+        win.blit(pieces[piece_code], (menu_x, menu_y + i * square_size))
 
 def draw_captured_and_points(win, captured_pieces, small_pieces):
-    gap = 5
-    icon_size = CAPTURED_PIECE_SIZE
-    font = pygame.font.Font(None, 30)
+    gap = layout.scaled(5)
+    icon_size = layout.small_size
+    font = layout.font(CAPTURED_FONT_SIZE)
 
     # Draw captured white pieces (taken by Black).
-    top_x = 10
-    top_y = 10
+    top_x = layout.scaled(10)
+    top_y = layout.scaled(10)
     x = top_x
     row_num = 0
     for i, code in enumerate(captured_pieces['black']):
@@ -350,8 +406,8 @@ def draw_captured_and_points(win, captured_pieces, small_pieces):
         x += icon_size + gap
 
     # Draw captured black pieces (taken by White).
-    bottom_x = 10
-    bottom_y = WINDOW_HEIGHT - (icon_size * 2) - 20
+    bottom_x = layout.scaled(10)
+    bottom_y = layout.height - (icon_size * 2) - layout.scaled(20)
     x = bottom_x
     row_num = 0
     for i, code in enumerate(captured_pieces['white']):
@@ -368,75 +424,131 @@ def draw_captured_and_points(win, captured_pieces, small_pieces):
     if white_points > black_points:
         diff = white_points - black_points
         diff_text = font.render(f"+{diff}", True, TEXT_COLOR)
-        win.blit(diff_text, (bottom_x + 200, bottom_y + icon_size))
+        win.blit(diff_text, (bottom_x + layout.scaled(200), bottom_y + icon_size))
     elif black_points > white_points:
         diff = black_points - white_points
         diff_text = font.render(f"+{diff}", True, TEXT_COLOR)
-        win.blit(diff_text, (top_x + 200, top_y + icon_size))
-
-def is_insufficient_material():
-    white_pieces = []
-    black_pieces = []
-    pawn_rook_queen = {PAWN, ROOK, QUEEN}
-    for row in board:
-        for piece in row:
-            if piece == EMPTY:
-                continue
-            piece_type = piece & 7
-            color = piece & 24
-            if piece_type in pawn_rook_queen:
-                return False
-            if color == WHITE:
-                white_pieces.append(piece_type)
-            else:
-                black_pieces.append(piece_type)
-
-    if len(white_pieces) == 1 and len(black_pieces) == 1:
-        return True
-
-    if (len(white_pieces) == 2 and white_pieces.count(KNIGHT) == 1 and len(black_pieces) == 1) or \
-       (len(black_pieces) == 2 and black_pieces.count(KNIGHT) == 1 and len(white_pieces) == 1):
-        return True
+        win.blit(diff_text, (top_x + layout.scaled(200), top_y + icon_size))
 
-    if (len(white_pieces) == 2 and white_pieces.count(BISHOP) == 1 and len(black_pieces) == 1) or \
-       (len(black_pieces) == 2 and black_pieces.count(BISHOP) == 1 and len(white_pieces) == 1):
-        return True
+def draw_hud(win, font, fps, top=None):
+    """
+    Draws the performance overlay: smoothed per-frame render times and the
+    search / move generator counters collected by the stats module.
+    It is centred vertically unless `top` is given.
+    """
+    data = stats.snapshot()
+    frame_ms = data["frame_ms"]
+    lines = [
+        f"FPS: {fps:.1f}",
+        f"Frame: {frame_ms.get('frame', 0.0):.2f} ms",
+        f"  draw_board: {frame_ms.get('draw_board', 0.0):.2f} ms",
+        f"  draw_pieces: {frame_ms.get('draw_pieces', 0.0):.2f} ms",
+        f"  move log: {frame_ms.get('move_log', 0.0):.2f} ms",
+        f"Nodes: {data['nodes']}",
+        f"NPS: {data['nps']:.0f}",
+        f"TT hit rate: {data['tt_hit_rate'] * 100:.1f}%",
+        f"Eval / pawn hits: {data['eval_hit_rate'] * 100:.0f}% / {data['pawn_hit_rate'] * 100:.0f}%",
+        f"Cutoffs: {data['cutoffs']}",
+        f"Legal move calls: {data['legal_move_calls']}",
+        f"Move table hits: {data['move_table_hits']}",
+        f"Attack checks: {data['attack_checks']}",
+    ]
+    line_height = font.get_linesize()
+    overlay = pygame.Surface((layout.hud_width, len(lines) * line_height + 10), pygame.SRCALPHA)
+    overlay.fill(HUD_BACKGROUND)
+    for i, line in enumerate(lines):
+        overlay.blit(font.render(line, True, TEXT_COLOR), (5, 5 + i * line_height))
+    if top is None:
+        top = (layout.height - overlay.get_height()) // 2
+    win.blit(overlay, (layout.scaled(10), top))
+
+def draw_clocks(win, font, game_clock):
+    """Draws Black's clock above the move log and White's below it; the running clock is highlighted."""
+    positions = {BLACK: (layout.log_x, layout.board_y - layout.scaled(40)),
+                 WHITE: (layout.log_x, layout.board_y + layout.board_size + layout.scaled(10))}
+    for color, (x, y) in positions.items():
+        running = game_clock.running == color
+        text = font.render(format_clock(game_clock.time_left(color)), True, (0, 0, 0) if running else TEXT_COLOR)
+        rect = pygame.Rect(x, y, layout.scaled(120), text.get_height() + 4)
+        pygame.draw.rect(win, (200, 200, 200) if running else (50, 50, 50), rect)
+        win.blit(text, text.get_rect(center=rect.center))
+
+def wrap_text(font, text, width):
+    """Splits text at spaces into lines no wider than `width` pixels."""
+    lines = []
+    for word in text.split():
+        if lines and font.size(lines[-1] + " " + word)[0] <= width:
+            lines[-1] += " " + word
+        else:
+            lines.append(word)
+    return lines
 
-    bishop_positions = []
-    for r in range(8):
-        for c in range(8):
-            piece = board[r][c]
-            if piece != EMPTY and (piece & 7) == BISHOP:
-                bishop_positions.append((r, c))
-
-    if len(bishop_positions) > 1:
-        first_color = (bishop_positions[0][0] + bishop_positions[0][1]) % 2
-        all_same = all((r + c) % 2 == first_color for (r, c) in bishop_positions)
-        if all_same:
-            white_non_bishops = [p for p in white_pieces if p not in (KING, BISHOP)]
-            black_non_bishops = [p for p in black_pieces if p not in (KING, BISHOP)]
-            if not white_non_bishops and not black_non_bishops:
-                return True
-    return False
+def render_analysis_panel(font, result):
+    """
+    Renders the analysis lines into a surface once; the main loop blits the
+    same surface every frame until the worker publishes a new depth.
+    """
+    if result is None:
+        rows = ["Analysis: thinking..."]
+    else:
+        fen, depth, lines = result
+        rows = [f"Analysis: depth {depth}"]
+        if not lines:
+            rows.append("No legal moves")
+        for score, notation in lines:
+            rows.extend(wrap_text(font, f"{score}  {notation}", layout.analysis_width - 10))
+    line_height = font.get_linesize()
+    surface = pygame.Surface((layout.analysis_width, len(rows) * line_height + 10), pygame.SRCALPHA)
+    surface.fill(HUD_BACKGROUND)
+    for i, row in enumerate(rows):
+        surface.blit(font.render(row, True, TEXT_COLOR), (5, 5 + i * line_height))
+    return surface
+
+def navigation_target(history, target, step, game_mode):
+    """
+    Clamps a takeback / redo target to the recorded plies. Against the AI,
+    a step back or forward skips positions where the AI is to move, so the
+    human lands on their own turn.
+    """
+    target = max(0, min(target, history.last_ply))
+    if step and game_mode in ("white_vs_ai", "black_vs_ai"):
+        human = WHITE if game_mode == "white_vs_ai" else BLACK
+        while 0 < target < history.last_ply and history.side_to_move(target) != human:
+            target += step
+    return target
 
 #############################################
 #                 MAIN GAME               #
 #############################################
 
 def main():
-    global bonus_white, bonus_black, board
+    global bonus_white, bonus_black, board, layout
 
     pygame.init()
-    win = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    win = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.RESIZABLE)
     pygame.display.set_caption("Chessboard")
 
-    pieces, small_pieces = load_pieces()
+    # Decode sounds in the background while the menu is up.
+    preload_sounds()
     # Initialize board from starting FEN.
     load_board_from_fen(starting_fen)
 
     # Show menu and get game mode.
-    game_mode = menu_loop(win)
+    game_mode, (control_label, base_time, increment) = menu_loop(win)
     # game_mode is one of: "pvp", "white_vs_ai", "black_vs_ai", "ai_vs_ai"
+    game_clock = ChessClock(base_time, increment) if base_time is not None else None
+    # Everything is drawn from the layout for the window size. While the window is being
+    # resized the old layout stays in use; once no resize event has come for RESIZE_SETTLE
+    # seconds the layout is rebuilt and the sprites are scaled (or reused) once for it.
+    layout = Layout(win.get_width(), win.get_height())
+    sprite_cache = SpriteCache()
+    pieces, small_pieces = sprite_cache.get(layout.square_size, layout.small_size)
+    resized_at = None
+
+    # The game is saved to the local archive when it ends or the window is closed.
+    game_record = GameRecord(starting_fen, game_mode, *GAME_MODE_PLAYERS[game_mode])
+    game_saved = False
+    pending_promotion_move = None
 
     dragging = False
     selected_piece = None
@@ -450,14 +562,10 @@ def main():
     promotion_pos = None
     promotion_color = WHITE
 
-    font = pygame.font.Font(None, 36)
+    font = layout.font(MOVE_LOG_FONT_SIZE)
     move_log = []
     scroll_offset = 0
     is_scrolling = False
-    SCROLLBAR_WIDTH = 10
-    MOVE_LOG_WIDTH = 200
-    MOVE_LOG_HEIGHT = BOARD_SIZE
-    LINE_HEIGHT = 30
 
     current_move_number = 1
     white_to_move = True
@@ -469,15 +577,108 @@ def main():
     position_history = []
     clock = pygame.time.Clock()
 
+    # Performance overlay, toggled with F3. Stats are only collected while it is shown.
+    show_hud = False
+    hud_font = layout.font(HUD_FONT_SIZE)
+
+    # Engine analysis of the current position, toggled with F4. The search runs on a
+    # background thread; the panel is re-rendered at most every ANALYSIS_REFRESH seconds.
+    analysis_worker = None
+    show_analysis = False
+    analysis_surface = None
+    analysis_version = -1
+    analysis_checked_at = 0.0
+
+    # Takeback / redo with the arrow keys, Home and End; clicking or dragging over the
+    # move log jumps to that move. Timed games can only be browsed once they are over.
+    history = GameHistory(board, moved_positions, en_passant_target, current_move_number, white_to_move,
+                          recording=not bounded_history)
+
+    # The game position, over the same board: every move is played on it, so its piece
+    # lists, hash and cached move tables stay current for move input and status checks.
+    position = game_position(board, WHITE, moved_positions, en_passant_target)
+    is_scrubbing = False
+
+    memory_profiler = None
+    if os.environ.get(MEMPROFILE_ENV):
+        memory_profiler = MemoryProfiler(float(os.environ[MEMPROFILE_ENV]))
+        memory_profiler.start()
+
+    if game_clock:
+        game_clock.start(WHITE)
+
     # Main game loop:
     while True:
         clock.tick(30)  # Limit FPS to 30.
         mx, my = pygame.mouse.get_pos()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                if analysis_worker:
+                    analysis_worker.stop()
+                if not game_saved and len(game_record.moves):
+                    save_game_record(game_record, move_log, "abandoned")
+                if memory_profiler:
+                    memory_profiler.report()
+                    print(f"Peak RSS this game: {format_bytes(memory_profiler.game_peak)}")
                 pygame.quit()
                 sys.exit()
 
+            if event.type == pygame.VIDEORESIZE:
+                resized_at = time.perf_counter()
+                continue
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                show_hud = not show_hud
+                if show_hud:
+                    stats.reset()
+                    stats.enable()
+                else:
+                    stats.disable()
+                continue
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                show_analysis = not show_analysis
+                if show_analysis:
+                    if analysis_worker is None:
+                        analysis_worker = AnalysisWorker(ANALYSIS_LINES, ANALYSIS_PV_LENGTH)
+                    analysis_version = -1
+                else:
+                    analysis_worker.set_position(None)
+                continue
+
+            # --- Takeback, redo and scrubbing through the move log ---
+            can_navigate = not promotion_pending and (game_clock is None or game_over)
+            target = None
+            if can_navigate and event.type == pygame.KEYDOWN and event.key in NAVIGATION_KEYS:
+                step = NAVIGATION_KEYS[event.key]
+                if event.key == pygame.K_HOME:
+                    target = 0
+                elif event.key == pygame.K_END:
+                    target = history.last_ply
+                else:
+                    target = navigation_target(history, history.ply + step, step, game_mode)
+            log_x = layout.log_x
+            in_log = log_x <= mx < log_x + layout.log_width - layout.scrollbar_width and \
+                layout.board_y <= my < layout.board_y + layout.board_size
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and in_log:
+                is_scrubbing = can_navigate
+            elif event.type == pygame.MOUSEBUTTONUP:
+                is_scrubbing = False
+            if is_scrubbing and event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEMOTION) and in_log:
+                # Each move log line holds one White and one Black move.
+                line = int((my - layout.board_y + scroll_offset) // layout.line_height)
+                target = navigation_target(history, 2 * (line + 1), 0, game_mode)
+            if target is not None:
+                if target != history.ply:
+                    moved_positions, en_passant_target, captured_pieces, move_log, position_history, \
+                        current_move_number, white_to_move, bonus_white, bonus_black = history.goto(target, board)
+                    position = game_position(board, WHITE if white_to_move else BLACK, moved_positions,
+                                             en_passant_target)
+                    dragging = False
+                    selected_pos = None
+                    legal_moves = []
+                continue
+
             # If game is over, ignore further move input.
             if game_over:
                 continue
@@ -485,23 +686,19 @@ def main():
             # --- Promotion handling (for human moves) ---
             if promotion_pending:
                 if event.type == pygame.MOUSEBUTTONDOWN:
-                    p_row, p_col = promotion_pos
-                    menu_x = MARGIN_WIDTH + p_col * SQUARE_SIZE
-                    menu_y = MARGIN_HEIGHT + p_row * SQUARE_SIZE
-                    if p_row <= 1:
-                        menu_y += SQUARE_SIZE
-                    else:
-                        menu_y -= SQUARE_SIZE * 4
-                    if (menu_x <= mx < menu_x + SQUARE_SIZE and
-                        menu_y <= my < menu_y + SQUARE_SIZE * 4):
-                        index = (my - menu_y) // SQUARE_SIZE
+                    menu_x, menu_y = promotion_menu_origin(promotion_pos)
+                    if (menu_x <= mx < menu_x + layout.square_size and
+                        menu_y <= my < menu_y + layout.square_size * 4):
+                        index = (my - menu_y) // layout.square_size
                         if 0 <= index < 4:
                             new_piece = promotion_color | PROMOTION_PIECES[index]
                             if promotion_color == WHITE:
                                 captured_pieces['black'].append(WHITE | PAWN)
                             else:
                                 captured_pieces['white'].append(BLACK | PAWN)
-                            board[promotion_pos[0]][promotion_pos[1]] = new_piece
+                            # The move was played with a queen; play it again with the piece picked.
+                            position.unmake_move(promotion_undo)
+                            position.make_move(*pending_promotion_move, PROMOTION_PIECES[index])
                             if promotion_color == WHITE:
                                 bonus_white += PIECE_VALUES[new_piece & 7]
                             else:
@@ -509,27 +706,19 @@ def main():
                             if move_log:
                                 last_move = move_log[-1]
                                 if '=' not in last_move:
-                                    move_log[-1] += f"={PROMOTION_CODES[PROMOTION_PIECES[index]]}"
+                                    move_log[-1] = add_check_symbols(
+                                        last_move + f"={PROMOTION_CODES[PROMOTION_PIECES[index]]}", position)
                             promotion_pending = False
+                            game_record.add_move(*pending_promotion_move, PROMOTION_PIECES[index],
+                                                 move_log[-1].split()[-1], position.hash)
                             move_sound.play()
-                            active_color = "w" if white_to_move else "b"
-                            castling_rights = get_castling_rights(board, moved_positions)
-                            current_fen = generate_fen(board, active_color, castling_rights, en_passant_target)
-                            fen_part = ' '.join(current_fen.split()[:4])
-                            position_history.append(fen_part)
-                            if position_history.count(fen_part) >= 3:
-                                move_log.append("Draw by three-fold repetition")
-                                game_over = True
-
-                            if is_insufficient_material():
-                                move_log.append("Draw by insufficient material")
-                                game_over = True
+                            # A promotion is a pawn move.
+                            game_over = check_game_end(position, move_log, position_history, True)
                 continue
 
             # --- Human move handling (only if it is this side’s turn) ---
             if event.type == pygame.MOUSEBUTTONDOWN:
-                col = (mx - MARGIN_WIDTH) // SQUARE_SIZE
-                row = (my - MARGIN_HEIGHT) // SQUARE_SIZE
+                row, col = layout.square_at(mx, my)
                 if 0 <= row < 8 and 0 <= col < 8:
                     piece = board[row][col]
                     if piece != EMPTY:
@@ -553,36 +742,35 @@ def main():
 
                         # If we passed the conditions, process the input:
                         selected_pos = (row, col)
-                        legal_moves = get_legal_moves(board, selected_pos, moved_positions, en_passant_target)
+                        # The game position is current and its move table cached, so this is a lookup.
+                        legal_moves = position.legal_moves_from(selected_pos)
                         selected_piece = board[row][col]
                         dragged_piece_image = pieces[selected_piece]
-                        mouse_offset = (mx - (MARGIN_WIDTH + col * SQUARE_SIZE),
-                                        my - (MARGIN_HEIGHT + row * SQUARE_SIZE))
+                        square_x, square_y = layout.square_origin(row, col)
+                        mouse_offset = (mx - square_x, my - square_y)
                         dragging = True
 
 
             elif event.type == pygame.MOUSEBUTTONUP:
                 if dragging and selected_pos:
-                    end_col = (mx - MARGIN_WIDTH) // SQUARE_SIZE
-                    end_row = (my - MARGIN_HEIGHT) // SQUARE_SIZE
+                    end_row, end_col = layout.square_at(mx, my)
                     if 0 <= end_row < 8 and 0 <= end_col < 8:
                         if (end_row, end_col) in legal_moves:
+                            if not history.at_end():
+                                # A move from an earlier position replaces the moves after it.
+                                history.truncate()
+                                game_record.truncate(history.ply)
                             start_row, start_col = selected_pos
-                            capture = board[end_row][end_col] != EMPTY
-                            is_en_passant = False
+                            end = (end_row, end_col)
                             captured_piece_code = None
-                            if (selected_piece & 7) == PAWN and (end_row, end_col) == en_passant_target:
-                                direction = -1 if (selected_piece & 24) == WHITE else 1
-                                captured_pawn_row = end_row - direction
-                                captured_piece_code = board[captured_pawn_row][end_col]
-                                board[captured_pawn_row][end_col] = EMPTY
-                                is_en_passant = True
-                                capture = True
-                            else:
-                                if capture:
-                                    captured_piece_code = board[end_row][end_col]
-                            board[start_row][start_col] = EMPTY
-                            board[end_row][end_col] = selected_piece
+                            if (selected_piece & 7) == PAWN and end == en_passant_target:
+                                captured_piece_code = board[start_row][end_col]
+                            elif board[end_row][end_col] != EMPTY:
+                                captured_piece_code = board[end_row][end_col]
+                            capture = captured_piece_code is not None
+                            # The position plays the move on the board, moving the castling rook and removing a
+                            # pawn taken en passant; a promotion is played with a queen until a piece is picked.
+                            promotion_undo = position.make_move(selected_pos, end)
                             if capture:
                                 capture_sound.play()
                                 if white_to_move:
@@ -591,28 +779,20 @@ def main():
                                     captured_pieces['black'].append(captured_piece_code)
                             else:
                                 move_sound.play()
-                            move_notation = print_move_notation(selected_piece, selected_pos, (end_row, end_col), capture)
+                            move_notation = print_move_notation(selected_piece, selected_pos, end, capture)
                             original_white_to_move = white_to_move
                             white_to_move = not white_to_move
-                            opponent_color = WHITE if white_to_move else BLACK
-                            move_notation = add_check_symbols(move_notation, board, moved_positions, en_passant_target, opponent_color)
                             if (selected_piece & 7) == KING and abs(end_col - start_col) == 2:
-                                rook_from, rook_to = CASTLING_ROOK_MOVES[(start_row, start_col)][(end_row, end_col)]
-                                board[rook_to[0]][rook_to[1]] = board[rook_from[0]][rook_from[1]]
-                                board[rook_from[0]][rook_from[1]] = EMPTY
-                                moved_positions.add(rook_from)
-                            if (selected_piece & 7) == PAWN and abs(start_row - end_row) == 2:
-                                direction = -1 if (selected_piece & 24) == WHITE else 1
-                                en_passant_target = (start_row + direction, start_col)
+                                moved_positions.add(CASTLING_ROOK_MOVES[selected_pos][end][0])
+                            en_passant_target = position.en_passant_target
+                            if (selected_piece & 7) == PAWN and end_row in (0, 7):
+                                promotion_pending = True
+                                promotion_pos = end
+                                promotion_color = selected_piece & 24
                             else:
-                                en_passant_target = None
-                            if (selected_piece & 7) == PAWN:
-                                color_piece = selected_piece & 24
-                                if (color_piece == WHITE and end_row == 0) or (color_piece == BLACK and end_row == 7):
-                                    promotion_pending = True
-                                    promotion_pos = (end_row, end_col)
-                                    promotion_color = color_piece
-                            moved_positions.add((start_row, start_col))
+                                # A promotion gets its check symbol once the piece is known.
+                                move_notation = add_check_symbols(move_notation, position)
+                            moved_positions.add(selected_pos)
                             if original_white_to_move:
                                 move_log.append(f"{current_move_number}. {move_notation}")
                             else:
@@ -623,39 +803,15 @@ def main():
                                     move_log.append(f"{current_move_number}. ... {move_notation}")
                                     current_move_number += 1
 
-                            has_legal_moves = False
-                            current_color = WHITE if white_to_move else BLACK
-                            for r in range(8):
-                                for c in range(8):
-                                    p = board[r][c]
-                                    if p != EMPTY and (p & 24) == current_color:
-                                        if get_legal_moves(board, (r, c), moved_positions, en_passant_target):
-                                            has_legal_moves = True
-                                            break
-                                if has_legal_moves:
-                                    break
-                            if not has_legal_moves:
-                                in_check = is_in_check(board, current_color, moved_positions, en_passant_target)
-                                if in_check:
-                                    winner = "White" if current_color == BLACK else "Black"
-                                    move_log.append(f"{winner} won by checkmate")
-                                    game_over = True
-                                    checkmate_sound.play()
-                                else:
-                                    move_log.append("Draw by stalemate")
-                                    game_over = True
-                            elif is_insufficient_material():
-                                move_log.append("Draw by insufficient material")
-                                game_over = True
+                            if promotion_pending:
+                                # Recorded, and the game checked for its end, once the promotion piece has been picked.
+                                pending_promotion_move = (selected_pos, end)
                             else:
-                                active_color = "w" if white_to_move else "b"
-                                castling_rights = get_castling_rights(board, moved_positions)
-                                current_fen = generate_fen(board, active_color, castling_rights, en_passant_target)
-                                fen_part = ' '.join(current_fen.split()[:4])
-                                position_history.append(fen_part)
-                                if position_history.count(fen_part) >= 3:
-                                    move_log.append("Draw by three-fold repetition")
-                                    game_over = True
+                                game_record.add_move(selected_pos, end, None, move_notation, position.hash)
+                                game_over = check_game_end(position, move_log, position_history,
+                                                           capture or (selected_piece & 7) == PAWN)
+                            if bounded_history:
+                                del move_log[:-BOUNDED_LOG_LINES]
 
                     dragging = False
                     selected_pos = None
@@ -664,73 +820,155 @@ def main():
 
             elif event.type == pygame.MOUSEMOTION:
                 if is_scrolling:
-                    total_content_height = len(move_log) * LINE_HEIGHT
-                    scroll_offset = (my - MARGIN_HEIGHT) / MOVE_LOG_HEIGHT * total_content_height
-                    scroll_offset = max(0, min(scroll_offset, total_content_height - MOVE_LOG_HEIGHT))
+                    total_content_height = len(move_log) * layout.line_height
+                    scroll_offset = (my - layout.board_y) / layout.board_size * total_content_height
+                    scroll_offset = max(0, min(scroll_offset, total_content_height - layout.board_size))
             elif event.type == pygame.MOUSEWHEEL:
-                scroll_offset = max(0, scroll_offset - event.y * LINE_HEIGHT)
-
-        # --- AI move handling based on game mode ---
-        if not game_over and not promotion_pending:
+                scroll_offset = max(0, scroll_offset - event.y * layout.line_height)
+
+        if resized_at is not None and time.perf_counter() - resized_at >= RESIZE_SETTLE:
+            resized_at = None
+            win = pygame.display.get_surface()
+            old_line_height = layout.line_height
+            layout = Layout(win.get_width(), win.get_height())
+            pieces, small_pieces = sprite_cache.get(layout.square_size, layout.small_size)
+            font = layout.font(MOVE_LOG_FONT_SIZE)
+            hud_font = layout.font(HUD_FONT_SIZE)
+            scroll_offset = scroll_offset * layout.line_height / old_line_height
+            analysis_version = -1  # Re-render the panel at the new width.
+            if dragging and selected_pos:
+                dragged_piece_image = pieces[selected_piece]
+                mouse_offset = (layout.square_size // 2, layout.square_size // 2)
+
+        # Every completed ply (game_record.moves gets it once any promotion is chosen) goes on the history.
+        if history.last_ply < len(game_record.moves):
+            history.record(board, moved_positions, en_passant_target, captured_pieces, move_log, position_history,
+                           current_move_number, white_to_move, bonus_white, bonus_black)
+
+        # Clock handover after a human move, before the AI starts thinking.
+        if game_clock and not game_over and not promotion_pending:
+            game_over = update_clock(game_clock, white_to_move, move_log)
+
+        # --- AI move handling based on game mode (paused while browsing earlier moves) ---
+        if not game_over and not promotion_pending and history.at_end():
             current_color = WHITE if white_to_move else BLACK
             if game_mode == "pvp":
                 pass  # both sides are human.
             elif game_mode == "white_vs_ai":
                 # In white_vs_ai, white is human; black is AI.
                 if not white_to_move:
-                    pygame.time.delay(500)  # Artificial delay for AI "thinking"
                     board, moved_positions, en_passant_target, captured_pieces, move_log, position_history, current_move_number, game_over = \
                         ai_move_function(BLACK, board, moved_positions, en_passant_target,
-                                         captured_pieces, move_log, position_history, current_move_number, white_to_move)
+                                         captured_pieces, move_log, position_history, current_move_number, white_to_move,
+                                         game_record, game_clock, position)
                     white_to_move = not white_to_move
             elif game_mode == "black_vs_ai":
                 # In black_vs_ai, black is human; white is AI.
                 if white_to_move:
-                    pygame.time.delay(500)
                     board, moved_positions, en_passant_target, captured_pieces, move_log, position_history, current_move_number, game_over = \
                         ai_move_function(WHITE, board, moved_positions, en_passant_target,
-                                         captured_pieces, move_log, position_history, current_move_number, white_to_move)
+                                         captured_pieces, move_log, position_history, current_move_number, white_to_move,
+                                         game_record, game_clock, position)
                     white_to_move = not white_to_move
             elif game_mode == "ai_vs_ai":
-                pygame.time.delay(500)
                 board, moved_positions, en_passant_target, captured_pieces, move_log, position_history, current_move_number, game_over = \
                     ai_move_function(current_color, board, moved_positions, en_passant_target,
-                                     captured_pieces, move_log, position_history, current_move_number, white_to_move)
+                                     captured_pieces, move_log, position_history, current_move_number, white_to_move,
+                                     game_record, game_clock, position)
                 white_to_move = not white_to_move
 
+            if history.last_ply < len(game_record.moves):
+                history.record(board, moved_positions, en_passant_target, captured_pieces, move_log, position_history,
+                               current_move_number, white_to_move, bonus_white, bonus_black)
+            if game_clock and not game_over:
+                game_over = update_clock(game_clock, white_to_move, move_log)
+
+        if game_over and not game_saved:
+            if game_clock:
+                game_clock.stop()
+            history.amend_log(move_log)
+            save_game_record(game_record, move_log)
+            game_saved = True
+            if memory_profiler:
+                memory_profiler.sample()
+                print(f"Game over after {len(game_record.moves)} plies, peak RSS {format_bytes(memory_profiler.game_peak)}")
+
+        if show_analysis and not promotion_pending:
+            active_color = "w" if white_to_move else "b"
+            analysis_worker.set_position(generate_fen(board, active_color, get_castling_rights(board, moved_positions),
+                                                      en_passant_target, 0, current_move_number))
+        if show_analysis and time.perf_counter() - analysis_checked_at >= ANALYSIS_REFRESH:
+            analysis_checked_at = time.perf_counter()
+            version, result = analysis_worker.latest()
+            if version != analysis_version:
+                analysis_version = version
+                analysis_surface = render_analysis_panel(hud_font, result)
+
         # --- Drawing Phase ---
+        frame_start = time.perf_counter()
         win.fill(BACKGROUND_COLOR)
         draw_board(win, legal_moves, selected_pos)
+        board_done = time.perf_counter()
         draw_pieces(win, pieces, selected_pos)
+        pieces_done = time.perf_counter()
         draw_captured_and_points(win, captured_pieces, small_pieces)
 
         # Draw move log (to the right of the board)
-        log_x = MARGIN_WIDTH + BOARD_SIZE + 20
-        log_y = MARGIN_HEIGHT
-        pygame.draw.rect(win, (50, 50, 50), (log_x, log_y, MOVE_LOG_WIDTH, MOVE_LOG_HEIGHT))
-        start_idx = int(scroll_offset // LINE_HEIGHT)
-        end_idx = start_idx + (MOVE_LOG_HEIGHT // LINE_HEIGHT) + 1
-        visible_moves = move_log[start_idx:end_idx]
+        log_start = time.perf_counter()
+        log_x = layout.log_x
+        log_y = layout.board_y
+        log_width = layout.log_width
+        log_height = layout.board_size
+        line_height = layout.line_height
+        scrollbar_width = layout.scrollbar_width
+        pygame.draw.rect(win, (50, 50, 50), (log_x, log_y, log_width, log_height))
+        # While browsing earlier moves the whole game stays listed, with the current move highlighted.
+        shown_log = move_log if history.at_end() else history.log_lines
+        current_line = (history.ply - 1) // 2 if not history.at_end() and history.ply else None
+        start_idx = int(scroll_offset // line_height)
+        end_idx = start_idx + (log_height // line_height) + 1
+        visible_moves = shown_log[start_idx:end_idx]
         for i, move in enumerate(visible_moves):
+            line_y = log_y + i * line_height - (scroll_offset % line_height)
+            if start_idx + i == current_line:
+                pygame.draw.rect(win, (90, 90, 90), (log_x, line_y, log_width - scrollbar_width, line_height))
             text = font.render(move, True, TEXT_COLOR)
-            win.blit(text, (log_x + 5, log_y + i * LINE_HEIGHT - (scroll_offset % LINE_HEIGHT)))
-        total_content_height = len(move_log) * LINE_HEIGHT
-        if total_content_height > MOVE_LOG_HEIGHT:
-            thumb_height = MOVE_LOG_HEIGHT * (MOVE_LOG_HEIGHT / total_content_height)
-            thumb_position = (scroll_offset / total_content_height) * MOVE_LOG_HEIGHT
+            win.blit(text, (log_x + layout.scaled(5), line_y))
+        total_content_height = len(shown_log) * line_height
+        if total_content_height > log_height:
+            thumb_height = log_height * (log_height / total_content_height)
+            thumb_position = (scroll_offset / total_content_height) * log_height
             pygame.draw.rect(win, (100, 100, 100), (
-                log_x + MOVE_LOG_WIDTH - SCROLLBAR_WIDTH,
+                log_x + log_width - scrollbar_width,
                 log_y + thumb_position,
-                SCROLLBAR_WIDTH,
+                scrollbar_width,
                 thumb_height
             ))
+        log_done = time.perf_counter()
+        if show_analysis and analysis_surface:
+            win.blit(analysis_surface, (layout.scaled(10), layout.analysis_y))
+        if game_clock:
+            draw_clocks(win, font, game_clock)
         if promotion_pending:
             draw_promotion_menu(win, pieces, promotion_pos, promotion_color)
         if dragging and selected_pos:
             piece_x = mx - mouse_offset[0]
             piece_y = my - mouse_offset[1]
             win.blit(dragged_piece_image, (piece_x, piece_y))
+        if show_hud:
+            stats.record_frame({
+                "draw_board": board_done - frame_start,
+                "draw_pieces": pieces_done - board_done,
+                "move_log": log_done - log_start,
+                "frame": time.perf_counter() - frame_start,
+            })
+            hud_top = None
+            if show_analysis and analysis_surface:
+                hud_top = layout.analysis_y + analysis_surface.get_height() + 10  # Stack below the analysis panel
+            draw_hud(win, hud_font, clock.get_fps(), hud_top)
         pygame.display.flip()
+        if memory_profiler:
+            memory_profiler.tick()
 
     pygame.quit()
 
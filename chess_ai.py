@@ -1,34 +1,675 @@
-import random
-from util import EMPTY, parse_fen, get_legal_moves, WHITE, BLACK, fen_piece_map
+import atexit
+import os
+import time
+import stats
+import searchtrace
+from position import Position
+from moves import (MoveStack, move_to_tuple, INDEX_SQUARE, END_SHIFT, SQUARE_MASK, PROMOTION_SHIFT, CAPTURES,
+                   PROMOTIONS, QUIETS, ALL_MOVES)
+from util import WHITE, BLACK, PAWN, QUEEN, KING, PIECE_VALUES
+from game_clock import allocate_time
 
-def get_ai_move(fen):
+DEFAULT_MOVE_TIME = 0.5  # Seconds per move when there is no clock
+MAX_SEARCH_DEPTH = 32
+MAX_PLY = 96  # Deepest ply the search (including quiescence) may reach
+
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000  # Scores beyond this are mates
+INFINITY = 1000000
+# What a draw by repetition or the fifty-move rule costs the side to move at the root. With
+# material-only scores most quiet lines score 0, and a draw at exactly 0 would be taken as
+# readily as playing on.
+DRAW_CONTEMPT = 20
+
+# Centipawn values; the king only matters for move ordering (as a capturer).
+PIECE_SCORES = {piece_type: value * 100 for piece_type, value in PIECE_VALUES.items()}
+PIECE_SCORES[KING] = 0
+NOISY_MOVE_SCORE = 10000  # Ordering bonus that puts captures and queen promotions first
+
+# Transposition table: position hash -> (depth, score, flag, best packed move).
+EXACT, LOWER, UPPER = 0, 1, 2
+TT_MAX_ENTRIES = 1 << 20
+transposition_table = {}
+
+# Evaluation caches: fixed-size tables indexed by the low bits of a Zobrist key, where a new
+# entry simply replaces the one in its slot. The evaluation cache holds (position hash, score
+# for the side to move); the pawn table holds (pawn hash, White-relative pawn structure score),
+# shared by every position with the same pawns.
+EVAL_CACHE_BITS = 18
+PAWN_TABLE_BITS = 14
+EVAL_CACHE_MASK = (1 << EVAL_CACHE_BITS) - 1
+PAWN_TABLE_MASK = (1 << PAWN_TABLE_BITS) - 1
+eval_cache = [None] * (1 << EVAL_CACHE_BITS)
+pawn_table = [None] * (1 << PAWN_TABLE_BITS)
+
+# Pawn structure terms in centipawns.
+DOUBLED_PAWN_PENALTY = 15
+ISOLATED_PAWN_PENALTY = 12
+PASSED_PAWN_BONUS = (0, 5, 10, 20, 35, 60, 100, 0)  # By rank counted from the pawn's own side (1 = start)
+
+# Optional neural evaluation (see nnue.py); material is used while this is None.
+# Set the CHESS_NNUE environment variable to a weights file to load one at import.
+NNUE_ENV = "CHESS_NNUE"
+network = None
+
+# Selective search. Each technique can be switched off here, or by listing it in the
+# CHESS_SEARCH_OFF environment variable (e.g. "null_move,lmr"), to measure what it is worth.
+SEARCH_OFF_ENV = "CHESS_SEARCH_OFF"
+SELECTIVE_SEARCH = {"null_move": True, "lmr": True, "futility": True, "razoring": True}
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_DEPTH = 3
+LMR_FULL_DEPTH_MOVES = 3        # Moves searched at full depth before quiet moves are reduced
+LMR_DEEP_REDUCTION_MOVES = 8    # From this move on, quiet moves are reduced by two plies
+FUTILITY_MARGINS = (0, 200, 500)  # By remaining depth; quiet moves that cannot lift the score this far are skipped
+RAZOR_MARGINS = (0, 300, 550)     # By remaining depth; nodes this far below alpha drop into quiescence
+
+# Search tracing (see searchtrace.py): set CHESS_TRACE to a file path to record every search
+# this process makes, as JSON lines if the path ends in .jsonl and in the binary format
+# otherwise. Only searches made while a trace is open use TracedSearch.
+TRACE_ENV = "CHESS_TRACE"
+tracer = None
+
+# How often (in nodes) the search looks at the clock.
+TIME_CHECK_INTERVAL = 1024
+# Assumed cost ratio between successive iterations until two have been timed.
+DEFAULT_ITERATION_GROWTH = 4.0
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def score_to_tt(score, ply):
+    """Mate scores are stored relative to the node, not the root."""
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def load_network(path):
+    """Switches the evaluation to the neural network stored at `path` (needs NumPy)."""
+    global network
+    import nnue
+    network = nnue.load_network(path)
+    # Scores from the old evaluation no longer apply.
+    transposition_table.clear()
+    eval_cache[:] = [None] * len(eval_cache)
+
+
+def pawn_structure(position):
+    """White-relative centipawns for doubled, isolated and passed pawns."""
+    rows = {WHITE: [[] for _ in range(8)], BLACK: [[] for _ in range(8)]}
+    for color in (WHITE, BLACK):
+        for (r, c), piece in position.pieces[color].items():
+            if (piece & 7) == PAWN:
+                rows[color][c].append(r)
+    score = 0
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        own, other = rows[color], rows[BLACK if color == WHITE else WHITE]
+        for c in range(8):
+            count = len(own[c])
+            if not count:
+                continue
+            if count > 1:
+                score -= sign * DOUBLED_PAWN_PENALTY * (count - 1)
+            neighbours = range(max(0, c - 1), min(7, c + 1) + 1)
+            if not any(own[f] for f in neighbours if f != c):
+                score -= sign * ISOLATED_PAWN_PENALTY * count
+            for r in own[c]:
+                # Passed: no enemy pawn ahead on this or an adjacent file (White moves towards row 0).
+                if color == WHITE:
+                    passed = not any(enemy < r for f in neighbours for enemy in other[f])
+                    rank = 7 - r
+                else:
+                    passed = not any(enemy > r for f in neighbours for enemy in other[f])
+                    rank = r
+                if passed:
+                    score += sign * PASSED_PAWN_BONUS[rank]
+    return score
+
+
+class Search:
+    """
+    Negamax alpha-beta with a transposition table, capture-first move
+    ordering and a captures-only quiescence search. Moves are generated in
+    stages (TT move, captures, promotions, quiet moves), so a node that cuts
+    off early, and every quiescence node, skips the quiet moves. Each ply
+    generates into its own preallocated buffer of a MoveStack, reused by
+    every node at that ply. Away from the root and out of check, the tree is
+    narrowed by null-move pruning, late move reductions of quiet moves, and
+    futility pruning and razoring near the leaves, each of which
+    SELECTIVE_SEARCH can turn off. If the deadline passes mid-search,
+    SearchTimeout is raised and unwind() restores the position; setting
+    stop_event (a threading.Event) has the same effect.
+    A position that repeats one of `history` (hashes of the game's earlier
+    positions) or one earlier on the line being searched scores as a draw.
+    With a network loaded, an nnue.Accumulator follows every make / unmake.
+    """
+    def __init__(self, position, deadline, stop_event=None, history=()):
+        self.position = position
+        self.deadline = deadline
+        self.stop_event = stop_event
+        self.excluded = set()  # Root moves skipped, for searching the next best line
+        self.stack = MoveStack(MAX_PLY)
+        self.undos = []
+        # Hash -> times on the game history or the current line; reaching one again is a repetition.
+        self.repeated = dict.fromkeys(history, 1)
+        self.accumulator = None
+        if network is not None:
+            import nnue
+            self.accumulator = nnue.Accumulator(network, MAX_PLY)
+            self.accumulator.refresh(position)
+        self.null_move = SELECTIVE_SEARCH["null_move"]
+        self.lmr = SELECTIVE_SEARCH["lmr"]
+        self.futility = SELECTIVE_SEARCH["futility"]
+        self.razoring = SELECTIVE_SEARCH["razoring"]
+        self.root_move = 0
+        self.nodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.cutoffs = 0
+        self.null_cutoffs = 0
+        self.reductions = 0
+        self.futility_prunes = 0
+        self.razor_cutoffs = 0
+        self.eval_probes = 0
+        self.eval_hits = 0
+        self.pawn_probes = 0
+        self.pawn_hits = 0
+
+    def make(self, move):
+        repeated = self.repeated
+        key = self.position.hash
+        repeated[key] = repeated.get(key, 0) + 1
+        undo = self.position.make_packed_move(move)
+        self.undos.append(undo)
+        if self.accumulator is not None:
+            self.accumulator.push(self.position, undo)
+
+    def unmake(self):
+        undo = self.undos.pop()
+        if len(undo) == 3:
+            self.position.unmake_null_move(undo)
+        else:
+            self.position.unmake_move(undo)
+            if self.accumulator is not None:
+                self.accumulator.pop()
+        repeated = self.repeated
+        key = self.position.hash
+        if repeated[key] > 1:
+            repeated[key] -= 1
+        else:
+            del repeated[key]
+
+    def make_null(self):
+        # No piece moves, so the accumulator needs no update.
+        key = self.position.hash
+        self.repeated[key] = self.repeated.get(key, 0) + 1
+        self.undos.append(self.position.make_null_move())
+
+    def has_pieces(self, color):
+        """Whether `color` has anything besides pawns and the king; null moves are unsafe without (zugzwang)."""
+        return any((piece & 7) not in (PAWN, KING) for piece in self.position.pieces[color].values())
+
+    def evaluate(self):
+        """
+        Centipawns from the side to move's point of view: the network if loaded,
+        else material and pawn structure. Scores are looked up in eval_cache
+        first, and pawn structure in pawn_table.
+        """
+        position = self.position
+        key = position.hash
+        slot = key & EVAL_CACHE_MASK
+        entry = eval_cache[slot]
+        self.eval_probes += 1
+        if entry is not None and entry[0] == key:
+            self.eval_hits += 1
+            return entry[1]
+        if self.accumulator is not None:
+            score = int(self.accumulator.evaluate(position.color))
+        else:
+            score = (position.material[WHITE] - position.material[BLACK]) * 100 + self.pawn_score()
+            if position.color == BLACK:
+                score = -score
+        eval_cache[slot] = (key, score)
+        return score
+
+    def pawn_score(self):
+        key = self.position.pawn_hash
+        slot = key & PAWN_TABLE_MASK
+        entry = pawn_table[slot]
+        self.pawn_probes += 1
+        if entry is not None and entry[0] == key:
+            self.pawn_hits += 1
+            return entry[1]
+        score = pawn_structure(self.position)
+        pawn_table[slot] = (key, score)
+        return score
+
+    def staged_moves(self, tt_move, ply, quiets=True):
+        """
+        Legal moves as (order score, packed move), generated a stage at a time
+        into the move buffer of `ply`:
+        the TT move, captures by MVV-LVA, queen promotions, quiet moves and
+        finally under-promotions. Everything from the quiet moves on scores
+        below NOISY_MOVE_SCORE, and is never generated if the consumer stops
+        before reaching it. With quiets=False the moves end after the queen
+        promotions: the quiet stage is not generated at all, and under-promotions
+        without a capture are left out with it.
+        """
+        board = self.position.board
+        buffer = self.stack.buffers[ply]
+        under_promotions = []
+        kinds = ALL_MOVES if quiets else CAPTURES | PROMOTIONS
+        for kind, start, end in self.position.iter_stages(tt_move, kinds, buffer):
+            if kind == CAPTURES:
+                scored = []
+                for move in buffer[start:end]:
+                    start = INDEX_SQUARE[move & SQUARE_MASK]
+                    end = INDEX_SQUARE[(move >> END_SHIFT) & SQUARE_MASK]
+                    victim = board[end[0]][end[1]] or PAWN  # En passant
+                    score = NOISY_MOVE_SCORE + 10 * PIECE_SCORES[victim & 7] - PIECE_SCORES[board[start[0]][start[1]] & 7]
+                    promotion = (move >> PROMOTION_SHIFT) & 7
+                    if promotion == QUEEN:
+                        score += NOISY_MOVE_SCORE + PIECE_SCORES[QUEEN]
+                    elif promotion:
+                        score -= PIECE_SCORES[QUEEN]
+                    scored.append((score, move))
+                scored.sort(reverse=True)
+                yield from scored
+            elif kind == PROMOTIONS:
+                for move in buffer[start:end]:
+                    if (move >> PROMOTION_SHIFT) & 7 == QUEEN:
+                        yield NOISY_MOVE_SCORE + PIECE_SCORES[QUEEN], move
+                    else:
+                        under_promotions.append((-PIECE_SCORES[QUEEN], move))
+            elif kind == QUIETS:
+                # Highest packed value first, the order the LMR limits were tuned with.
+                for move in sorted(buffer[start:end], reverse=True):
+                    yield 0, move
+                yield from under_promotions
+            else:
+                yield INFINITY, buffer[start]
+
+    def check_time(self):
+        if time.perf_counter() > self.deadline or (self.stop_event is not None and self.stop_event.is_set()):
+            raise SearchTimeout()
+
+    def negamax(self, depth, alpha, beta, ply, allow_null=True):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            self.check_time()
+        position = self.position
+        key = position.hash
+        if ply > 0 and (position.halfmove >= 100 or key in self.repeated):
+            return DRAW_CONTEMPT if ply & 1 else -DRAW_CONTEMPT
+
+        alpha_original = alpha
+        self.tt_probes += 1
+        entry = transposition_table.get(key)
+        tt_move = 0
+        if entry is not None:
+            self.tt_hits += 1
+            entry_depth, entry_score, entry_flag, tt_move = entry
+            if ply > 0 and entry_depth >= depth:
+                entry_score = score_from_tt(entry_score, ply)
+                if entry_flag == EXACT:
+                    return entry_score
+                if entry_flag == LOWER and entry_score >= beta:
+                    return entry_score
+                if entry_flag == UPPER and entry_score <= alpha:
+                    return entry_score
+
+        if depth <= 0:
+            return self.quiesce(alpha, beta, ply)
+
+        in_check = position.is_in_check()
+        # No selective search at the root or in check, and no pruning against a mate score.
+        selective = ply > 0 and not in_check
+        static_eval = self.evaluate() if selective else 0
+        prune = selective and abs(alpha) < MATE_THRESHOLD
+
+        # Razoring: this far below alpha near the leaves, only a capture can bring the score back.
+        if prune and self.razoring and depth < len(RAZOR_MARGINS) and not tt_move \
+                and static_eval + RAZOR_MARGINS[depth] <= alpha:
+            score = self.quiesce(alpha, beta, ply)
+            if depth == 1 or score <= alpha:
+                self.razor_cutoffs += 1
+                return score
+
+        # Null move: if passing still fails high after a reduced search, a real move will too.
+        if selective and allow_null and self.null_move and depth >= NULL_MOVE_MIN_DEPTH and static_eval >= beta \
+                and abs(beta) < MATE_THRESHOLD and self.has_pieces(position.color):
+            self.make_null()
+            score = -self.negamax(depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, ply + 1, False)
+            self.unmake()
+            if score >= beta:
+                self.null_cutoffs += 1
+                return beta
+
+        futile = prune and self.futility and depth < len(FUTILITY_MARGINS) \
+            and static_eval + FUTILITY_MARGINS[depth] <= alpha
+        reduce = selective and self.lmr and depth >= LMR_MIN_DEPTH
+        best_score = -INFINITY
+        best_move = 0
+        searched = 0
+        for order, move in self.staged_moves(tt_move, ply):
+            if not best_move:
+                best_move = move
+            if ply == 0 and move in self.excluded:
+                continue
+            self.make(move)
+            # Late quiet moves that do not give check are pruned near the leaves, or else searched shallower.
+            late_quiet = searched and order < NOISY_MOVE_SCORE and (futile or (
+                reduce and searched >= LMR_FULL_DEPTH_MOVES)) and not position.is_in_check()
+            if late_quiet and futile:
+                self.unmake()
+                self.futility_prunes += 1
+                continue
+            if late_quiet:
+                self.reductions += 1
+                reduction = 2 if searched >= LMR_DEEP_REDUCTION_MOVES and depth > 3 else 1
+                score = -self.negamax(depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                if score > alpha:
+                    score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            self.unmake()
+            searched += 1
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.cutoffs += 1
+                break
+        if not best_move:
+            return -MATE_SCORE + ply if in_check else 0
+
+        if ply == 0:
+            self.root_move = best_move
+            if self.excluded:
+                return best_score  # Not a full search of the root, so nothing to store.
+        if best_score <= alpha_original:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        transposition_table[key] = (depth, score_to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def quiesce(self, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            self.check_time()
+        stand_pat = self.evaluate()
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        for order, move in self.staged_moves(0, ply, quiets=False):
+            if order < NOISY_MOVE_SCORE:
+                break  # Only captures and queen promotions are searched here.
+            self.make(move)
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            self.unmake()
+            if score >= beta:
+                self.cutoffs += 1
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def unwind(self):
+        while self.undos:
+            self.unmake()
+
+    def report(self, elapsed):
+        if stats.enabled:
+            stats.incr("nodes", self.nodes)
+            stats.incr("tt_probes", self.tt_probes)
+            stats.incr("tt_hits", self.tt_hits)
+            stats.incr("cutoffs", self.cutoffs)
+            stats.incr("null_cutoffs", self.null_cutoffs)
+            stats.incr("reductions", self.reductions)
+            stats.incr("futility_prunes", self.futility_prunes)
+            stats.incr("razor_cutoffs", self.razor_cutoffs)
+            stats.incr("eval_probes", self.eval_probes)
+            stats.incr("eval_hits", self.eval_hits)
+            stats.incr("pawn_probes", self.pawn_probes)
+            stats.incr("pawn_hits", self.pawn_hits)
+            stats.add_time("search", elapsed)
+
+
+class TracedSearch(Search):
+    """
+    A Search that also streams its tree to `tracer` (a searchtrace.TraceWriter):
+    each node entered and left with its window and score, transposition
+    table hits, and how many moves a node had made when it failed high.
     """
-    Takes a FEN string as input and returns a random legal move.
-    
+    def __init__(self, position, deadline, tracer, stop_event=None, history=()):
+        super().__init__(position, deadline, stop_event, history)
+        self.tracer = tracer
+        self.path = []                       # Moves from the root to the current node, 0 for a null move
+        self.moves_made = [0] * (MAX_PLY + 1)  # Moves made so far by the open node at each ply
+
+    def make(self, move):
+        self.moves_made[len(self.path)] += 1
+        self.path.append(move)
+        super().make(move)
+
+    def make_null(self):
+        self.path.append(0)
+        super().make_null()
+
+    def unmake(self):
+        self.path.pop()
+        super().unmake()
+
+    def negamax(self, depth, alpha, beta, ply, allow_null=True):
+        record = self.tracer.record
+        record(searchtrace.ENTER, ply, depth, alpha, beta, self.path[-1] if self.path else 0)
+        self.moves_made[ply] = 0
+        entry = transposition_table.get(self.position.hash)
+        if entry is not None:
+            record(searchtrace.TT_HIT, ply, entry[0], alpha, beta, entry[1])
+        score = super().negamax(depth, alpha, beta, ply, allow_null)
+        if score >= beta:
+            record(searchtrace.CUTOFF, ply, depth, alpha, beta, self.moves_made[ply])
+        record(searchtrace.EXIT, ply, depth, alpha, beta, score)
+        return score
+
+    def quiesce(self, alpha, beta, ply):
+        record = self.tracer.record
+        record(searchtrace.QENTER, ply, 0, alpha, beta, self.path[-1] if self.path else 0)
+        # Razoring runs a quiescence search from a node that may go on to search its moves.
+        moves_made = self.moves_made[ply]
+        self.moves_made[ply] = 0
+        score = super().quiesce(alpha, beta, ply)
+        if score >= beta:
+            record(searchtrace.CUTOFF, ply, 0, alpha, beta, self.moves_made[ply])
+        record(searchtrace.QEXIT, ply, 0, alpha, beta, score)
+        self.moves_made[ply] = moves_made
+        return score
+
+
+def start_trace(path):
+    """Records every search from now on to `path` (see TRACE_ENV); returns the searchtrace.TraceWriter."""
+    global tracer
+    stop_trace()
+    tracer = searchtrace.TraceWriter(path)
+    return tracer
+
+
+def stop_trace():
+    """Writes out and closes the open trace, if any."""
+    global tracer
+    if tracer is not None:
+        tracer.close()
+        tracer = None
+
+
+def search_best_move(position, soft_limit, hard_limit=None, max_depth=MAX_SEARCH_DEPTH, history=()):
+    """
+    Iterative deepening: searches depth 1, 2, ... until max_depth, a forced
+    mate, or the time budget. No iteration is started that is not expected to
+    finish within soft_limit (judged by how much longer each iteration took
+    than the one before), and an iteration still running at hard_limit is
+    abandoned in favour of the last completed one. `history` holds the hashes
+    of the game's earlier positions, which the search scores as draws when
+    a line returns to them.
+
+    Returns (packed move, score in centipawns, depth completed), or
+    (None, 0, 0) when there are no legal moves.
+    """
+    start = time.perf_counter()
+    if hard_limit is None:
+        hard_limit = soft_limit
+    if len(transposition_table) > TT_MAX_ENTRIES:
+        transposition_table.clear()
+
+    if tracer is None:
+        search = Search(position, start + hard_limit, history=history)
+    else:
+        search = TracedSearch(position, start + hard_limit, tracer, history=history)
+    root_count = search.stack.generate(position, 0)
+    if tracer is not None:
+        tracer.record(searchtrace.SEARCH, value=root_count)
+    if root_count == 0:
+        return None, 0, 0
+
+    best_move = search.stack.buffers[0][0]
+    best_score = 0
+    completed = 0
+    previous_iteration = None
+    for depth in range(1, max_depth + 1):
+        iteration_start = time.perf_counter()
+        if tracer is not None:
+            tracer.record(searchtrace.ITERATION, depth=depth)
+        try:
+            score = search.negamax(depth, -INFINITY, INFINITY, 0)
+        except SearchTimeout:
+            search.unwind()
+            if tracer is not None:
+                tracer.record(searchtrace.ABORT)
+            break
+        best_move, best_score, completed = search.root_move, score, depth
+
+        now = time.perf_counter()
+        iteration_time = now - iteration_start
+        if abs(score) >= MATE_THRESHOLD or root_count == 1:
+            break
+        growth = DEFAULT_ITERATION_GROWTH
+        if previous_iteration and previous_iteration > 0.001:
+            growth = min(max(iteration_time / previous_iteration, 2.0), 10.0)
+        if (now - start) + iteration_time * growth > soft_limit:
+            break
+        previous_iteration = iteration_time
+
+    search.report(time.perf_counter() - start)
+    return best_move, best_score, completed
+
+
+def principal_variation(position, move, max_length=16):
+    """The line starting with `move`, continued by the transposition table's best moves."""
+    line = [move]
+    undos = [position.make_packed_move(move)]
+    seen = {position.hash}
+    while len(line) < max_length:
+        entry = transposition_table.get(position.hash)
+        if entry is None or entry[3] not in position.generate_moves():
+            break
+        line.append(entry[3])
+        undos.append(position.make_packed_move(entry[3]))
+        if position.hash in seen:
+            break
+        seen.add(position.hash)
+    while undos:
+        position.unmake_move(undos.pop())
+    return line
+
+
+def analyse(position, multipv=3, max_depth=MAX_SEARCH_DEPTH, stop_event=None):
+    """
+    Iterative deepening with no time limit that keeps the best `multipv`
+    lines: each further line is searched with the root moves of the lines
+    above it excluded. Yields (depth, lines) after every completed depth,
+    where lines is a list of (score, principal variation as packed moves),
+    best first and scored for the side to move. Stops at max_depth or as
+    soon as stop_event is set, leaving the position as it was.
+    """
+    search = Search(position, float("inf"), stop_event)
+    multipv = min(multipv, search.stack.generate(position, 0))
+    if multipv == 0:
+        return
+    for depth in range(1, max_depth + 1):
+        lines = []
+        try:
+            for _ in range(multipv):
+                score = search.negamax(depth, -INFINITY, INFINITY, 0)
+                lines.append((score, principal_variation(position, search.root_move)))
+                search.excluded.add(search.root_move)
+        except SearchTimeout:
+            search.unwind()
+            return
+        finally:
+            search.excluded = set()
+        yield depth, lines
+
+
+def get_ai_move(fen, move_time=None, remaining=None, increment=0, max_depth=MAX_SEARCH_DEPTH, history=()):
+    """
+    Takes a FEN string (or a position packed by util.encode_position, which is
+    cheaper to send to worker processes) as input and returns the best move
+    found by an iterative deepening alpha-beta search (on material, or the
+    neural evaluation once load_network has been called).
+
     The move is returned as a tuple: ((start_row, start_col), (end_row, end_col)).
     If no legal moves are available, returns None.
-    
-    Note: Since the FEN string does not include information about moved pieces,
-    we pass an empty set for moved_positions. (This may affect special moves like castling.)
-    """
-    board, active_color, castling, en_passant_target, halfmove, fullmove = parse_fen(fen)
-    # For now, we assume that moved_positions is empty.
-    moved_positions = set()
-    
-    # Determine which color is to move.
-    color = WHITE if active_color == 'w' else BLACK
-    
-    legal_moves = []
-    for r in range(8):
-        for c in range(8):
-            piece = board[r][c]
-            if piece != EMPTY and (piece & 24) == color:
-                # get_legal_moves is assumed to return a list of destination tuples.
-                moves = get_legal_moves(board, (r, c), moved_positions, en_passant_target)
-                for move in moves:
-                    legal_moves.append(((r, c), move))
-    
-    if not legal_moves:
+
+    With `remaining` (seconds left on the mover's clock) the time for this move
+    is allocated from the clock and `increment`; otherwise the search uses
+    `move_time` seconds (DEFAULT_MOVE_TIME if not given).
+    Castling availability comes from the castling field of the FEN.
+    `history` holds the Zobrist hashes of the game's earlier positions, so
+    the search can steer towards or away from repetitions.
+    """
+    if isinstance(fen, bytes):
+        position = Position.from_bytes(fen)
+    else:
+        position = Position.from_fen(fen)
+
+    if remaining is not None:
+        soft_limit, hard_limit = allocate_time(remaining, increment, position)
+    else:
+        soft_limit = hard_limit = DEFAULT_MOVE_TIME if move_time is None else move_time
+
+    move, score, depth = search_best_move(position, soft_limit, hard_limit, max_depth, history)
+    if move is None:
         return None
-    
-    return random.choice(legal_moves)
+    return move_to_tuple(move)
+
+
+if os.environ.get(NNUE_ENV):
+    load_network(os.environ[NNUE_ENV])
+if os.environ.get(TRACE_ENV):
+    start_trace(os.environ[TRACE_ENV])
+    atexit.register(stop_trace)
+for name in filter(None, os.environ.get(SEARCH_OFF_ENV, "").split(",")):
+    if name.strip() not in SELECTIVE_SEARCH:
+        raise ValueError(f"{SEARCH_OFF_ENV}: unknown search feature {name.strip()!r}")
+    SELECTIVE_SEARCH[name.strip()] = False
@@ -0,0 +1,94 @@
+import time
+
+from util import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_VALUES
+
+# Menu choices: (label, base seconds, increment seconds). None means no clock.
+TIME_CONTROLS = [
+    ("No clock", None, 0),
+    ("1+0", 60, 0),
+    ("3+2", 180, 2),
+    ("5+0", 300, 0),
+    ("10+5", 600, 5),
+]
+
+# Non-pawn material at the start of a game, used to estimate the game phase.
+OPENING_MATERIAL = 2 * (2 * PIECE_VALUES[KNIGHT] + 2 * PIECE_VALUES[BISHOP] + 2 * PIECE_VALUES[ROOK] + PIECE_VALUES[QUEEN])
+# Time kept back on every move for move application, drawing and other overhead.
+MOVE_OVERHEAD = 0.05
+
+
+class ChessClock:
+    """
+    Two countdown clocks with a Fischer increment. Only one side's clock runs
+    at a time; press() ends that side's turn, adds the increment and starts
+    the other clock. A side whose time reaches zero has flagged.
+    """
+    def __init__(self, base, increment=0):
+        self.base = base
+        self.increment = increment
+        self.remaining = {WHITE: float(base), BLACK: float(base)}
+        self.running = None
+        self.started_at = None
+
+    def start(self, color):
+        self.running = color
+        self.started_at = time.perf_counter()
+
+    def stop(self):
+        if self.running is not None:
+            self.remaining[self.running] -= time.perf_counter() - self.started_at
+            self.running = None
+
+    def time_left(self, color):
+        left = self.remaining[color]
+        if color == self.running:
+            left -= time.perf_counter() - self.started_at
+        return left
+
+    def flagged(self, color):
+        return self.time_left(color) <= 0
+
+    def press(self):
+        """Ends the running side's move. The increment is only added if it has not flagged."""
+        color = self.running
+        if color is None:
+            return
+        self.stop()
+        if self.remaining[color] > 0:
+            self.remaining[color] += self.increment
+            self.start(BLACK if color == WHITE else WHITE)
+
+
+def format_clock(seconds):
+    """M:SS, with tenths of a second once under ten seconds."""
+    seconds = max(0.0, seconds)
+    if seconds < 10:
+        return f"0:{seconds:04.1f}"
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes}:{secs:02d}"
+
+
+def game_phase(position):
+    """1.0 with all pieces on the board, falling towards 0.0 as pieces are traded."""
+    material = 0
+    for color in (WHITE, BLACK):
+        for piece in position.pieces[color].values():
+            if (piece & 7) not in (PAWN, KING):
+                material += PIECE_VALUES[piece & 7]
+    return min(1.0, material / OPENING_MATERIAL)
+
+
+def allocate_time(remaining, increment, position):
+    """
+    Splits the remaining clock time into a budget for one move and returns
+    (soft_limit, hard_limit) in seconds. The search starts no new iteration
+    that would not finish within the soft limit and abandons an iteration at
+    the hard limit. More moves are expected to remain while the board is full,
+    so the per-move share grows as material comes off.
+    """
+    usable = max(0.0, remaining - MOVE_OVERHEAD)
+    moves_to_go = 15 + 25 * game_phase(position)
+    soft = usable / moves_to_go + increment * 0.75
+    hard = min(usable * 0.3, soft * 3)
+    soft = min(soft, hard)
+    return soft, hard
@@ -0,0 +1,130 @@
+import argparse
+import os
+
+# No window and no speakers are needed to play AI vs AI games.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import chess
+import chess_ai
+import stats
+from archive import GameArchive, GameRecord
+from game_clock import ChessClock, format_clock
+from memprofile import MemoryProfiler, format_bytes
+from position import Position
+from util import WHITE, BLACK, parse_fen, starting_fen, moved_positions_from_castling
+
+
+def play_game(fen=starting_fen, max_plies=500, game_record=None, game_clock=None, memory_profiler=None):
+    """
+    Plays one AI vs AI game from the given FEN without opening a window,
+    using the same move and game-ending logic as the GUI. Moves are added to
+    game_record (an archive.GameRecord) if one is given. With game_clock (a
+    game_clock.ChessClock) both engines budget their time from the clock and
+    a side that runs out of time loses. A memory_profiler
+    (memprofile.MemoryProfiler) is ticked after every ply.
+    Returns (move_log, plies).
+    """
+    board, active_color, castling, en_passant_target, halfmove, fullmove = parse_fen(fen)
+    moved_positions = moved_positions_from_castling(castling)
+    position = Position(board, active_color, castling, en_passant_target, halfmove, fullmove)
+    captured_pieces = {'white': [], 'black': []}
+    move_log = []
+    position_history = []
+    current_move_number = fullmove
+    white_to_move = active_color == 'w'
+    chess.bonus_white = 0
+    chess.bonus_black = 0
+
+    game_over = False
+    plies = 0
+    if game_clock:
+        game_clock.start(WHITE if white_to_move else BLACK)
+    while not game_over and plies < max_plies:
+        color = WHITE if white_to_move else BLACK
+        board, moved_positions, en_passant_target, captured_pieces, move_log, position_history, current_move_number, game_over = \
+            chess.ai_move_function(color, board, moved_positions, en_passant_target,
+                                   captured_pieces, move_log, position_history, current_move_number, white_to_move,
+                                   game_record, game_clock, position)
+        white_to_move = not white_to_move
+        plies += 1
+        if memory_profiler:
+            memory_profiler.tick()
+        if game_clock and not game_over:
+            game_over = chess.update_clock(game_clock, white_to_move, move_log)
+    if game_clock:
+        game_clock.stop()
+    return move_log, plies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play AI vs AI games without a window.")
+    parser.add_argument("--games", type=int, default=1, help="number of games to play")
+    parser.add_argument("--max-plies", type=int, default=500, help="stop a game after this many plies")
+    parser.add_argument("--fen", default=starting_fen, help="starting position")
+    parser.add_argument("--base", type=float, metavar="SECONDS",
+                        help="play with a clock of this many seconds per side (default: fixed time per move)")
+    parser.add_argument("--increment", type=float, default=0, metavar="SECONDS", help="clock increment per move")
+    parser.add_argument("--nnue", metavar="PATH", help="evaluate with the neural network weights in PATH (needs NumPy)")
+    parser.add_argument("--archive", metavar="PATH", help="save the games to this SQLite archive")
+    parser.add_argument("--batch-size", type=int, default=100, help="games saved per archive transaction")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="collect search and move generator stats and write them as JSON ('-' for stdout)")
+    parser.add_argument("--memprofile", type=float, metavar="SECONDS",
+                        help="trace allocations, print the top growth sites this often and the peak RSS of each game")
+    parser.add_argument("--memprofile-top", type=int, default=10, metavar="N", help="growth sites per memory report")
+    parser.add_argument("--bounded-history", action="store_true",
+                        help="keep only the move log and positions the game still needs, for constant memory")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="record every AI search to PATH (.jsonl or binary); summarize with searchtrace.py")
+    args = parser.parse_args()
+
+    if args.nnue:
+        chess_ai.load_network(args.nnue)
+    if args.stats:
+        stats.reset()
+        stats.enable()
+    chess.bounded_history = args.bounded_history
+    if args.trace:
+        chess_ai.start_trace(args.trace)
+    memory_profiler = None
+    if args.memprofile:
+        memory_profiler = MemoryProfiler(args.memprofile, args.memprofile_top)
+        memory_profiler.start()
+
+    archive = GameArchive(args.archive) if args.archive else None
+    pending = []
+    for game in range(1, args.games + 1):
+        game_record = GameRecord(args.fen, "headless", "AI", "AI") if archive else None
+        game_clock = ChessClock(args.base, args.increment) if args.base else None
+        if memory_profiler:
+            memory_profiler.new_game()
+        move_log, plies = play_game(args.fen, args.max_plies, game_record, game_clock, memory_profiler)
+        result = move_log[-1] if move_log else "No moves"
+        if game_clock:
+            result += f" (clock {format_clock(game_clock.time_left(WHITE))} - {format_clock(game_clock.time_left(BLACK))})"
+        if memory_profiler:
+            result += f", peak RSS {format_bytes(memory_profiler.game_peak)}"
+        print(f"Game {game}: {plies} plies, {result}")
+        if archive:
+            game_record.finish(move_log, "move_limit")
+            pending.append(game_record)
+            if len(pending) >= args.batch_size:
+                archive.save_games(pending)
+                pending = []
+    if archive:
+        if pending:
+            archive.save_games(pending)
+        archive.close()
+
+    if memory_profiler:
+        memory_profiler.report()
+        memory_profiler.stop()
+    if args.trace:
+        chess_ai.stop_trace()
+    if args.stats:
+        stats.dump(args.stats)
+
+
+if __name__ == "__main__":
+    main()
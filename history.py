@@ -0,0 +1,144 @@
+from util import WHITE, BLACK
+
+SNAPSHOT_INTERVAL = 32  # Plies between full board snapshots
+
+# One entry per ply, describing the game state after that ply.
+BOARD_CHANGES = 0      # ((row, col, before, after), ...)
+MOVED_ADDED = 1        # squares added to moved_positions by the ply
+EN_PASSANT = 2
+MOVE_NUMBER = 3
+WHITE_TO_MOVE = 4
+BONUS_WHITE = 5
+BONUS_BLACK = 6
+LOG_LENGTH = 7
+LOG_LAST_LINE = 8      # The last move log line changes when Black replies, so it is kept per ply.
+CAPTURED_WHITE = 9
+CAPTURED_BLACK = 10
+HISTORY_LENGTH = 11
+
+
+class GameHistory:
+    """
+    The GUI game as an undo stack: every ply stores only the squares it
+    changed and the small scalars of the game state, and the append-only
+    lists (move log, captured pieces, repetition history) are kept once for
+    the whole line and cut to the recorded lengths on restore. A full board
+    snapshot every SNAPSHOT_INTERVAL plies bounds any jump to at most that
+    many applied deltas, however long the game.
+
+    Going back keeps the later plies for redo until a new ply is recorded
+    from an earlier position, which replaces them. With recording=False
+    nothing is kept and the game stays at its only ply, so there is nothing
+    to go back to.
+    """
+    def __init__(self, board, moved_positions, en_passant_target, current_move_number, white_to_move,
+                 snapshot_interval=SNAPSHOT_INTERVAL, recording=True):
+        self.snapshot_interval = snapshot_interval
+        self.recording = recording
+        self.board = [row[:] for row in board]
+        self.moved = set(moved_positions)
+        self.log_lines = []
+        self.captured = {'white': [], 'black': []}
+        self.positions = []
+        self.entries = [((), (), en_passant_target, current_move_number, white_to_move, 0, 0, 0, None, 0, 0, 0)]
+        self.snapshots = [(tuple(tuple(row) for row in board), frozenset(moved_positions))]
+        self.ply = 0
+
+    @property
+    def last_ply(self):
+        return len(self.entries) - 1
+
+    def at_end(self):
+        return self.ply == self.last_ply
+
+    def side_to_move(self, ply):
+        return WHITE if self.entries[ply][WHITE_TO_MOVE] else BLACK
+
+    def truncate(self):
+        """Drops the plies after the current one, before a different move is played from here."""
+        del self.entries[self.ply + 1:]
+        del self.snapshots[self.ply // self.snapshot_interval + 1:]
+        entry = self.entries[self.ply]
+        del self.log_lines[entry[LOG_LENGTH]:]
+        if entry[LOG_LENGTH]:
+            self.log_lines[-1] = entry[LOG_LAST_LINE]
+        del self.captured['white'][entry[CAPTURED_WHITE]:]
+        del self.captured['black'][entry[CAPTURED_BLACK]:]
+        del self.positions[entry[HISTORY_LENGTH]:]
+
+    def record(self, board, moved_positions, en_passant_target, captured_pieces, move_log, position_history,
+               current_move_number, white_to_move, bonus_white, bonus_black):
+        """Appends the state after a completed ply."""
+        if not self.recording:
+            return
+        if not self.at_end():
+            self.truncate()
+        previous = self.entries[-1]
+        changes = []
+        for r in range(8):
+            old_row, new_row = self.board[r], board[r]
+            if old_row != new_row:
+                for c in range(8):
+                    if old_row[c] != new_row[c]:
+                        changes.append((r, c, old_row[c], new_row[c]))
+                        old_row[c] = new_row[c]
+        added = tuple(sq for sq in moved_positions if sq not in self.moved)
+        self.moved.update(added)
+
+        start = max(0, previous[LOG_LENGTH] - 1)
+        self.log_lines[start:] = move_log[start:]
+        for side in ('white', 'black'):
+            self.captured[side].extend(captured_pieces[side][len(self.captured[side]):])
+        self.positions.extend(position_history[len(self.positions):])
+
+        self.entries.append((tuple(changes), added, en_passant_target, current_move_number, white_to_move,
+                             bonus_white, bonus_black, len(move_log), move_log[-1] if move_log else None,
+                             len(captured_pieces['white']), len(captured_pieces['black']), len(position_history)))
+        self.ply += 1
+        if self.ply % self.snapshot_interval == 0:
+            self.snapshots.append((tuple(tuple(row) for row in self.board), frozenset(self.moved)))
+
+    def amend_log(self, move_log):
+        """Takes lines added to the move log after the last record() (e.g. a loss on time) into the last ply."""
+        if not self.recording or not self.at_end():
+            return
+        self.log_lines[:] = move_log
+        self.entries[-1] = self.entries[-1][:LOG_LENGTH] + (len(move_log), move_log[-1] if move_log else None) + \
+            self.entries[-1][LOG_LAST_LINE + 1:]
+
+    def goto(self, target, board):
+        """
+        Restores the state after ply `target` into `board` (changed in place) and returns
+        (moved_positions, en_passant_target, captured_pieces, move_log, position_history,
+        current_move_number, white_to_move, bonus_white, bonus_black) as fresh objects.
+        """
+        target = max(0, min(target, self.last_ply))
+        if abs(target - self.ply) > self.snapshot_interval:
+            base = target // self.snapshot_interval
+            snapshot_board, snapshot_moved = self.snapshots[base]
+            self.board = [list(row) for row in snapshot_board]
+            self.moved = set(snapshot_moved)
+            self.ply = base * self.snapshot_interval
+        while self.ply > target:
+            entry = self.entries[self.ply]
+            for r, c, before, after in entry[BOARD_CHANGES]:
+                self.board[r][c] = before
+            self.moved.difference_update(entry[MOVED_ADDED])
+            self.ply -= 1
+        while self.ply < target:
+            self.ply += 1
+            entry = self.entries[self.ply]
+            for r, c, before, after in entry[BOARD_CHANGES]:
+                self.board[r][c] = after
+            self.moved.update(entry[MOVED_ADDED])
+
+        for r in range(8):
+            board[r][:] = self.board[r]
+        entry = self.entries[target]
+        move_log = self.log_lines[:entry[LOG_LENGTH]]
+        if move_log:
+            move_log[-1] = entry[LOG_LAST_LINE]
+        captured_pieces = {'white': self.captured['white'][:entry[CAPTURED_WHITE]],
+                           'black': self.captured['black'][:entry[CAPTURED_BLACK]]}
+        return (set(self.moved), entry[EN_PASSANT], captured_pieces, move_log, self.positions[:entry[HISTORY_LENGTH]],
+                entry[MOVE_NUMBER], entry[WHITE_TO_MOVE], entry[BONUS_WHITE], entry[BONUS_BLACK])
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from position import Position
+from server import DEFAULT_HOST, DEFAULT_PORT, move_text
+
+
+class LoadStats:
+    def __init__(self):
+        self.ack_latencies = []  # move sent -> server echoes it
+        self.ai_latencies = []   # move echoed -> AI reply arrives
+        self.moves = 0
+        self.games_started = 0
+        self.games_finished = 0
+        self.errors = 0
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run_connection(host, port, games, mode, think, deadline, stats, rng):
+    """
+    One client connection holding `games` games against the server's AI. A
+    move is played a random 0..2*think seconds after it becomes our turn, so
+    most games sit idle most of the time; finished games are replaced.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 16)
+    loop = asyncio.get_running_loop()
+    our_side = "w" if mode == "white_vs_ai" else "b"
+    sent = {}  # game id -> (plies when the move was sent, time sent, time echoed)
+
+    def send(message):
+        if not writer.is_closing():
+            writer.write(json.dumps(message).encode() + b"\n")
+
+    def new_game():
+        stats.games_started += 1
+        send({"op": "new", "mode": mode})
+
+    def play(game_id, fen, plies):
+        if time.perf_counter() >= deadline:
+            return
+        moves = Position.from_fen(fen).legal_moves()
+        if not moves:
+            return
+        start, end = rng.choice(moves)
+        sent[game_id] = (plies, time.perf_counter(), None)
+        stats.moves += 1
+        send({"op": "move", "game": game_id, "move": move_text(start, end)})
+
+    for _ in range(games):
+        new_game()
+    try:
+        while time.perf_counter() < deadline:
+            try:
+                line = await asyncio.wait_for(reader.readline(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                break
+            if not line:
+                break
+            message = json.loads(line)
+            if message["op"] == "error":
+                stats.errors += 1
+                continue
+            game_id = message["game"]
+            now = time.perf_counter()
+            if game_id in sent:
+                plies, sent_at, echoed_at = sent[game_id]
+                if message["plies"] == plies + 1:
+                    stats.ack_latencies.append(now - sent_at)
+                    sent[game_id] = (plies, sent_at, now)
+                elif message["plies"] == plies + 2 and echoed_at is not None:
+                    stats.ai_latencies.append(now - echoed_at)
+                    del sent[game_id]
+            if message["status"] != "ongoing":
+                stats.games_finished += 1
+                sent.pop(game_id, None)
+                send({"op": "leave", "game": game_id})
+                new_game()
+            elif message["fen"].split()[1] == our_side and game_id not in sent:
+                loop.call_later(rng.uniform(0, 2 * think), play, game_id, message["fen"], message["plies"])
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def run(args):
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    deadline = time.perf_counter() + args.duration
+    per_connection = [args.games // args.connections + (1 if i < args.games % args.connections else 0)
+                      for i in range(args.connections)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_connection(args.host, args.port, n, args.mode, args.think, deadline,
+                                                    stats, rng) for n in per_connection if n),
+                                   return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    failures = [r for r in results if isinstance(r, Exception)]
+
+    print(f"{args.games} games on {args.connections} connections for {elapsed:.1f} s")
+    print(f"Games started: {stats.games_started}, finished: {stats.games_finished}")
+    print(f"Moves sent: {stats.moves} ({stats.moves / elapsed:.1f}/s), errors: {stats.errors}, "
+          f"failed connections: {len(failures)}")
+    for name, values in (("Move echo", stats.ack_latencies), ("AI reply", stats.ai_latencies)):
+        if values:
+            print(f"{name} latency: p50 {percentile(values, 0.5) * 1000:.1f} ms, "
+                  f"p95 {percentile(values, 0.95) * 1000:.1f} ms, p99 {percentile(values, 0.99) * 1000:.1f} ms, "
+                  f"mean {statistics.mean(values) * 1000:.1f} ms")
+    if failures:
+        print(f"First connection failure: {failures[0]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test server.py with many concurrent games against the AI.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--games", type=int, default=1000, help="games kept open at once")
+    parser.add_argument("--connections", type=int, default=100, help="client connections the games are spread over")
+    parser.add_argument("--mode", choices=["white_vs_ai", "black_vs_ai"], default="white_vs_ai")
+    parser.add_argument("--think", type=float, default=5.0, help="mean seconds before each client move")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
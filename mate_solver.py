@@ -0,0 +1,294 @@
+import argparse
+import os
+import re
+import time
+
+# The rules core imports pygame; the solver never opens a window or plays sound.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from analysis import move_san
+from moves import move_start, move_end, move_promotion
+from position import Position
+from util import KING, PROMOTION_CODES, fen_piece_map
+
+INFINITY = 1 << 30                # Proof / disproof number of a solved node
+MAX_TABLE_ENTRIES = 1 << 20       # Table size before the least searched entries are dropped
+DEFAULT_MAX_NODES = 2_000_000     # Expanded nodes before a puzzle is given up as unknown
+
+# SAN as written in puzzle files: piece, optional disambiguation, optional capture, square, promotion.
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+
+class NodeLimit(Exception):
+    """Raised inside the search when the node budget is used up."""
+
+
+class MateSolver:
+    """
+    Depth-first proof-number search for a forced mate. A node is a position
+    with the number of plies left; the attacker's positions are OR nodes
+    (one mating move proves them) and the defender's are AND nodes (every
+    reply must be mated). Each node has a proof number and a disproof number,
+    the least number of leaves still to be solved to prove or refute it, and
+    the search always expands the most-proving node within thresholds, so
+    effort goes to forcing lines (checks against few replies) instead of
+    being spread over the whole tree as in alpha-beta.
+
+    Numbers are kept in a table keyed by (hash, plies left). When it grows
+    past max_entries the half with the least search work under it is
+    dropped, so memory stays bounded and only cheap work has to be redone.
+    """
+    def __init__(self, max_entries=MAX_TABLE_ENTRIES, max_nodes=DEFAULT_MAX_NODES):
+        self.max_entries = max_entries
+        self.max_nodes = max_nodes
+        self.table = {}  # (hash, plies) -> (proof number, disproof number, work)
+        self.nodes = 0
+
+    def solve(self, position, mate_in):
+        """
+        Tries to prove that the side to move mates within `mate_in` moves.
+        Returns (result, line): result is True (mate found, line is the proof
+        as packed moves), False (no such mate) or None (node limit reached).
+        The position is left unchanged.
+        """
+        self.nodes = 0
+        plies = 2 * mate_in - 1
+        pn, dn = self.evaluate(position, plies, True)
+        try:
+            if pn and dn:
+                pn, dn = self.mid(position, plies, True, INFINITY, INFINITY)
+        except NodeLimit:
+            return None, []
+        if pn == 0:
+            return True, self.proof_line(position, plies)
+        return False, []
+
+    def evaluate(self, position, plies, or_node):
+        """Initial (proof, disproof) numbers of a node, exact for mates, stalemates and the depth limit."""
+        if or_node:
+            return 1, 1  # Whether the attacker still has a move is found when the node is expanded.
+        moves = position.generate_moves()
+        in_check = position.is_in_check()
+        if not moves:
+            return (0, INFINITY) if in_check else (INFINITY, 0)
+        if plies == 0:
+            return INFINITY, 0  # Out of moves without mating.
+        # A defender with few replies is quicker to prove, and one in check more likely to be mated.
+        return (len(moves) if in_check else 2 * len(moves)), 1
+
+    def children(self, position, plies, or_node):
+        """[(packed move, table key, pn, dn)] for the moves worth searching from this node."""
+        children = []
+        table = self.table
+        for move in position.generate_moves():
+            undo = position.make_packed_move(move)
+            # With one ply left only a check can mate.
+            if not (or_node and plies == 1 and not position.is_in_check()):
+                key = (position.hash, plies - 1)
+                entry = table.get(key)
+                if entry is None:
+                    pn, dn = self.evaluate(position, plies - 1, not or_node)
+                    table[key] = (pn, dn, 0)
+                else:
+                    pn, dn = entry[0], entry[1]
+                children.append([move, key, pn, dn])
+            position.unmake_move(undo)
+        return children
+
+    def mid(self, position, plies, or_node, threshold_pn, threshold_dn):
+        """Searches the node until its proof or disproof number reaches the threshold; returns (pn, dn)."""
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise NodeLimit()
+        key = (position.hash, plies)
+        work_start = self.nodes
+        children = self.children(position, plies, or_node)
+        if not children:
+            pn, dn = INFINITY, 0  # The attacker has no move, or no checking move with one ply left.
+        while children:
+            # An OR node needs one proven child and all children refuted; an AND node the reverse.
+            best = second = None
+            if or_node:
+                pn, dn = INFINITY, 0
+                for child in children:
+                    dn = min(dn + child[3], INFINITY)
+                    if child[2] < pn:
+                        pn, second, best = child[2], pn, child
+                    elif second is None or child[2] < second:
+                        second = child[2]
+            else:
+                pn, dn = 0, INFINITY
+                for child in children:
+                    pn = min(pn + child[2], INFINITY)
+                    if child[3] < dn:
+                        dn, second, best = child[3], dn, child
+                    elif second is None or child[3] < second:
+                        second = child[3]
+            if pn >= threshold_pn or dn >= threshold_dn:
+                break
+            second = INFINITY if second is None else second
+            if or_node:
+                child_pn = min(threshold_pn, second + 1)
+                child_dn = INFINITY if threshold_dn >= INFINITY else threshold_dn - dn + best[3]
+            else:
+                child_dn = min(threshold_dn, second + 1)
+                child_pn = INFINITY if threshold_pn >= INFINITY else threshold_pn - pn + best[2]
+            undo = position.make_packed_move(best[0])
+            best[2], best[3] = self.mid(position, plies - 1, not or_node, child_pn, child_dn)
+            position.unmake_move(undo)
+
+        previous = self.table.get(key)
+        self.table[key] = (pn, dn, self.nodes - work_start + (previous[2] if previous else 0))
+        if len(self.table) > self.max_entries:
+            self.collect()
+        return pn, dn
+
+    def collect(self):
+        """Drops the half of the table with the least search work under it."""
+        works = sorted(entry[2] for entry in self.table.values())
+        cutoff = works[len(works) // 2]
+        for key in [key for key, entry in self.table.items() if entry[2] <= cutoff]:
+            del self.table[key]
+
+    def proof_line(self, position, plies):
+        """
+        The proven line as packed moves: a mating move at each attacker turn
+        and the defence that took the most work to refute at each defender turn.
+        Stops early if the table no longer holds the rest of the proof.
+        """
+        line = []
+        undos = []
+        or_node = True
+        while plies > 0:
+            best = None
+            for move in position.generate_moves():
+                undo = position.make_packed_move(move)
+                entry = self.table.get((position.hash, plies - 1))
+                position.unmake_move(undo)
+                if entry is not None and entry[0] == 0 and (best is None or (not or_node and entry[2] > best[1])):
+                    best = (move, entry[2])
+                    if or_node:
+                        break
+            if best is None:
+                break
+            line.append(best[0])
+            undos.append(position.make_packed_move(best[0]))
+            plies -= 1
+            or_node = not or_node
+        while undos:
+            position.unmake_move(undos.pop())
+        return line
+
+
+def san_matches(position, move, san):
+    """Whether a packed move is the one written as `san` (e.g. 'Qxh7+', 'exd8=Q', 'O-O') in a puzzle file."""
+    san = san.rstrip("+#!?")
+    start, end = move_start(move), move_end(move)
+    piece = position.board[start[0]][start[1]]
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        return (piece & 7) == KING and end[1] - start[1] == (2 if len(san) == 3 else -2)
+    match = SAN_PATTERN.match(san)
+    if not match:
+        return False
+    letter, from_file, from_rank, square, promotion = match.groups()
+    if (piece & 7) != fen_piece_map[letter or 'P'] & 7:
+        return False
+    if (end[1], end[0]) != (ord(square[0]) - 97, 8 - int(square[1])):
+        return False
+    if from_file and start[1] != ord(from_file) - 97 or from_rank and start[0] != 8 - int(from_rank):
+        return False
+    return (PROMOTION_CODES.get(move_promotion(move)) if move_promotion(move) else None) == promotion
+
+
+def parse_epd(line):
+    """(fen, {operation: value}) from an EPD line, e.g. '... w - - bm Qh7+; dm 3; id "mate 1";'."""
+    fields = line.split(None, 4)
+    fen = " ".join(fields[:4]) + " 0 1"
+    operations = {}
+    if len(fields) > 4:
+        for operation in fields[4].split(";"):
+            name, _, value = operation.strip().partition(" ")
+            if name:
+                operations[name] = value.strip().strip('"')
+    return fen, operations
+
+
+def solve_puzzle(solver, fen, mate_in):
+    """Runs the solver on one position; returns (result, line, line as notation, nodes, seconds)."""
+    position = Position.from_fen(fen)
+    started = time.perf_counter()
+    result, line = solver.solve(position, mate_in)
+    seconds = time.perf_counter() - started
+    notation = []
+    undos = []
+    for move in line:
+        notation.append(move_san(position, move))
+        undos.append(position.make_packed_move(move))
+    while undos:
+        position.unmake_move(undos.pop())
+    return result, line, notation, solver.nodes, seconds
+
+
+def run_epd(path, mate_in, max_nodes, max_entries):
+    """Streams through an EPD file printing one result per puzzle, then a summary."""
+    solved = failed = unknown = wrong = 0
+    total_nodes = 0
+    total_seconds = 0.0
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fen, operations = parse_epd(line)
+            n = int(operations.get("dm", mate_in))
+            name = operations.get("id", f"#{number}")
+            solver = MateSolver(max_entries, max_nodes)
+            result, line_moves, notation, nodes, seconds = solve_puzzle(solver, fen, n)
+            total_nodes += nodes
+            total_seconds += seconds
+            if result:
+                solved += 1
+                text = f"mate in {n}: {' '.join(notation)}"
+                if "bm" in operations:
+                    expected = operations["bm"].split()
+                    if not any(san_matches(Position.from_fen(fen), line_moves[0], san) for san in expected):
+                        wrong += 1
+                        text += f" (expected {operations['bm']})"
+            elif result is None:
+                unknown += 1
+                text = "unknown (node limit)"
+            else:
+                failed += 1
+                text = f"no mate in {n}"
+            print(f"{name}: {text}, {nodes} nodes, {seconds * 1000:.1f} ms", flush=True)
+    puzzles = solved + failed + unknown
+    print(f"\n{puzzles} puzzles: {solved} mates found ({wrong} not the listed best move), {failed} no mate, "
+          f"{unknown} unknown")
+    if total_seconds:
+        print(f"{total_nodes} nodes in {total_seconds:.2f} s ({total_nodes / total_seconds:.0f} nodes/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prove or refute forced mates with proof-number search.")
+    parser.add_argument("fen", nargs="?", help="position to solve")
+    parser.add_argument("--mate", type=int, default=3, metavar="N",
+                        help="moves to mate in (EPD puzzles with a 'dm' operation use their own)")
+    parser.add_argument("--epd", metavar="PATH", help="solve every puzzle in an EPD file")
+    parser.add_argument("--max-nodes", type=int, default=DEFAULT_MAX_NODES, help="give up on a puzzle after this many nodes")
+    parser.add_argument("--max-entries", type=int, default=MAX_TABLE_ENTRIES, help="proof table size limit")
+    args = parser.parse_args()
+    if args.epd:
+        run_epd(args.epd, args.mate, args.max_nodes, args.max_entries)
+    elif args.fen:
+        solver = MateSolver(args.max_entries, args.max_nodes)
+        result, line, notation, nodes, seconds = solve_puzzle(solver, args.fen, args.mate)
+        text = {True: f"Mate in {args.mate}: {' '.join(notation)}", False: f"No mate in {args.mate}",
+                None: "Unknown (node limit reached)"}[result]
+        print(f"{text}\n{nodes} nodes, {seconds * 1000:.1f} ms")
+    else:
+        parser.error("give a FEN or --epd")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_INTERVAL = 60.0  # Seconds between allocation snapshots
+DEFAULT_TOP = 10         # Growth sites listed per report
+TRACE_FRAMES = 1         # Frames kept per allocation; one is enough to group by file and line
+
+# Allocations made by the profiler itself or by the import machinery are not ours to fix.
+IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>",
+                 "<unknown>")
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss()  # Best available elsewhere
+
+
+def peak_rss():
+    """Highest resident set size of this process so far in bytes, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, kilobytes elsewhere
+
+
+def format_bytes(size):
+    if size is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class MemoryProfiler:
+    """
+    Follows the memory of a long run with tracemalloc. tick() takes an
+    allocation snapshot every `interval` seconds and prints the `top` file and
+    line sites that grew most since the first snapshot, which is where a leak
+    shows up. sample() is cheap enough to call every ply: it tracks the peak
+    resident set size of the current game, which new_game() starts afresh
+    (the process peak from getrusage cannot be reset between games).
+    """
+    def __init__(self, interval=DEFAULT_INTERVAL, top=DEFAULT_TOP, out=sys.stdout):
+        self.interval = interval
+        self.top = top
+        self.out = out
+        self.baseline = None
+        self.last_snapshot_at = 0.0
+        self.snapshots_taken = 0
+        self.game_peak = 0
+        self.started_tracing = False  # Whether start() turned tracemalloc on, so stop() should turn it off
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self.started_tracing = True
+        self.baseline = self.snapshot()
+        self.last_snapshot_at = time.perf_counter()
+        self.new_game()
+
+    def stop(self):
+        """Stops tracing if start() began it; tracing started elsewhere (e.g. -X tracemalloc) is left on."""
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def snapshot(self):
+        self.snapshots_taken += 1
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, name) for name in IGNORED_FILES])
+
+    def new_game(self):
+        self.game_peak = current_rss() or 0
+
+    def sample(self):
+        rss = current_rss()
+        if rss is not None and rss > self.game_peak:
+            self.game_peak = rss
+
+    def tick(self):
+        """Prints a growth report if `interval` seconds have passed since the last one."""
+        self.sample()
+        if time.perf_counter() - self.last_snapshot_at >= self.interval:
+            self.report()
+
+    def growth(self, snapshot=None):
+        """The `top` biggest allocation increases since start() as tracemalloc StatisticDiffs."""
+        snapshot = snapshot or self.snapshot()
+        stats = snapshot.compare_to(self.baseline, "lineno")
+        return [stat for stat in stats if stat.size_diff > 0][:self.top]
+
+    def report(self):
+        self.last_snapshot_at = time.perf_counter()
+        current, peak = tracemalloc.get_traced_memory()
+        print(f"Memory: traced {format_bytes(current)} (peak {format_bytes(peak)}), "
+              f"RSS {format_bytes(current_rss())} (peak {format_bytes(peak_rss())})", file=self.out)
+        for stat in self.growth():
+            frame = stat.traceback[0]
+            print(f"  {format_bytes(stat.size_diff):>10} {stat.count_diff:+8d} blocks  "
+                  f"{frame.filename}:{frame.lineno}", file=self.out)
+        self.out.flush()
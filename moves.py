@@ -0,0 +1,94 @@
+from array import array
+from util import KNIGHT, BISHOP, ROOK, QUEEN
+
+# A move packed into 16 bits:
+#   bits 0-5   start square (row * 8 + col)
+#   bits 6-11  end square
+#   bits 12-14 promotion piece type (0 when the move is not a promotion)
+#   bit 15     special flag: set for en passant captures and castling
+END_SHIFT = 6
+PROMOTION_SHIFT = 12
+SPECIAL_FLAG = 1 << 15
+SQUARE_MASK = 63
+
+# No legal chess position has more than 218 moves.
+MAX_MOVES = 256
+
+# Kinds of move, combinable as a bit set, so a generator can be asked for one stage at a
+# time: captures (including en passant and capturing promotions), promotions that do not
+# capture, and all remaining quiet moves (castling among them).
+CAPTURES = 1
+PROMOTIONS = 2
+QUIETS = 4
+ALL_MOVES = CAPTURES | PROMOTIONS | QUIETS
+
+# Promotions are generated strongest first.
+PROMOTION_ORDER = [QUEEN, ROOK, BISHOP, KNIGHT]
+
+INDEX_SQUARE = [(r, c) for r in range(8) for c in range(8)]
+SQUARE_INDEX = {sq: i for i, sq in enumerate(INDEX_SQUARE)}
+# Start and end square bits by (row, col), so packing a move is two lookups and an or.
+START_BITS = SQUARE_INDEX
+END_BITS = {sq: i << END_SHIFT for sq, i in SQUARE_INDEX.items()}
+
+
+def encode_move(start, end, promotion=None, special=False):
+    move = START_BITS[start] | END_BITS[end]
+    if promotion:
+        move |= promotion << PROMOTION_SHIFT
+    if special:
+        move |= SPECIAL_FLAG
+    return move
+
+
+def move_start(move):
+    return INDEX_SQUARE[move & SQUARE_MASK]
+
+
+def move_end(move):
+    return INDEX_SQUARE[(move >> END_SHIFT) & SQUARE_MASK]
+
+
+def move_promotion(move):
+    """The promotion piece type, or None."""
+    return ((move >> PROMOTION_SHIFT) & 7) or None
+
+
+def is_special(move):
+    return bool(move & SPECIAL_FLAG)
+
+
+def move_to_tuple(move):
+    """Converts a packed move to the ((start_row, start_col), (end_row, end_col)) form the GUI uses."""
+    return INDEX_SQUARE[move & SQUARE_MASK], INDEX_SQUARE[(move >> END_SHIFT) & SQUARE_MASK]
+
+
+def tuple_to_move(move, promotion=None, special=False):
+    start, end = move
+    return encode_move(start, end, promotion, special)
+
+
+def new_move_buffer():
+    """A zero-filled array('H') able to hold the moves of any position."""
+    return array('H', bytes(2 * MAX_MOVES))
+
+
+class MoveStack:
+    """
+    Preallocated move buffers, one array('H') per ply. A search generates the
+    moves of every node straight into the buffer of its ply and reuses it at
+    each node it visits there, so move generation allocates no list per node.
+    buffer.tobytes() is a cheap way to hand a move list to another process.
+    """
+    def __init__(self, max_ply):
+        self.buffers = [new_move_buffer() for _ in range(max_ply)]
+        self.counts = [0] * max_ply
+
+    def generate(self, position, ply):
+        """Fills the buffer for `ply` with the legal moves of `position` and returns how many there are."""
+        count = position.generate_packed_moves(self.buffers[ply])
+        self.counts[ply] = count
+        return count
+
+    def moves(self, ply):
+        return self.buffers[ply][:self.counts[ply]]
@@ -0,0 +1,218 @@
+import argparse
+
+import numpy as np
+
+from util import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, CASTLING_ROOK_MOVES
+
+# HalfKP-style inputs: for each side ("perspective") one feature per
+# (own king square, non-king piece, square), with the board mirrored for
+# Black so both perspectives share the same weights.
+PIECE_TYPES = [PAWN, KNIGHT, BISHOP, ROOK, QUEEN]
+PIECE_BUCKETS = 2 * len(PIECE_TYPES)  # own pieces, then the opponent's
+NUM_FEATURES = 64 * PIECE_BUCKETS * 64
+DEFAULT_HIDDEN = 128
+DEFAULT_L1 = 32
+EVAL_SCALE = 100  # The network outputs pawns; the search works in centipawns.
+MAX_PLY = 128
+
+PERSPECTIVES = {WHITE: 0, BLACK: 1}
+WEIGHT_NAMES = ["ft_weight", "ft_bias", "l1_weight", "l1_bias", "out_weight", "out_bias"]
+
+
+def _orient(perspective, sq):
+    index = sq[0] * 8 + sq[1]
+    return index if perspective == WHITE else index ^ 56
+
+
+# KING_OFFSETS[perspective][king square] + PIECE_SQUARE_FEATURES[perspective][piece][square]
+# is the feature index, so an update is two dict lookups and an add.
+KING_OFFSETS = {p: {(r, c): _orient(p, (r, c)) * PIECE_BUCKETS * 64 for r in range(8) for c in range(8)}
+                for p in (WHITE, BLACK)}
+PIECE_SQUARE_FEATURES = {
+    p: {color | piece_type: {(r, c): ((0 if color == p else len(PIECE_TYPES)) + i) * 64 + _orient(p, (r, c))
+                             for r in range(8) for c in range(8)}
+        for color in (WHITE, BLACK) for i, piece_type in enumerate(PIECE_TYPES)}
+    for p in (WHITE, BLACK)}
+
+
+def active_features(position, perspective):
+    """Feature indices of every non-king piece on the board as seen from `perspective`."""
+    offset = KING_OFFSETS[perspective][position.king_pos[perspective]]
+    table = PIECE_SQUARE_FEATURES[perspective]
+    return [offset + table[piece][sq]
+            for color in (WHITE, BLACK)
+            for sq, piece in position.pieces[color].items()
+            if (piece & 7) != KING]
+
+
+class Network:
+    """
+    Feature transformer (NUM_FEATURES -> hidden, per perspective), then
+    clipped ReLU, a hidden layer of l1 units with clipped ReLU and a single
+    output. The side to move's accumulator always comes first.
+    """
+    def __init__(self, ft_weight, ft_bias, l1_weight, l1_bias, out_weight, out_bias):
+        self.ft_weight = np.ascontiguousarray(ft_weight, dtype=np.float32)
+        self.ft_bias = np.asarray(ft_bias, dtype=np.float32)
+        self.l1_weight = np.asarray(l1_weight, dtype=np.float32)
+        self.l1_bias = np.asarray(l1_bias, dtype=np.float32)
+        self.out_weight = np.asarray(out_weight, dtype=np.float32).reshape(-1)
+        self.out_bias = float(np.asarray(out_bias).reshape(-1)[0])
+        self.hidden = self.ft_bias.shape[0]
+        if self.ft_weight.shape != (NUM_FEATURES, self.hidden):
+            raise ValueError(f"ft_weight must have shape {(NUM_FEATURES, self.hidden)}, got {self.ft_weight.shape}")
+        if self.l1_weight.shape[0] != 2 * self.hidden or self.l1_weight.shape[1] != self.l1_bias.shape[0]:
+            raise ValueError(f"l1_weight shape {self.l1_weight.shape} does not fit hidden size {self.hidden}")
+        if self.out_weight.shape[0] != self.l1_bias.shape[0]:
+            raise ValueError(f"out_weight must have {self.l1_bias.shape[0]} entries, got {self.out_weight.shape[0]}")
+        self._input = np.empty(2 * self.hidden, dtype=np.float32)
+
+    def forward(self, us, them):
+        """Evaluates one pair of accumulators; returns centipawns for the side to move."""
+        x = self._input
+        x[:self.hidden] = us
+        x[self.hidden:] = them
+        np.clip(x, 0.0, 1.0, out=x)
+        h = x @ self.l1_weight
+        h += self.l1_bias
+        np.clip(h, 0.0, 1.0, out=h)
+        return float(h @ self.out_weight + self.out_bias) * EVAL_SCALE
+
+    def refresh_batch(self, positions):
+        """
+        Full accumulator refresh for many positions at once: one gather of
+        every active feature row and one segmented sum. Returns an array of
+        shape (len(positions), 2, hidden) indexed by PERSPECTIVES.
+        """
+        indices = []
+        counts = []
+        for position in positions:
+            for perspective in (WHITE, BLACK):
+                features = active_features(position, perspective)
+                indices.extend(features)
+                counts.append(len(features))
+        result = np.empty((len(counts), self.hidden), dtype=np.float32)
+        result[:] = self.ft_bias
+        if indices:
+            counts = np.asarray(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            nonempty = counts > 0
+            # reduceat cannot express empty segments, so only the non-empty ones are summed.
+            sums = np.add.reduceat(self.ft_weight[indices], starts[nonempty], axis=0)
+            result[nonempty] += sums
+        return result.reshape(len(positions), 2, self.hidden)
+
+    def evaluate_batch(self, positions):
+        """Centipawn scores for the side to move in each position, computed without an Accumulator."""
+        accumulators = self.refresh_batch(positions)
+        movers = np.array([PERSPECTIVES[position.color] for position in positions], dtype=np.intp)
+        rows = np.arange(len(positions))
+        x = np.concatenate((accumulators[rows, movers], accumulators[rows, 1 - movers]), axis=1)
+        np.clip(x, 0.0, 1.0, out=x)
+        h = np.clip(x @ self.l1_weight + self.l1_bias, 0.0, 1.0)
+        return (h @ self.out_weight + self.out_bias) * EVAL_SCALE
+
+
+class Accumulator:
+    """
+    The first-layer sums for both perspectives, one row per search ply.
+    push() is called after Position.make_move with its undo record and only
+    adds or subtracts the weight rows of the pieces that moved; a king move
+    changes every feature of its own perspective, so that side is refreshed.
+    pop() goes back to the previous ply with no arithmetic at all.
+    """
+    def __init__(self, network, max_ply=MAX_PLY):
+        self.network = network
+        self.values = np.zeros((max_ply + 1, 2, network.hidden), dtype=np.float32)
+        self.ply = 0
+
+    def refresh(self, position):
+        """Recomputes both perspectives of the current ply from scratch."""
+        for perspective, index in PERSPECTIVES.items():
+            self._refresh_perspective(position, perspective, self.values[self.ply, index])
+
+    def _refresh_perspective(self, position, perspective, out):
+        features = active_features(position, perspective)
+        out[:] = self.network.ft_bias
+        if features:
+            out += self.network.ft_weight[features].sum(axis=0)
+
+    def push(self, position, undo):
+        start, end, piece = undo[0], undo[1], undo[2]
+        captured, captured_sq = undo[8], undo[9]
+        self.values[self.ply + 1] = self.values[self.ply]
+        self.ply += 1
+
+        removed = [(piece, start)]
+        added = [(position.board[end[0]][end[1]], end)]
+        if captured:
+            removed.append((captured, captured_sq))
+        mover = piece & 24
+        king_moved = (piece & 7) == KING
+        if king_moved:
+            removed.pop(0)
+            added.pop(0)
+            if abs(end[1] - start[1]) == 2:
+                rook_from, rook_to = CASTLING_ROOK_MOVES[start][end]
+                rook = position.board[rook_to[0]][rook_to[1]]
+                removed.append((rook, rook_from))
+                added.append((rook, rook_to))
+
+        weights = self.network.ft_weight
+        for perspective, index in PERSPECTIVES.items():
+            row = self.values[self.ply, index]
+            if king_moved and perspective == mover:
+                self._refresh_perspective(position, perspective, row)
+                continue
+            offset = KING_OFFSETS[perspective][position.king_pos[perspective]]
+            table = PIECE_SQUARE_FEATURES[perspective]
+            for p, sq in removed:
+                row -= weights[offset + table[p][sq]]
+            for p, sq in added:
+                row += weights[offset + table[p][sq]]
+
+    def pop(self):
+        self.ply -= 1
+
+    def evaluate(self, color):
+        """Centipawns from the point of view of `color`, the side to move."""
+        values = self.values[self.ply]
+        us = PERSPECTIVES[color]
+        return self.network.forward(values[us], values[1 - us])
+
+
+def load_network(path):
+    """Loads weights saved by save_network (a NumPy .npz file with the WEIGHT_NAMES arrays)."""
+    with np.load(path) as data:
+        missing = [name for name in WEIGHT_NAMES if name not in data]
+        if missing:
+            raise ValueError(f"{path} is missing weights: {', '.join(missing)}")
+        return Network(*(data[name] for name in WEIGHT_NAMES))
+
+
+def save_network(network, path):
+    np.savez(path, ft_weight=network.ft_weight, ft_bias=network.ft_bias, l1_weight=network.l1_weight,
+             l1_bias=network.l1_bias, out_weight=network.out_weight, out_bias=np.array([network.out_bias]))
+
+
+def random_network(hidden=DEFAULT_HIDDEN, l1=DEFAULT_L1, seed=0):
+    """Small random weights, for testing the plumbing before trained weights exist."""
+    rng = np.random.default_rng(seed)
+    return Network(rng.normal(0, 0.05, (NUM_FEATURES, hidden)), np.full(hidden, 0.5),
+                   rng.normal(0, 1 / np.sqrt(2 * hidden), (2 * hidden, l1)), np.zeros(l1),
+                   rng.normal(0, 1 / np.sqrt(l1), l1), np.zeros(1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a weights file for the neural evaluation.")
+    parser.add_argument("path", help="where to write the .npz weights")
+    parser.add_argument("--hidden", type=int, default=DEFAULT_HIDDEN, help="accumulator size per perspective")
+    parser.add_argument("--l1", type=int, default=DEFAULT_L1, help="hidden layer size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    save_network(random_network(args.hidden, args.l1, args.seed), args.path)
+    print(f"Wrote random {NUM_FEATURES}x{args.hidden} network to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
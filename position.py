@@ -0,0 +1,674 @@
+from collections import OrderedDict
+import random
+import stats
+from moves import (START_BITS, END_BITS, INDEX_SQUARE, PROMOTION_SHIFT, PROMOTION_ORDER, SPECIAL_FLAG,
+                   END_SHIFT, SQUARE_MASK, CAPTURES, PROMOTIONS, QUIETS, ALL_MOVES, new_move_buffer)
+from util import (EMPTY, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_VALUES,
+                  CASTLING_ROOK_MOVES, FLAGS_TO_CASTLING, fen_piece_map, parse_fen, encode_position, decode_position,
+                  generate_fen, moved_positions_from_castling)
+
+# Castling right lost when a piece moves from or to each corner square.
+CORNER_RIGHTS = {(7, 7): 'K', (7, 0): 'Q', (0, 7): 'k', (0, 0): 'q'}
+KING_RIGHTS = {WHITE: "KQ", BLACK: "kq"}
+# Castling right needed for each castling king move.
+CASTLE_RIGHT = {((7, 4), (7, 6)): 'K', ((7, 4), (7, 2)): 'Q', ((0, 4), (0, 6)): 'k', ((0, 4), (0, 2)): 'q'}
+
+# Precomputed geometry, indexed by (row, col) square.
+ROOK_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+PIECE_DIRECTIONS = {BISHOP: BISHOP_DIRECTIONS, ROOK: ROOK_DIRECTIONS, QUEEN: ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+# Slider types that attack along each direction.
+SLIDERS = {d: (ROOK, QUEEN) for d in ROOK_DIRECTIONS}
+SLIDERS.update({d: (BISHOP, QUEEN) for d in BISHOP_DIRECTIONS})
+
+def _on_board(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+def _targets(sq, offsets):
+    return [(sq[0] + dr, sq[1] + dc) for dr, dc in offsets if _on_board(sq[0] + dr, sq[1] + dc)]
+
+def _ray(sq, direction):
+    squares = []
+    r, c = sq[0] + direction[0], sq[1] + direction[1]
+    while _on_board(r, c):
+        squares.append((r, c))
+        r, c = r + direction[0], c + direction[1]
+    return squares
+
+ALL_SQUARES = [(r, c) for r in range(8) for c in range(8)]
+KNIGHT_TARGETS = {sq: _targets(sq, [(-2, -1), (-1, -2), (1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1)])
+                  for sq in ALL_SQUARES}
+KING_TARGETS = {sq: _targets(sq, [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc])
+                for sq in ALL_SQUARES}
+# Squares along each direction from a square, nearest first.
+RAYS = {sq: {d: _ray(sq, d) for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS} for sq in ALL_SQUARES}
+# Squares a pawn of each colour would have to stand on to attack a square.
+PAWN_ATTACKERS = {WHITE: {sq: _targets(sq, [(1, -1), (1, 1)]) for sq in ALL_SQUARES},
+                  BLACK: {sq: _targets(sq, [(-1, -1), (-1, 1)]) for sq in ALL_SQUARES}}
+
+# Zobrist keys: a position's hash is the xor of the keys for each piece on its
+# square, the castling rights, the en passant file and the side to move. The
+# generator is seeded so hashes are stable across runs and can be stored.
+_zobrist_random = random.Random(20240611)
+ZOBRIST_PIECES = {piece: {sq: _zobrist_random.getrandbits(64) for sq in ALL_SQUARES}
+                  for piece in fen_piece_map.values()}
+ZOBRIST_CASTLING = {rights: _zobrist_random.getrandbits(64) for rights in FLAGS_TO_CASTLING}
+ZOBRIST_CASTLING['-'] = 0
+_ep_file_keys = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_EN_PASSANT = {(r, c): _ep_file_keys[c] for r in (2, 5) for c in range(8)}
+ZOBRIST_EN_PASSANT[None] = 0
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+
+# get_pseudo_legal_moves takes castling state as a set of moved squares; build it once per rights string.
+_moved_positions_cache = {}
+
+
+# Legal move tables of recently seen positions, by hash; see Position.move_table.
+MOVE_TABLE_CACHE_SIZE = 256
+_move_tables = OrderedDict()
+
+
+def moved_positions_for(castling):
+    moved = _moved_positions_cache.get(castling)
+    if moved is None:
+        moved = _moved_positions_cache[castling] = frozenset(moved_positions_from_castling(castling))
+    return moved
+
+
+class Position:
+    """
+    A board together with per-colour piece lists, king squares, material
+    counts and Zobrist hashes of the position and of its pawns alone.
+    make_move / unmake_move keep all of them in step with the board,
+    so move generation and game status checks only visit squares that hold
+    pieces instead of scanning the whole 8x8 board.
+
+    The board is shared, not copied: the position mutates the list it is given.
+    """
+    def __init__(self, board, active_color='w', castling='-', en_passant_target=None, halfmove=0, fullmove=1):
+        self.board = board
+        self.color = WHITE if active_color == 'w' else BLACK
+        self.castling = castling
+        self.en_passant_target = en_passant_target
+        self.halfmove = halfmove
+        self.fullmove = fullmove
+        self.pieces = {WHITE: {}, BLACK: {}}  # square -> piece code
+        self.king_pos = {WHITE: None, BLACK: None}
+        self.material = {WHITE: 0, BLACK: 0}
+        self.hash = ZOBRIST_CASTLING[castling] ^ ZOBRIST_EN_PASSANT[en_passant_target]
+        self.pawn_hash = 0  # Zobrist key of the pawns alone, for the search's pawn structure table
+        if self.color == BLACK:
+            self.hash ^= ZOBRIST_BLACK
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] != EMPTY:
+                    self._add((r, c), board[r][c])
+
+    @classmethod
+    def from_fen(cls, fen):
+        return cls(*parse_fen(fen))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(*decode_position(data))
+
+    def to_fen(self):
+        active_color = 'w' if self.color == WHITE else 'b'
+        return generate_fen(self.board, active_color, self.castling, self.en_passant_target,
+                            self.halfmove, self.fullmove)
+
+    def to_bytes(self):
+        active_color = 'w' if self.color == WHITE else 'b'
+        return encode_position(self.board, active_color, self.castling, self.en_passant_target,
+                               self.halfmove, self.fullmove)
+
+    @property
+    def moved_positions(self):
+        return moved_positions_for(self.castling)
+
+    #############################################
+    #         PIECE LISTS                     #
+    #############################################
+
+    def _add(self, sq, piece):
+        color = piece & 24
+        self.pieces[color][sq] = piece
+        self.hash ^= ZOBRIST_PIECES[piece][sq]
+        if (piece & 7) == KING:
+            self.king_pos[color] = sq
+        else:
+            self.material[color] += PIECE_VALUES[piece & 7]
+            if (piece & 7) == PAWN:
+                self.pawn_hash ^= ZOBRIST_PIECES[piece][sq]
+
+    def _remove(self, sq):
+        piece = self.board[sq[0]][sq[1]]
+        color = piece & 24
+        del self.pieces[color][sq]
+        self.hash ^= ZOBRIST_PIECES[piece][sq]
+        if (piece & 7) != KING:
+            self.material[color] -= PIECE_VALUES[piece & 7]
+            if (piece & 7) == PAWN:
+                self.pawn_hash ^= ZOBRIST_PIECES[piece][sq]
+        return piece
+
+    def put_piece(self, sq, piece):
+        """Places a piece on an empty square."""
+        self._add(sq, piece)
+        self.board[sq[0]][sq[1]] = piece
+
+    def remove_piece(self, sq):
+        """Removes and returns the piece on a square."""
+        piece = self._remove(sq)
+        self.board[sq[0]][sq[1]] = EMPTY
+        return piece
+
+    def move_piece(self, start, end):
+        """Moves a piece to an empty square."""
+        piece = self.board[start[0]][start[1]]
+        pieces = self.pieces[piece & 24]
+        del pieces[start]
+        pieces[end] = piece
+        keys = ZOBRIST_PIECES[piece]
+        self.hash ^= keys[start] ^ keys[end]
+        if (piece & 7) == KING:
+            self.king_pos[piece & 24] = end
+        elif (piece & 7) == PAWN:
+            self.pawn_hash ^= keys[start] ^ keys[end]
+        self.board[start[0]][start[1]] = EMPTY
+        self.board[end[0]][end[1]] = piece
+
+    def iter_pieces(self, color):
+        """Yields (square, piece) for every piece of the given colour."""
+        return iter(list(self.pieces[color].items()))
+
+    def piece_count(self, color=None):
+        if color is None:
+            return len(self.pieces[WHITE]) + len(self.pieces[BLACK])
+        return len(self.pieces[color])
+
+    #############################################
+    #         MAKE / UNMAKE                   #
+    #############################################
+
+    def make_move(self, start, end, promotion=None):
+        """
+        Plays a move for the side to move, handling captures, en passant,
+        castling and promotion (to `promotion`, a piece type, or a queen by
+        default). Returns an undo record for unmake_move.
+        """
+        board = self.board
+        piece = board[start[0]][start[1]]
+        piece_type = piece & 7
+        color = piece & 24
+        undo = (start, end, piece, self.castling, self.en_passant_target, self.halfmove, self.fullmove, self.hash)
+        self.hash ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_EN_PASSANT[self.en_passant_target] ^ ZOBRIST_BLACK
+
+        captured = EMPTY
+        captured_sq = end
+        if piece_type == PAWN and end == self.en_passant_target:
+            captured_sq = (start[0], end[1])
+        if board[captured_sq[0]][captured_sq[1]] != EMPTY:
+            captured = self.remove_piece(captured_sq)
+
+        self.move_piece(start, end)
+        if piece_type == KING and abs(end[1] - start[1]) == 2:
+            rook_from, rook_to = CASTLING_ROOK_MOVES[start][end]
+            self.move_piece(rook_from, rook_to)
+        if piece_type == PAWN and (end[0] == 0 or end[0] == 7):
+            self.remove_piece(end)
+            self.put_piece(end, color | (promotion or QUEEN))
+
+        castling = self.castling
+        if castling != '-':
+            if piece_type == KING:
+                castling = castling.replace(KING_RIGHTS[color][0], '').replace(KING_RIGHTS[color][1], '')
+            for sq in (start, end):
+                if sq in CORNER_RIGHTS:
+                    castling = castling.replace(CORNER_RIGHTS[sq], '')
+            self.castling = castling or '-'
+
+        if piece_type == PAWN and abs(end[0] - start[0]) == 2:
+            self.en_passant_target = ((start[0] + end[0]) // 2, start[1])
+        else:
+            self.en_passant_target = None
+        self.halfmove = 0 if piece_type == PAWN or captured != EMPTY else self.halfmove + 1
+        if color == BLACK:
+            self.fullmove += 1
+        self.color = BLACK if color == WHITE else WHITE
+        self.hash ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_EN_PASSANT[self.en_passant_target]
+        return undo + (captured, captured_sq)
+
+    def make_packed_move(self, move):
+        """make_move for a 16-bit packed move."""
+        return self.make_move(INDEX_SQUARE[move & SQUARE_MASK], INDEX_SQUARE[(move >> END_SHIFT) & SQUARE_MASK],
+                              (move >> PROMOTION_SHIFT) & 7 or None)
+
+    def unmake_move(self, undo):
+        start, end, piece, castling, en_passant_target, halfmove, fullmove, position_hash, captured, captured_sq = undo
+        if self.board[end[0]][end[1]] != piece:
+            # Undo a promotion.
+            self.remove_piece(end)
+            self.put_piece(end, piece)
+        self.move_piece(end, start)
+        if (piece & 7) == KING and abs(end[1] - start[1]) == 2:
+            rook_from, rook_to = CASTLING_ROOK_MOVES[start][end]
+            self.move_piece(rook_to, rook_from)
+        if captured != EMPTY:
+            self.put_piece(captured_sq, captured)
+        self.castling = castling
+        self.en_passant_target = en_passant_target
+        self.halfmove = halfmove
+        self.fullmove = fullmove
+        self.color = piece & 24
+        self.hash = position_hash
+
+    def make_null_move(self):
+        """
+        Passes the turn without moving, for null-move pruning in the search.
+        Returns an undo record for unmake_null_move.
+        """
+        undo = (self.en_passant_target, self.halfmove, self.hash)
+        self.hash ^= ZOBRIST_EN_PASSANT[self.en_passant_target] ^ ZOBRIST_BLACK
+        self.en_passant_target = None
+        self.halfmove += 1
+        self.color = BLACK if self.color == WHITE else WHITE
+        return undo
+
+    def unmake_null_move(self, undo):
+        self.en_passant_target, self.halfmove, self.hash = undo
+        self.color = BLACK if self.color == WHITE else WHITE
+
+    #############################################
+    #         ATTACKS & LEGAL MOVES           #
+    #############################################
+
+    def is_square_attacked(self, sq, attacker_color):
+        """
+        Looks outward from `sq` for pawns, knights, kings and sliders of
+        `attacker_color` that reach it, so the cost does not depend on how
+        many pieces are on the board.
+        """
+        if stats.enabled:
+            stats.incr("attack_checks")
+        board = self.board
+        pawn = attacker_color | PAWN
+        for r, c in PAWN_ATTACKERS[attacker_color][sq]:
+            if board[r][c] == pawn:
+                return True
+        knight = attacker_color | KNIGHT
+        for r, c in KNIGHT_TARGETS[sq]:
+            if board[r][c] == knight:
+                return True
+        king = attacker_color | KING
+        for r, c in KING_TARGETS[sq]:
+            if board[r][c] == king:
+                return True
+        for direction, ray in RAYS[sq].items():
+            for r, c in ray:
+                piece = board[r][c]
+                if piece != EMPTY:
+                    if (piece & 24) == attacker_color and (piece & 7) in SLIDERS[direction]:
+                        return True
+                    break
+        return False
+
+    def is_in_check(self, color=None):
+        color = self.color if color is None else color
+        king_pos = self.king_pos[color]
+        if king_pos is None:
+            return False
+        return self.is_square_attacked(king_pos, BLACK if color == WHITE else WHITE)
+
+    def checks_and_pins(self, color):
+        """
+        Returns (checkers, evasion_squares, pin_rays) for the king of `color`:
+        the squares of the pieces giving check, the squares a non-king move
+        must land on to answer a single check (capturing the checker or
+        blocking it), and for every pinned piece the set of squares on its pin
+        ray it may still move along.
+        """
+        board = self.board
+        king_pos = self.king_pos[color]
+        enemy = BLACK if color == WHITE else WHITE
+        checkers = []
+        evasion = set()
+        pin_rays = {}
+        if king_pos is None:
+            return checkers, None, pin_rays
+
+        for r, c in PAWN_ATTACKERS[enemy][king_pos]:
+            if board[r][c] == enemy | PAWN:
+                checkers.append((r, c))
+                evasion.add((r, c))
+        for r, c in KNIGHT_TARGETS[king_pos]:
+            if board[r][c] == enemy | KNIGHT:
+                checkers.append((r, c))
+                evasion.add((r, c))
+
+        for direction, ray in RAYS[king_pos].items():
+            sliders = SLIDERS[direction]
+            blocker = None
+            for i, (r, c) in enumerate(ray):
+                piece = board[r][c]
+                if piece == EMPTY:
+                    continue
+                if (piece & 24) == color:
+                    if blocker is not None:
+                        break
+                    blocker = (r, c)
+                    continue
+                if (piece & 7) in sliders:
+                    if blocker is None:
+                        checkers.append((r, c))
+                        evasion.update(ray[:i + 1])
+                    else:
+                        pin_rays[blocker] = set(ray[:i + 1])
+                break
+
+        return checkers, (evasion if checkers else None), pin_rays
+
+    def generate_moves(self, origin=None, kinds=ALL_MOVES):
+        """
+        Generates the legal moves of the side to move (or only of the piece on
+        `origin`) as a list of 16-bit packed moves (see moves.py), with one
+        entry per promotion piece. `kinds` limits them to some of CAPTURES,
+        PROMOTIONS and QUIETS. Checkers and pinned pieces are found once,
+        then pinned pieces are kept to their pin ray and single-check evasions
+        to capturing or blocking squares, so only king moves and the rare en
+        passant capture need an attack test of their own.
+        """
+        if stats.enabled:
+            stats.incr("legal_move_calls")
+        buffer = new_move_buffer()
+        count = self._generate(origin, kinds, self.checks_and_pins(self.color), buffer, 0)
+        return buffer[:count].tolist()
+
+    def iter_stages(self, hash_move=0, kinds=ALL_MOVES, buffer=None):
+        """
+        Generates the legal packed moves into `buffer`, an array('H') from
+        moves.new_move_buffer (a new one if not given), in stages, yielding
+        (kind, start, end) as each stage fills buffer[start:end]: (0, 0, 1)
+        first if `hash_move` is legal here, then CAPTURES, PROMOTIONS and
+        QUIETS, leaving out the hash move. `kinds` limits the stages to some of
+        CAPTURES, PROMOTIONS and QUIETS. A stage is only generated once the
+        consumer asks for it, so a search that cuts off on an early move, or a
+        check for whether any legal move exists, never pays for the quiet
+        moves. The position may be changed between stages as long as it is
+        restored, and the buffer left alone, before the next one is asked for.
+        """
+        if stats.enabled:
+            stats.incr("legal_move_calls")
+        if buffer is None:
+            buffer = new_move_buffer()
+        checks = self.checks_and_pins(self.color)
+        count = 0
+        if hash_move:
+            start = INDEX_SQUARE[hash_move & SQUARE_MASK]
+            if (self.board[start[0]][start[1]] & 24) == self.color \
+                    and hash_move in buffer[:self._generate(start, ALL_MOVES, checks, buffer, 0)]:
+                buffer[0] = hash_move
+                count = 1
+                yield 0, 0, 1
+            else:
+                hash_move = 0
+        for stage in (CAPTURES, PROMOTIONS, QUIETS):
+            if not stage & kinds:
+                continue
+            start = count
+            count = self._generate(None, stage, checks, buffer, start)
+            if hash_move:
+                for i in range(start, count):
+                    if buffer[i] == hash_move:
+                        # Close the gap, keeping the generation order.
+                        buffer[i:count - 1] = buffer[i + 1:count]
+                        count -= 1
+                        break
+            yield stage, start, count
+
+    def iter_moves(self, hash_move=0):
+        """The legal packed moves one at a time, in the stage order of iter_stages()."""
+        buffer = new_move_buffer()
+        for _, start, end in self.iter_stages(hash_move, buffer=buffer):
+            yield from buffer[start:end]
+
+    def _generate(self, origin, kinds, checks, buffer, count):
+        """Writes the moves from buffer[count] on and returns the new count."""
+        board = self.board
+        color = self.color
+        enemy = BLACK if color == WHITE else WHITE
+        checkers, evasion, pin_rays = checks
+        ep_target = self.en_passant_target
+        quiets = kinds & QUIETS
+
+        if origin is not None:
+            squares = [(origin, board[origin[0]][origin[1]])]
+        elif kinds == PROMOTIONS:
+            # Only pawns one step from the last rank can promote.
+            row = 1 if color == WHITE else 6
+            squares = [(sq, piece) for sq, piece in self.pieces[color].items() if piece == color | PAWN and sq[0] == row]
+        else:
+            squares = list(self.pieces[color].items())
+
+        for start, piece in squares:
+            piece_type = piece & 7
+            if piece_type == KING:
+                count = self._king_moves(start, color, enemy, not checkers, kinds, buffer, count)
+                continue
+            if len(checkers) > 1:
+                continue  # Only the king can answer a double check.
+            pin_ray = pin_rays.get(start)
+            if piece_type == PAWN:
+                targets = self._pawn_targets(start, color, enemy)
+            elif piece_type == KNIGHT:
+                if pin_ray is not None:
+                    continue  # A pinned knight can never move.
+                targets = [sq for sq in KNIGHT_TARGETS[start] if (board[sq[0]][sq[1]] & 24) != color]
+            else:
+                targets = []
+                for direction in PIECE_DIRECTIONS[piece_type]:
+                    for r, c in RAYS[start][direction]:
+                        target = board[r][c]
+                        if target == EMPTY:
+                            if quiets:
+                                targets.append((r, c))
+                        else:
+                            if (target & 24) != color:
+                                targets.append((r, c))
+                            break
+
+            for end in targets:
+                promotes = piece_type == PAWN and (end[0] == 0 or end[0] == 7)
+                if board[end[0]][end[1]] != EMPTY or (piece_type == PAWN and end == ep_target):
+                    kind = CAPTURES
+                else:
+                    kind = PROMOTIONS if promotes else QUIETS
+                if not kind & kinds:
+                    continue
+                if piece_type == PAWN and end == ep_target:
+                    # Removing two pawns from one rank can expose the king; test it directly.
+                    undo = self.make_move(start, end)
+                    safe = not self.is_square_attacked(self.king_pos[color], enemy)
+                    self.unmake_move(undo)
+                    if safe:
+                        buffer[count] = START_BITS[start] | END_BITS[end] | SPECIAL_FLAG
+                        count += 1
+                    continue
+                if pin_ray is not None and end not in pin_ray:
+                    continue
+                if evasion is not None and end not in evasion:
+                    continue
+                move = START_BITS[start] | END_BITS[end]
+                if promotes:
+                    for promotion in PROMOTION_ORDER:
+                        buffer[count] = move | (promotion << PROMOTION_SHIFT)
+                        count += 1
+                else:
+                    buffer[count] = move
+                    count += 1
+        return count
+
+    def generate_packed_moves(self, buffer, origin=None):
+        """
+        Writes the packed legal moves straight into an array('H') buffer (see
+        moves.new_move_buffer) and returns how many there are.
+        """
+        if stats.enabled:
+            stats.incr("legal_move_calls")
+        return self._generate(origin, ALL_MOVES, self.checks_and_pins(self.color), buffer, 0)
+
+    def generate_legal_moves(self, origin=None):
+        """
+        Legal moves as ((start_row, start_col), (end_row, end_col)) pairs, the
+        form the GUI uses. A promotion appears once; the piece is chosen when
+        the move is played.
+        """
+        return [(INDEX_SQUARE[move & SQUARE_MASK], INDEX_SQUARE[(move >> END_SHIFT) & SQUARE_MASK])
+                for move in self.generate_moves(origin)
+                if (move >> PROMOTION_SHIFT) & 7 in (0, QUEEN)]
+
+    def _pawn_targets(self, start, color, enemy):
+        board = self.board
+        row, col = start
+        direction = -1 if color == WHITE else 1
+        targets = []
+        ahead = row + direction
+        if 0 <= ahead < 8:
+            if board[ahead][col] == EMPTY:
+                targets.append((ahead, col))
+                if row == (6 if color == WHITE else 1) and board[ahead + direction][col] == EMPTY:
+                    targets.append((ahead + direction, col))
+            for c in (col - 1, col + 1):
+                if 0 <= c < 8:
+                    if (board[ahead][c] & 24) == enemy or (ahead, c) == self.en_passant_target:
+                        targets.append((ahead, c))
+        return targets
+
+    def _king_moves(self, start, color, enemy, can_castle, kinds, buffer, count):
+        board = self.board
+        # Lift the king so sliders attacking it also cover the squares behind it.
+        king = board[start[0]][start[1]]
+        board[start[0]][start[1]] = EMPTY
+        for end in KING_TARGETS[start]:
+            target = board[end[0]][end[1]]
+            if target == EMPTY:
+                if not kinds & QUIETS:
+                    continue
+            elif (target & 24) == color or not kinds & CAPTURES:
+                continue
+            if not self.is_square_attacked(end, enemy):
+                buffer[count] = START_BITS[start] | END_BITS[end]
+                count += 1
+        board[start[0]][start[1]] = king
+        if can_castle and kinds & QUIETS:
+            for end in self.castling_moves(start):
+                buffer[count] = START_BITS[start] | END_BITS[end] | SPECIAL_FLAG
+                count += 1
+        return count
+
+    def castling_moves(self, sq):
+        """Castling destinations for the king on `sq`."""
+        moves = []
+        if self.castling == '-' or sq not in CASTLING_ROOK_MOVES:
+            return moves
+        board = self.board
+        color = board[sq[0]][sq[1]] & 24
+        enemy = BLACK if color == WHITE else WHITE
+        row, col = sq
+        in_check = None
+        for castle_end, (rook_from, rook_to) in CASTLING_ROOK_MOVES[sq].items():
+            if CASTLE_RIGHT[(sq, castle_end)] not in self.castling:
+                continue
+            if board[rook_from[0]][rook_from[1]] != (color | ROOK):
+                continue
+            step = 1 if castle_end[1] > col else -1
+            if any(board[row][c] != EMPTY for c in range(col + step, rook_from[1], step)):
+                continue
+            if in_check is None:
+                in_check = self.is_square_attacked(sq, enemy)
+            if in_check:
+                break
+            if any(self.is_square_attacked((row, col + step * i), enemy) for i in (1, 2)):
+                continue
+            moves.append(castle_end)
+        return moves
+
+    def move_table(self):
+        """
+        The legal moves of the side to move grouped by origin square, {start: (end, ...)}.
+        Tables of the last MOVE_TABLE_CACHE_SIZE positions are kept by hash, so
+        the GUI's check symbols, game status checks and piece highlighting for
+        one position share a single move generation. The table is shared; do
+        not change it.
+        """
+        table = _move_tables.get(self.hash)
+        if table is not None:
+            _move_tables.move_to_end(self.hash)
+            if stats.enabled:
+                stats.incr("move_table_hits")
+            return table
+        grouped = {}
+        for start, end in self.generate_legal_moves():
+            grouped.setdefault(start, []).append(end)
+        table = {start: tuple(ends) for start, ends in grouped.items()}
+        _move_tables[self.hash] = table
+        if len(_move_tables) > MOVE_TABLE_CACHE_SIZE:
+            _move_tables.popitem(last=False)
+        return table
+
+    def legal_moves_from(self, sq):
+        """Legal destination squares for the piece on `sq`."""
+        return self.move_table().get(sq, ())
+
+    def legal_moves(self):
+        """All legal moves for the side to move as ((start_row, start_col), (end_row, end_col))."""
+        return self.generate_legal_moves()
+
+    def has_legal_move(self):
+        """Whether the side to move has a legal move; stops at the first one unless the move table is cached."""
+        table = _move_tables.get(self.hash)
+        if table is not None:
+            if stats.enabled:
+                stats.incr("move_table_hits")
+            return bool(table)
+        if stats.enabled:
+            stats.incr("legal_move_calls")
+        checks = self.checks_and_pins(self.color)
+        buffer = new_move_buffer()
+        # Piece by piece, stopping at the first that can move.
+        return any(self._generate(sq, ALL_MOVES, checks, buffer, 0) for sq in list(self.pieces[self.color]))
+
+    #############################################
+    #         GAME STATUS                     #
+    #############################################
+
+    def is_insufficient_material(self):
+        white_pieces = []
+        black_pieces = []
+        bishop_positions = []
+        for color, types in ((WHITE, white_pieces), (BLACK, black_pieces)):
+            for sq, piece in self.pieces[color].items():
+                piece_type = piece & 7
+                if piece_type in (PAWN, ROOK, QUEEN):
+                    return False
+                types.append(piece_type)
+                if piece_type == BISHOP:
+                    bishop_positions.append(sq)
+
+        if len(white_pieces) == 1 and len(black_pieces) == 1:
+            return True
+
+        if (len(white_pieces) == 2 and white_pieces.count(KNIGHT) == 1 and len(black_pieces) == 1) or \
+           (len(black_pieces) == 2 and black_pieces.count(KNIGHT) == 1 and len(white_pieces) == 1):
+            return True
+
+        if (len(white_pieces) == 2 and white_pieces.count(BISHOP) == 1 and len(black_pieces) == 1) or \
+           (len(black_pieces) == 2 and black_pieces.count(BISHOP) == 1 and len(white_pieces) == 1):
+            return True
+
+        if len(bishop_positions) > 1:
+            first_color = (bishop_positions[0][0] + bishop_positions[0][1]) % 2
+            if all((r + c) % 2 == first_color for (r, c) in bishop_positions):
+                if all(p in (KING, BISHOP) for p in white_pieces + black_pieces):
+                    return True
+        return False
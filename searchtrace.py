@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from collections import defaultdict
+
+# Keep pygame's import banner (util imports pygame) out of the summary, which may be JSON.
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from moves import move_start, move_end, move_promotion
+from util import PROMOTION_CODES, get_algebraic_notation
+
+# Event kinds. Every event carries (kind, ply, depth, alpha, beta, value, microseconds since
+# the trace started); what `value` holds depends on the kind.
+SEARCH = 0       # A new search starts; value: number of root moves
+ITERATION = 1    # An iterative deepening iteration starts; depth: its depth
+ENTER = 2        # A node is entered; value: the packed move leading to it (0 for the root or a null move)
+EXIT = 3         # A node is left; value: its score
+QENTER = 4       # A quiescence node is entered; value as for ENTER
+QEXIT = 5        # A quiescence node is left; value: its score
+TT_HIT = 6       # The node's position is in the transposition table; depth: the entry's depth, value: its score
+CUTOFF = 7       # The node failed high; value: how many moves it had made (0 when cut off before any)
+ABORT = 8        # The search ran out of time; the open nodes are never left
+EVENT_NAMES = ["search", "iteration", "enter", "exit", "qenter", "qexit", "tt_hit", "cutoff", "abort"]
+EVENT_KINDS = {name: kind for kind, name in enumerate(EVENT_NAMES)}
+
+# Binary format: MAGIC, then fixed-size little-endian records.
+MAGIC = b"CHESSTRACE1\n"
+RECORD = struct.Struct("<BBbiiiI")
+JSONL_SUFFIX = ".jsonl"
+
+BATCH_EVENTS = 4096  # Events handed to the writer thread at a time
+MAX_BATCHES = 64     # Batches queued before the search waits for the writer
+DEFAULT_TOP = 10     # Hotspots listed by the summary
+
+
+class TraceWriter:
+    """
+    Streams search events to a file. record() only appends a tuple to the
+    current batch; full batches go through a bounded queue to a background
+    thread that encodes and writes them, so the search never waits on the
+    disk unless the writer falls MAX_BATCHES behind. Paths ending in .jsonl
+    get one JSON object per line, anything else the compact binary format
+    (RECORD.size bytes per event).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = path.endswith(JSONL_SUFFIX)
+        self.file = open(path, "w" if self.jsonl else "wb")
+        if not self.jsonl:
+            self.file.write(MAGIC)
+        self.batch = []
+        self.events = 0
+        self.started = time.perf_counter_ns()
+        self.queue = queue.Queue(MAX_BATCHES)
+        self.thread = threading.Thread(target=self.run, name="search-trace", daemon=True)
+        self.thread.start()
+
+    def record(self, kind, ply=0, depth=0, alpha=0, beta=0, value=0):
+        self.batch.append((kind, ply, depth, alpha, beta, value,
+                           (time.perf_counter_ns() - self.started) // 1000 & 0xFFFFFFFF))
+        if len(self.batch) >= BATCH_EVENTS:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.events += len(self.batch)
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            if self.jsonl:
+                self.file.write("".join(json.dumps({"event": EVENT_NAMES[e[0]], "ply": e[1], "depth": e[2],
+                                                    "alpha": e[3], "beta": e[4], "value": e[5], "us": e[6]}) + "\n"
+                                        for e in batch))
+            else:
+                self.file.write(b"".join(RECORD.pack(*e) for e in batch))
+
+    def close(self):
+        """Writes out what is buffered and closes the file."""
+        if self.file.closed:
+            return
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+def read_events(path):
+    """Yields the events of a trace file as (kind, ply, depth, alpha, beta, value, microseconds) tuples."""
+    if path.endswith(JSONL_SUFFIX):
+        with open(path) as f:
+            for line in f:
+                e = json.loads(line)
+                yield EVENT_KINDS[e["event"]], e["ply"], e["depth"], e["alpha"], e["beta"], e["value"], e["us"]
+        return
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a search trace")
+        while True:
+            chunk = f.read(RECORD.size * BATCH_EVENTS)
+            if not chunk:
+                break
+            yield from RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % RECORD.size])
+
+
+def move_name(move):
+    if not move:
+        return "null"
+    name = get_algebraic_notation(*move_start(move)) + get_algebraic_notation(*move_end(move))
+    if move_promotion(move):
+        name += PROMOTION_CODES[move_promotion(move)].lower()
+    return name
+
+
+class DepthStats:
+    """What summarize() counts for the nodes at one remaining depth."""
+    __slots__ = ("nodes", "expanded", "children", "cutoffs", "first_move_cutoffs", "early_cutoffs", "tt_hits")
+
+    def __init__(self):
+        self.nodes = self.expanded = self.children = 0
+        self.cutoffs = self.first_move_cutoffs = self.early_cutoffs = self.tt_hits = 0
+
+
+def summarize(events, top=DEFAULT_TOP):
+    """
+    Replays a trace and returns a summary dict: totals, per remaining depth
+    (nodes, branching factor over the nodes that searched any move, cutoff
+    rate, share of cutoffs on the first move, TT hit rate), per iteration
+    (nodes, time, growth over the previous iteration) and the `top` root
+    move subtrees that took longest.
+    """
+    depths = defaultdict(DepthStats)  # remaining depth ("q" for quiescence) -> DepthStats
+    iterations = []  # [search number, depth, nodes, microseconds]
+    hotspots = []    # (microseconds, nodes, search number, iteration depth, root move)
+    stack = []       # open nodes: [depth key, children, node count on entry, time on entry, move]
+    searches = nodes = qnodes = aborts = 0
+    first_us = last_us = None
+    iteration = None
+    for kind, ply, depth, alpha, beta, value, us in events:
+        if first_us is None:
+            first_us = us
+        last_us = us
+        if kind == ENTER or kind == QENTER:
+            if stack:
+                stack[-1][1] += 1
+            key = depth if kind == ENTER else "q"
+            if kind == ENTER:
+                nodes += 1
+            else:
+                qnodes += 1
+            stack.append([key, 0, nodes + qnodes, us, value])
+            if iteration is not None:
+                iteration[2] += 1
+        elif kind == EXIT or kind == QEXIT:
+            if not stack:
+                continue
+            key, children, entry_nodes, entry_us, move = stack.pop()
+            entry = depths[key]
+            entry.nodes += 1
+            if children:
+                entry.expanded += 1
+                entry.children += children
+            if kind == EXIT and ply == 1 and iteration is not None:
+                hotspots.append((us - entry_us, nodes + qnodes - entry_nodes + 1, searches, iteration[1], move))
+                if len(hotspots) > 4 * top:
+                    hotspots.sort(reverse=True)
+                    del hotspots[top:]
+        elif kind == CUTOFF and stack:
+            entry = depths[stack[-1][0]]
+            entry.cutoffs += 1
+            if value == 1:
+                entry.first_move_cutoffs += 1
+            elif value == 0:
+                entry.early_cutoffs += 1
+        elif kind == TT_HIT and stack:
+            depths[stack[-1][0]].tt_hits += 1
+        elif kind == ITERATION:
+            iteration = [searches, depth, 0, us]
+            iterations.append(iteration)
+        elif kind == SEARCH or kind == ABORT:
+            stack.clear()
+            if kind == SEARCH:
+                searches += 1
+                iteration = None
+            else:
+                aborts += 1
+
+    # An iteration lasts until the next one (or the end of the trace) starts.
+    for i, item in enumerate(iterations):
+        end = iterations[i + 1][3] if i + 1 < len(iterations) else last_us
+        item.append(end - item[3])
+    hotspots.sort(reverse=True)
+
+    def depth_row(key, entry):
+        return {
+            "depth": key,
+            "nodes": entry.nodes,
+            "branching": entry.children / entry.expanded if entry.expanded else 0.0,
+            "cutoff_rate": entry.cutoffs / entry.nodes if entry.nodes else 0.0,
+            "first_move_cutoffs": entry.first_move_cutoffs / entry.cutoffs if entry.cutoffs else 0.0,
+            "cutoffs_before_moves": entry.early_cutoffs / entry.cutoffs if entry.cutoffs else 0.0,
+            "tt_hit_rate": entry.tt_hits / entry.nodes if entry.nodes else 0.0,
+        }
+
+    numbered = sorted((key, entry) for key, entry in depths.items() if key != "q")
+    rows = [depth_row(key, entry) for key, entry in reversed(numbered)]
+    if "q" in depths:
+        rows.append(depth_row("q", depths["q"]))
+    iteration_rows = []
+    previous = {}
+    for search, depth, count, start, duration in iterations:
+        before = previous.get(search)
+        iteration_rows.append({"search": search, "depth": depth, "nodes": count, "ms": duration / 1000,
+                               "growth": count / before if before else None})
+        previous[search] = count
+    return {
+        "searches": searches,
+        "aborted": aborts,
+        "nodes": nodes,
+        "qnodes": qnodes,
+        "seconds": (last_us - first_us) / 1e6 if first_us is not None else 0.0,
+        "depths": rows,
+        "iterations": iteration_rows,
+        "hotspots": [{"ms": us / 1000, "nodes": count, "search": search, "depth": depth, "move": move_name(move)}
+                     for us, count, search, depth, move in hotspots[:top]],
+    }
+
+
+def print_summary(summary):
+    print(f"{summary['searches']} searches ({summary['aborted']} iterations cut short by time), "
+          f"{summary['nodes']} nodes + {summary['qnodes']} quiescence nodes over {summary['seconds']:.2f} s")
+    print("\nDepth  Nodes      Branching  Cutoffs  1st move  Before moves  TT hits")
+    for row in summary["depths"]:
+        print(f"{row['depth']!s:>5}  {row['nodes']:<9}  {row['branching']:9.2f}  {row['cutoff_rate'] * 100:6.1f}%  "
+              f"{row['first_move_cutoffs'] * 100:7.1f}%  {row['cutoffs_before_moves'] * 100:11.1f}%  "
+              f"{row['tt_hit_rate'] * 100:6.1f}%")
+    print("\nSearch  Iteration  Nodes      ms         Growth")
+    for row in summary["iterations"]:
+        growth = f"{row['growth']:.2f}" if row["growth"] else "-"
+        print(f"{row['search']:>6}  {row['depth']:>9}  {row['nodes']:<9}  {row['ms']:<9.1f}  {growth}")
+    print("\nSlowest root moves:")
+    for row in summary["hotspots"]:
+        print(f"  {row['move']:<6} search {row['search']}, depth {row['depth']}: {row['ms']:.1f} ms, "
+              f"{row['nodes']} nodes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a search trace recorded with CHESS_TRACE.")
+    parser.add_argument("trace", help="trace file (.jsonl or binary)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="slowest root moves to list")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+    summary = summarize(read_events(args.trace), args.top)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+
+# Self-play runs without a window or sound.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+
+import chess_ai
+from moves import CAPTURES, PROMOTIONS
+from position import Position
+from sprt import DEFAULT_OPENINGS, MAX_PLIES, adjudicate
+from util import POSITION_SIZE
+
+# One training sample. Scores and results are from the side to move's point of view.
+RECORD_DTYPE = np.dtype([
+    ("hash", "<u8"),                       # Zobrist hash of the position, the deduplication key
+    ("position", "u1", (POSITION_SIZE,)),  # util.encode_position bytes; Position.from_bytes reads them back
+    ("score", "<i2"),                      # Search score in centipawns, clipped to +/- MAX_SCORE
+    ("result", "i1"),                      # How the game ended: 1 win, 0 draw, -1 loss
+    ("depth", "u1"),                       # Depth the score was searched to
+    ("ply", "<u2"),                        # Plies played in the game before the position
+])
+
+SHARD_RECORDS = 1 << 20  # Records per shard file (52 MB)
+SHARD_NAME = "shard_{:05d}.npy"
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+MAX_SCORE = 3000              # Positions are sampled only when no mate was found, so this clips rarely
+DEFAULT_SAMPLE_RATE = 0.25    # Share of searched positions kept
+DEFAULT_RANDOM_PLIES = 8      # Random moves after the opening, so no two games are alike
+DEFAULT_MIN_DEPTH = 1         # Shallower scores (a search stopped before its first iteration) are not labels
+
+# Set in each worker process by init_worker.
+settings = {}
+
+
+def init_worker(options):
+    settings.update(options)
+
+
+def play_game(task):
+    """
+    Plays one game of the engine against itself from task = (game number,
+    seed): a random opening from DEFAULT_OPENINGS, then `random_plies`
+    random moves, then searched moves until the game ends. Each searched
+    position is kept with probability `sample_rate` unless it is in check,
+    its best move is a capture or promotion, or its score is a mate, since
+    a static evaluation cannot be fitted to those, or the search completed
+    less than `min_depth`. Returns (records,
+    summary): the sampled positions as a RECORD_DTYPE array labelled with
+    the game result, and a dict with the termination and plies.
+    """
+    number, seed = task
+    rng = random.Random(seed)
+    position = Position.from_fen(rng.choice(DEFAULT_OPENINGS))
+    seen = {}
+    samples = []  # (hash, encoded position, score, color, depth, ply)
+    plies = 0
+    winner = None
+    termination = "move_limit"
+    while plies < settings["max_plies"]:
+        ended = adjudicate(position, seen)
+        if ended:
+            winner, termination = ended
+            break
+        if plies < settings["random_plies"]:
+            move = rng.choice(position.generate_moves())
+        else:
+            move, score, depth = chess_ai.search_best_move(position, settings["move_time"],
+                                                           max_depth=settings["depth"], history=seen)
+            if (rng.random() < settings["sample_rate"] and depth >= settings["min_depth"]
+                    and abs(score) < chess_ai.MATE_THRESHOLD and not position.is_in_check()
+                    and move not in position.generate_moves(kinds=CAPTURES | PROMOTIONS)):
+                samples.append((position.hash, position.to_bytes(), score, position.color, depth, plies))
+        position.make_packed_move(move)
+        plies += 1
+
+    records = np.zeros(len(samples), RECORD_DTYPE)
+    if samples:
+        keys, data, scores, colors, depths, sample_plies = zip(*samples)
+        records["hash"] = keys
+        records["position"] = np.frombuffer(b"".join(data), np.uint8).reshape(-1, POSITION_SIZE)
+        records["score"] = np.clip(scores, -MAX_SCORE, MAX_SCORE)
+        if winner is not None:
+            records["result"] = np.where(np.array(colors) == winner, 1, -1)
+        records["depth"] = depths
+        records["ply"] = sample_plies
+    return records, {"game": number, "termination": termination, "plies": plies}
+
+
+def read_index(directory):
+    """The index of a data directory as a dict, or None if it has none yet."""
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION or index.get("dtype") != json.loads(json.dumps(RECORD_DTYPE.descr)):
+        raise ValueError(f"{path} was written with a different record format")
+    return index
+
+
+def write_index(directory, shard_size, shards):
+    """Replaces the index in one step, so a reader never sees half of it."""
+    index = {
+        "version": INDEX_VERSION,
+        "dtype": RECORD_DTYPE.descr,
+        "shard_size": shard_size,
+        "records": sum(count for name, count in shards),
+        "shards": [{"file": name, "records": count} for name, count in shards],
+    }
+    path = os.path.join(directory, INDEX_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+class ShardWriter:
+    """
+    Appends records to the shards of a data directory. Each shard is a .npy
+    file created at its full size of `shard_size` records and filled through
+    a memory map; the index lists how many records of each are valid, so a
+    run that stops part way loses only what was added since the last
+    commit(). An existing directory is continued: records go on after the
+    last valid one, and positions already stored are recognised by hash and
+    skipped. The stored hashes are kept as one sorted array (8 bytes per
+    record) and those added since as a set.
+    """
+    def __init__(self, directory, shard_size=SHARD_RECORDS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_size = shard_size
+        self.shards = []  # [file name, valid records]
+        index = read_index(directory)
+        if index is not None:
+            self.shard_size = index["shard_size"]
+            self.shards = [[shard["file"], shard["records"]] for shard in index["shards"]]
+        stored = [np.load(self.path(name), mmap_mode="r")["hash"][:count] for name, count in self.shards]
+        self.stored_hashes = np.sort(np.concatenate(stored)) if stored else np.zeros(0, np.uint64)
+        self.new_hashes = set()
+        self.duplicates = 0
+        self.shard = None  # Memory map of the last shard while it has room
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def records(self):
+        return sum(count for name, count in self.shards)
+
+    def add(self, records):
+        """Appends the records whose position is not stored yet; returns how many were added."""
+        hashes = records["hash"]
+        found = np.searchsorted(self.stored_hashes, hashes)
+        stored = np.zeros(len(records), bool)
+        inside = found < len(self.stored_hashes)
+        stored[inside] = self.stored_hashes[found[inside]] == hashes[inside]
+        keep = []
+        for i, key in enumerate(hashes.tolist()):
+            if not stored[i] and key not in self.new_hashes:
+                self.new_hashes.add(key)
+                keep.append(i)
+        self.duplicates += len(records) - len(keep)
+        records = records[keep]
+
+        written = 0
+        while written < len(records):
+            if self.shard is None:
+                self.open_shard()
+            shard = self.shards[-1]
+            count = min(self.shard_size - shard[1], len(records) - written)
+            self.shard[shard[1]:shard[1] + count] = records[written:written + count]
+            shard[1] += count
+            written += count
+            if shard[1] == self.shard_size:
+                self.shard.flush()
+                self.shard = None
+        return written
+
+    def open_shard(self):
+        if self.shards and self.shards[-1][1] < self.shard_size:
+            self.shard = np.lib.format.open_memmap(self.path(self.shards[-1][0]), mode="r+")
+            return
+        name = SHARD_NAME.format(len(self.shards))
+        self.shard = np.lib.format.open_memmap(self.path(name), mode="w+", dtype=RECORD_DTYPE,
+                                               shape=(self.shard_size,))
+        self.shards.append([name, 0])
+
+    def commit(self):
+        """Flushes the open shard and rewrites the index, so everything added so far is kept."""
+        if self.shard is not None:
+            self.shard.flush()
+        write_index(self.directory, self.shard_size, self.shards)
+
+    def close(self):
+        self.commit()
+        self.shard = None
+
+
+class ShardDataset:
+    """
+    Read-only access to a data directory for training and tuning jobs. The
+    shards are memory mapped, so opening a directory reads only its index
+    and a batch reads only the pages holding its records; the operating
+    system caches pages as memory allows, never the whole data set.
+    """
+    def __init__(self, directory):
+        index = read_index(directory)
+        if index is None:
+            raise FileNotFoundError(f"no {INDEX_FILE} in {directory}")
+        self.shards = [np.load(os.path.join(directory, shard["file"]), mmap_mode="r")[:shard["records"]]
+                       for shard in index["shards"] if shard["records"]]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def take(self, indices):
+        """The records at the given indices (counted over all shards), in that order, as an in-memory array."""
+        indices = np.asarray(indices, np.int64)
+        batch = np.empty(len(indices), RECORD_DTYPE)
+        shard_of = np.searchsorted(self.offsets, indices, side="right") - 1
+        for shard in np.unique(shard_of):
+            chosen = shard_of == shard
+            batch[chosen] = self.shards[shard][indices[chosen] - self.offsets[shard]]
+        return batch
+
+    def sample(self, batch_size, rng=None):
+        """A batch of records drawn at random (with replacement); `rng` is a NumPy Generator or a seed."""
+        rng = np.random.default_rng(rng)
+        return self.take(rng.integers(0, len(self), batch_size))
+
+    def batches(self, batch_size, rng=None):
+        """
+        Yields one epoch in random order: every record exactly once, in
+        batches of `batch_size` (the last may be smaller). Only the shuffled
+        record numbers (8 bytes per record) are held in memory.
+        """
+        order = np.random.default_rng(rng).permutation(len(self))
+        for start in range(0, len(order), batch_size):
+            yield self.take(order[start:start + batch_size])
+
+
+def positions(records):
+    """Position objects for records read from the shards."""
+    return [Position.from_bytes(data.tobytes()) for data in records["position"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play the engine against itself and store sampled, labelled positions as training data.")
+    parser.add_argument("directory", help="data directory; an existing one is continued")
+    parser.add_argument("--games", type=int, default=100, help="games to play")
+    parser.add_argument("--move-time", type=float, default=0.1, help="seconds per move")
+    parser.add_argument("--depth", type=int, help="search every move to this depth instead of by time")
+    parser.add_argument("--min-depth", type=int, default=DEFAULT_MIN_DEPTH,
+                        help="skip positions whose search completed fewer plies")
+    parser.add_argument("--sample-rate", type=float, default=DEFAULT_SAMPLE_RATE,
+                        help="share of searched positions kept")
+    parser.add_argument("--random-plies", type=int, default=DEFAULT_RANDOM_PLIES,
+                        help="random moves played after the opening")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="plies before a game is adjudicated a draw")
+    parser.add_argument("--shard-size", type=int, default=SHARD_RECORDS,
+                        help="records per shard file (for a new directory)")
+    parser.add_argument("--seed", type=int, help="seed for the openings and random moves (default: random)")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count(), help="games played in parallel")
+    args = parser.parse_args()
+
+    options = {
+        "move_time": args.move_time if args.depth is None else float("inf"),
+        "depth": args.depth or chess_ai.MAX_SEARCH_DEPTH,
+        "min_depth": args.min_depth,
+        "sample_rate": args.sample_rate,
+        "random_plies": args.random_plies,
+        "max_plies": args.max_plies,
+    }
+    seeds = random.Random(args.seed)
+    tasks = [(number, seeds.getrandbits(64)) for number in range(1, args.games + 1)]
+    writer = ShardWriter(args.directory, args.shard_size)
+    stored_before = writer.records
+    sampled = 0
+    started = time.perf_counter()
+    pool = multiprocessing.Pool(args.concurrency, init_worker, (options,))
+    try:
+        for played, (records, summary) in enumerate(pool.imap_unordered(play_game, tasks), 1):
+            added = writer.add(records)
+            writer.commit()
+            sampled += len(records)
+            print(f"Game {played}/{args.games}: {summary['termination']} after {summary['plies']} plies, "
+                  f"{added} of {len(records)} sampled positions new, {writer.records} stored", flush=True)
+    finally:
+        pool.terminate()
+        pool.join()
+        writer.close()
+
+    seconds = time.perf_counter() - started
+    print(f"\n{sampled} positions sampled, {writer.duplicates} duplicates skipped, "
+          f"{writer.records - stored_before} added in {seconds:.1f} s")
+    print(f"{args.directory}: {writer.records} records in {len(writer.shards)} shards")
+
+
+if __name__ == "__main__":
+    main()
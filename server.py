@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+# The rules core imports pygame; the server never opens a window or plays sound.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from chess_ai import get_ai_move
+from moves import encode_move
+from position import Position
+from util import WHITE, BLACK, PAWN, QUEEN, PROMOTION_CODES, starting_fen, encode_position
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_AI_MOVE_TIME = 0.2
+
+# (white, black) seat owners per mode: "human" seats go to clients, "ai" seats to the engine.
+MODES = {
+    "pvp": ("human", "human"),
+    "white_vs_ai": ("human", "ai"),
+    "black_vs_ai": ("ai", "human"),
+    "ai_vs_ai": ("ai", "ai"),
+}
+PROMOTION_LETTERS = {letter.lower(): piece_type for piece_type, letter in PROMOTION_CODES.items()}
+
+
+def square_name(sq):
+    return f"{chr(97 + sq[1])}{8 - sq[0]}"
+
+
+def parse_square(name):
+    if len(name) != 2 or name[0] not in "abcdefgh" or name[1] not in "12345678":
+        raise ValueError(f"bad square {name!r}")
+    return 8 - int(name[1]), ord(name[0]) - 97
+
+
+def move_text(start, end, promotion=None):
+    """Coordinate notation used on the wire: 'e2e4', 'e7e8q'."""
+    text = square_name(start) + square_name(end)
+    if promotion:
+        text += PROMOTION_CODES[promotion].lower()
+    return text
+
+
+def parse_move(text):
+    if len(text) not in (4, 5):
+        raise ValueError(f"bad move {text!r}")
+    promotion = None
+    if len(text) == 5:
+        if text[4] not in PROMOTION_LETTERS:
+            raise ValueError(f"bad promotion piece {text[4]!r}")
+        promotion = PROMOTION_LETTERS[text[4]]
+    return parse_square(text[:2]), parse_square(text[2:4]), promotion
+
+
+class Game:
+    """
+    One hosted game: a Position, the played moves packed into an array and the
+    repetition counts. Nothing runs for a game between moves, so idle games
+    cost only this object.
+    """
+    __slots__ = ("id", "mode", "position", "moves", "repetitions", "seats", "watchers", "status", "thinking")
+
+    def __init__(self, game_id, mode, fen=starting_fen):
+        self.id = game_id
+        self.mode = mode
+        self.position = Position.from_fen(fen)
+        self.moves = array('H')
+        self.repetitions = {self.position.hash: 1}
+        self.seats = {WHITE: None, BLACK: None}  # color -> Client holding that side
+        self.watchers = set()
+        self.status = "ongoing"
+        self.thinking = False
+
+    def owner(self, color):
+        return MODES[self.mode][0 if color == WHITE else 1]
+
+    def is_legal(self, start, end):
+        """
+        Checks a client move against the position's own legal moves, which
+        test castling through attacked squares and en passant discovering
+        check (util.get_legal_moves does not).
+        """
+        position = self.position
+        piece = position.board[start[0]][start[1]]
+        if not piece or (piece & 24) != position.color:
+            return False
+        return end in position.legal_moves_from(start)
+
+    def play(self, start, end, promotion=None):
+        position = self.position
+        self.moves.append(encode_move(start, end, promotion))
+        position.make_move(start, end, promotion)
+        self.repetitions[position.hash] = self.repetitions.get(position.hash, 0) + 1
+        if not position.has_legal_move():
+            if position.is_in_check():
+                self.status = "white_won_by_checkmate" if position.color == BLACK else "black_won_by_checkmate"
+            else:
+                self.status = "draw_by_stalemate"
+        elif position.is_insufficient_material():
+            self.status = "draw_by_insufficient_material"
+        elif self.repetitions[position.hash] >= 3:
+            self.status = "draw_by_repetition"
+        elif position.halfmove >= 100:
+            self.status = "draw_by_fifty_moves"
+
+    def state(self, last_move=None):
+        return {"op": "state", "game": self.id, "mode": self.mode, "fen": self.position.to_fen(),
+                "last_move": last_move, "plies": len(self.moves), "status": self.status}
+
+
+class Client:
+    """A connected client; messages to it are newline-delimited JSON."""
+    def __init__(self, writer):
+        self.writer = writer
+        self.games = set()
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(message).encode() + b"\n")
+
+
+class GameServer:
+    """
+    Hosts many games over a line-based JSON protocol on one event loop.
+    Client moves are validated and applied inline (a few microseconds),
+    while engine moves run in a process pool, so a long search never
+    delays other games. Every state change is pushed to the players and
+    watchers of the game.
+    """
+    def __init__(self, workers=None, ai_move_time=DEFAULT_AI_MOVE_TIME):
+        self.games = {}
+        self.ids = itertools.count(1)
+        self.pool = ProcessPoolExecutor(workers)
+        self.ai_move_time = ai_move_time
+        self.clients = 0
+
+    def broadcast(self, game, message):
+        for client in game.watchers:
+            client.send(message)
+
+    async def handle_client(self, reader, writer):
+        client = Client(writer)
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    self.dispatch(client, message)
+                except (ValueError, KeyError, TypeError) as e:
+                    client.send({"op": "error", "message": str(e)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            for game_id in list(client.games):
+                if game_id in self.games:
+                    self.leave(client, self.games[game_id])
+            writer.close()
+
+    def dispatch(self, client, message):
+        op = message["op"]
+        if op == "new":
+            mode = message.get("mode", "white_vs_ai")
+            if mode not in MODES:
+                raise ValueError(f"unknown mode {mode!r}")
+            game = Game(next(self.ids), mode, message.get("fen", starting_fen))
+            self.games[game.id] = game
+            self.seat(client, game)
+            client.send(game.state())
+            self.maybe_ai_move(game)
+        elif op == "join":
+            game = self.game(message)
+            self.seat(client, game)
+            client.send(game.state())
+        elif op == "move":
+            game = self.game(message)
+            start, end, promotion = parse_move(message["move"])
+            position = game.position
+            if game.status != "ongoing":
+                raise ValueError("the game is over")
+            if game.seats[position.color] is not client:
+                raise ValueError("it is not your move")
+            if not game.is_legal(start, end):
+                raise ValueError(f"illegal move {message['move']}")
+            piece = position.board[start[0]][start[1]]
+            if (piece & 7) == PAWN and end[0] in (0, 7):
+                promotion = promotion or QUEEN
+            else:
+                promotion = None
+            game.play(start, end, promotion)
+            self.broadcast(game, game.state(move_text(start, end, promotion)))
+            self.maybe_ai_move(game)
+        elif op == "leave":
+            self.leave(client, self.game(message))
+        elif op == "state":
+            client.send(self.game(message).state())
+        else:
+            raise ValueError(f"unknown op {op!r}")
+
+    def game(self, message):
+        game = self.games.get(message["game"])
+        if game is None:
+            raise ValueError(f"no game {message['game']}")
+        return game
+
+    def seat(self, client, game):
+        """Gives the client the first free human side, or makes it a watcher."""
+        for color in (WHITE, BLACK):
+            if game.owner(color) == "human" and game.seats[color] is None:
+                game.seats[color] = client
+                break
+        game.watchers.add(client)
+        client.games.add(game.id)
+
+    def leave(self, client, game):
+        """Frees the client's seat; a game nobody plays or watches any more is dropped."""
+        game.watchers.discard(client)
+        client.games.discard(game.id)
+        for color, holder in game.seats.items():
+            if holder is client:
+                game.seats[color] = None
+        if not game.watchers and not game.thinking:
+            del self.games[game.id]
+
+    def maybe_ai_move(self, game):
+        if game.status == "ongoing" and not game.thinking and game.owner(game.position.color) == "ai":
+            game.thinking = True
+            asyncio.get_running_loop().create_task(self.ai_move(game))
+
+    async def ai_move(self, game):
+        position = game.position
+        data = encode_position(position.board, 'w' if position.color == WHITE else 'b', position.castling,
+                               position.en_passant_target, position.halfmove, position.fullmove)
+        loop = asyncio.get_running_loop()
+        try:
+            move = await loop.run_in_executor(self.pool, get_ai_move, data, self.ai_move_time)
+        finally:
+            game.thinking = False
+        if game.id not in self.games:
+            return
+        if not game.watchers:
+            del self.games[game.id]
+            return
+        if move is not None:
+            start, end = move
+            piece = position.board[start[0]][start[1]]
+            promotion = QUEEN if (piece & 7) == PAWN and end[0] in (0, 7) else None
+            game.play(start, end, promotion)
+            self.broadcast(game, game.state(move_text(start, end, promotion)))
+        self.maybe_ai_move(game)
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(f"{len(self.games)} games, {self.clients} clients", flush=True)
+
+
+async def serve(host, port, workers, ai_move_time, report_interval):
+    server = GameServer(workers, ai_move_time)
+    tcp = await asyncio.start_server(server.handle_client, host, port, limit=1 << 16)
+    print(f"Serving on {host}:{port}", flush=True)
+    if report_interval:
+        asyncio.get_running_loop().create_task(server.report(report_interval))
+    async with tcp:
+        await tcp.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host chess games for network clients.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, help="processes for AI moves (default: one per CPU)")
+    parser.add_argument("--ai-move-time", type=float, default=DEFAULT_AI_MOVE_TIME, help="seconds per AI move")
+    parser.add_argument("--report", type=float, default=10.0, metavar="SECONDS",
+                        help="print the number of games and clients this often (0 to disable)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.ai_move_time, args.report))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
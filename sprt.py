@@ -0,0 +1,290 @@
+import argparse
+import importlib.util
+import inspect
+import json
+import math
+import multiprocessing
+import os
+import statistics
+import time
+
+# Engines run without a window or sound.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import stats
+from game_clock import ChessClock
+from position import Position
+from util import WHITE, BLACK
+
+# Balanced, varied starting positions; each is played twice with colours swapped.
+DEFAULT_OPENINGS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkb1r/pppppppp/5n2/8/2P5/8/PP1PPPPP/RNBQKBNR w KQkq - 1 2",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "rnbqkbnr/pppp1ppp/4p3/8/3PP3/8/PPP2PPP/RNBQKBNR b KQkq - 0 2",
+    "rnbqkb1r/pppp1ppp/4pn2/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",
+]
+MAX_PLIES = 400  # Games still running after this many plies are adjudicated as draws.
+
+# Set in each worker process by init_worker: {"a": get_ai_move, "b": get_ai_move}.
+engines = {}
+settings = {}
+
+
+def load_engine(path, name):
+    """
+    Loads get_ai_move from a module name (e.g. chess_ai) or a .py file
+    (e.g. an older copy of chess_ai.py). The module is loaded afresh under
+    `name`, so two engines never share module state such as a hash table.
+    """
+    if not path.endswith(".py"):
+        spec = importlib.util.find_spec(path)
+        if spec is None or spec.origin is None:
+            raise ImportError(f"no module named {path}")
+        path = spec.origin
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.get_ai_move
+
+
+def engine_kwargs(get_ai_move, clock, color, seen):
+    """
+    Time arguments for an engine call, and the hashes of the positions played
+    so far, limited to those its get_ai_move accepts.
+    """
+    params = inspect.signature(get_ai_move).parameters
+    kwargs = {}
+    if "history" in params:
+        kwargs["history"] = list(seen)
+    if clock is not None and "remaining" in params:
+        kwargs["remaining"] = clock.time_left(color)
+        kwargs["increment"] = clock.increment
+    elif "move_time" in params:
+        kwargs["move_time"] = settings["move_time"]
+    return kwargs
+
+
+def init_worker(path_a, path_b, options):
+    engines["a"] = load_engine(path_a, "engine_a")
+    engines["b"] = load_engine(path_b, "engine_b")
+    settings.update(options)
+    stats.reset()
+    stats.enable()  # Node counts for nps
+
+
+def adjudicate(position, seen):
+    """
+    (winner, termination) if the game is over in `position`, else None; the
+    winner is WHITE, BLACK or None for a draw. `seen` counts the positions
+    (by hash) reached so far for repetitions and is updated with this one.
+    """
+    if not position.has_legal_move():
+        if position.is_in_check():
+            return (BLACK if position.color == WHITE else WHITE), "checkmate"
+        return None, "stalemate"
+    if position.is_insufficient_material():
+        return None, "insufficient_material"
+    seen[position.hash] = seen.get(position.hash, 0) + 1
+    if seen[position.hash] >= 3:
+        return None, "repetition"
+    if position.halfmove >= 100:
+        return None, "fifty_moves"
+    return None
+
+
+def play_game(task):
+    """
+    Plays one game from task = (opening index, fen, whether engine A has White).
+    Returns a dict with A's score (1, 0.5 or 0), the termination, plies, the
+    duration and the nodes / thinking time spent by each engine.
+    """
+    index, fen, a_is_white = task
+    position = Position.from_fen(fen)
+    players = {WHITE: "a" if a_is_white else "b", BLACK: "b" if a_is_white else "a"}
+    clock = ChessClock(settings["base"], settings["increment"]) if settings["base"] else None
+    nodes = {"a": 0, "b": 0}
+    thinking = {"a": 0.0, "b": 0.0}
+    seen = {}
+    started = time.perf_counter()
+    plies = 0
+    winner = None
+    termination = "move_limit"
+    if clock:
+        clock.start(position.color)
+    while plies < MAX_PLIES:
+        color = position.color
+        ended = adjudicate(position, seen)
+        if ended:
+            winner, termination = ended
+            break
+
+        player = players[color]
+        get_ai_move = engines[player]
+        kwargs = engine_kwargs(get_ai_move, clock, color, seen)
+        nodes_before = stats.counters.get("nodes", 0)
+        move_start = time.perf_counter()
+        move = get_ai_move(position.to_fen(), **kwargs)
+        thinking[player] += time.perf_counter() - move_start
+        nodes[player] += stats.counters.get("nodes", 0) - nodes_before
+        if clock:
+            clock.press()
+            if clock.flagged(color):
+                winner, termination = (BLACK if color == WHITE else WHITE), "timeout"
+                break
+        if move is None or move not in position.legal_moves():
+            winner, termination = (BLACK if color == WHITE else WHITE), "illegal_move"
+            break
+        position.make_move(*move)
+        plies += 1
+
+    if winner is None:
+        score = 0.5
+    else:
+        score = 1.0 if players[winner] == "a" else 0.0
+    return {"opening": index, "a_white": a_is_white, "score": score, "termination": termination,
+            "plies": plies, "duration": time.perf_counter() - started, "nodes": nodes, "thinking": thinking}
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_to_elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_stats(wins, draws, losses):
+    """Mean score for engine A and the per-game variance of its score."""
+    games = wins + draws + losses
+    mean = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2 + losses * mean ** 2) / games
+    return mean, variance
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """
+    Log-likelihood ratio of H1 (A is elo1 stronger) over H0 (elo0), using the
+    normal approximation to the trinomial score distribution.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    mean, variance = score_stats(wins, draws, losses)
+    if variance == 0:
+        return 0.0  # All results identical so far; nothing can be concluded yet.
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return (s1 - s0) * (2 * mean - s0 - s1) * games / (2 * variance)
+
+
+def elo_estimate(wins, draws, losses):
+    """(Elo of A over B, 95% error margin) from the match score."""
+    games = wins + draws + losses
+    mean, variance = score_stats(wins, draws, losses)
+    margin = 1.96 * math.sqrt(variance / games)
+    low, high = score_to_elo(mean - margin), score_to_elo(mean + margin)
+    return score_to_elo(mean), (high - low) / 2
+
+
+def report(results, llr, bounds, path_a, path_b):
+    wins = sum(1 for r in results if r["score"] == 1.0)
+    losses = sum(1 for r in results if r["score"] == 0.0)
+    draws = len(results) - wins - losses
+    elo, margin = elo_estimate(wins, draws, losses)
+    durations = [r["duration"] for r in results]
+    summary = {
+        "engine_a": path_a,
+        "engine_b": path_b,
+        "games": len(results),
+        "wins": wins,
+        "draws": draws,
+        "losses": losses,
+        "elo": elo,
+        "elo_margin": margin,
+        "llr": llr,
+        "llr_bounds": bounds,
+        "nps": {},
+        "duration": {"mean": statistics.mean(durations), "median": statistics.median(durations),
+                     "min": min(durations), "max": max(durations), "total": sum(durations)},
+        "terminations": {},
+    }
+    for player in ("a", "b"):
+        nodes = sum(r["nodes"][player] for r in results)
+        seconds = sum(r["thinking"][player] for r in results)
+        summary["nps"][player] = nodes / seconds if seconds else 0.0
+    for r in results:
+        summary["terminations"][r["termination"]] = summary["terminations"].get(r["termination"], 0) + 1
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play two versions of get_ai_move against each other until an SPRT decides between them.")
+    parser.add_argument("engine_a", help="module name or .py file of the new engine")
+    parser.add_argument("engine_b", help="module name or .py file of the baseline engine")
+    parser.add_argument("--openings", metavar="PATH", help="file with one starting FEN per line")
+    parser.add_argument("--elo0", type=float, default=0.0, help="Elo difference under H0")
+    parser.add_argument("--elo1", type=float, default=10.0, help="Elo difference under H1")
+    parser.add_argument("--alpha", type=float, default=0.05, help="false positive rate")
+    parser.add_argument("--beta", type=float, default=0.05, help="false negative rate")
+    parser.add_argument("--max-games", type=int, default=2000, help="stop after this many games")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count(), help="games played in parallel")
+    parser.add_argument("--move-time", type=float, default=0.1, help="seconds per move when there is no clock")
+    parser.add_argument("--base", type=float, help="clock seconds per side (default: fixed time per move)")
+    parser.add_argument("--increment", type=float, default=0.0, help="clock increment per move")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    openings = DEFAULT_OPENINGS
+    if args.openings:
+        with open(args.openings) as f:
+            openings = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    tasks = [(i % len(openings), openings[i % len(openings)], a_white)
+             for i in range((args.max_games + 1) // 2) for a_white in (True, False)][:args.max_games]
+
+    bounds = (math.log(args.beta / (1 - args.alpha)), math.log((1 - args.beta) / args.alpha))
+    options = {"move_time": args.move_time, "base": args.base, "increment": args.increment}
+    results = []
+    llr = 0.0
+    decision = "inconclusive (game limit reached)"
+    pool = multiprocessing.Pool(args.concurrency, init_worker, (args.engine_a, args.engine_b, options))
+    try:
+        for result in pool.imap_unordered(play_game, tasks):
+            results.append(result)
+            wins = sum(1 for r in results if r["score"] == 1.0)
+            losses = sum(1 for r in results if r["score"] == 0.0)
+            llr = sprt_llr(wins, len(results) - wins - losses, losses, args.elo0, args.elo1)
+            print(f"Game {len(results)}: +{wins} ={len(results) - wins - losses} -{losses}  "
+                  f"LLR {llr:.2f} [{bounds[0]:.2f}, {bounds[1]:.2f}]", flush=True)
+            if llr >= bounds[1]:
+                decision = "H1 accepted: A is stronger"
+                break
+            if llr <= bounds[0]:
+                decision = "H0 accepted: A is not stronger"
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    summary = report(results, llr, bounds, args.engine_a, args.engine_b)
+    summary["decision"] = decision
+    print(f"\n{decision}")
+    print(f"Games: {summary['games']} (+{summary['wins']} ={summary['draws']} -{summary['losses']})")
+    print(f"Elo: {summary['elo']:+.1f} +/- {summary['elo_margin']:.1f} (95%)")
+    print(f"NPS: A {summary['nps']['a']:.0f}, B {summary['nps']['b']:.0f}")
+    duration = summary["duration"]
+    print(f"Game duration: mean {duration['mean']:.1f} s, median {duration['median']:.1f} s, "
+          f"min {duration['min']:.1f} s, max {duration['max']:.1f} s")
+    print("Terminations: " + ", ".join(f"{k} {v}" for k, v in sorted(summary["terminations"].items())))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
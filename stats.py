@@ -0,0 +1,97 @@
+import json
+
+# Counters and timers for the AI search, the move generator and the renderer.
+# Nothing is recorded unless `enabled` is True; call sites check `stats.enabled`
+# before touching anything here, so the disabled cost is one attribute lookup.
+enabled = False
+
+counters = {}
+timers = {}
+frame_times = {}
+
+# Weight of the newest frame in the smoothed per-frame render times.
+FRAME_SMOOTHING = 0.1
+
+# Counters every report includes, even before anything has touched them.
+COUNTER_NAMES = [
+    "nodes",
+    "tt_probes",
+    "tt_hits",
+    "cutoffs",
+    "eval_probes",
+    "eval_hits",
+    "pawn_probes",
+    "pawn_hits",
+    "legal_move_calls",
+    "move_table_hits",
+    "pseudo_move_calls",
+    "attack_checks",
+]
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    counters.clear()
+    timers.clear()
+    frame_times.clear()
+
+
+def incr(name, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+
+def add_time(name, seconds):
+    timers[name] = timers.get(name, 0.0) + seconds
+
+
+def record_frame(section_times):
+    """
+    Folds one frame's render times (a dict of section -> seconds) into the
+    smoothed per-section averages shown by the HUD.
+    """
+    for name, seconds in section_times.items():
+        ms = seconds * 1000.0
+        previous = frame_times.get(name)
+        if previous is None:
+            frame_times[name] = ms
+        else:
+            frame_times[name] = previous + (ms - previous) * FRAME_SMOOTHING
+
+
+def snapshot():
+    """
+    Returns a plain dict with all counters, timers and derived rates, suitable
+    for json.dumps and for the on-screen overlay.
+    """
+    data = {name: counters.get(name, 0) for name in COUNTER_NAMES}
+    for name, value in counters.items():
+        data.setdefault(name, value)
+
+    search_time = timers.get("search", 0.0)
+    data["search_time"] = search_time
+    data["nps"] = data["nodes"] / search_time if search_time > 0 else 0.0
+    data["tt_hit_rate"] = data["tt_hits"] / data["tt_probes"] if data["tt_probes"] else 0.0
+    data["eval_hit_rate"] = data["eval_hits"] / data["eval_probes"] if data["eval_probes"] else 0.0
+    data["pawn_hit_rate"] = data["pawn_hits"] / data["pawn_probes"] if data["pawn_probes"] else 0.0
+    data["timers"] = dict(timers)
+    data["frame_ms"] = dict(frame_times)
+    return data
+
+
+def dump(path):
+    """Writes the current snapshot as JSON ('-' writes to stdout)."""
+    text = json.dumps(snapshot(), indent=2, sort_keys=True)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
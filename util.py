@@ -1,13 +1,23 @@
 import pygame
 import os
+import hashlib
+from collections import OrderedDict
+import struct
+import threading
+import stats
 
 # Constants
+# The layout at the default window size; Layout scales it to the actual window.
 BOARD_SIZE = 640  # Board size
 MARGIN_WIDTH = 300  # More margin on the width
 MARGIN_HEIGHT = 50  # Little margin on the height
 WINDOW_WIDTH = BOARD_SIZE + 2 * MARGIN_WIDTH
 WINDOW_HEIGHT = BOARD_SIZE + 2 * MARGIN_HEIGHT
 SQUARE_SIZE = BOARD_SIZE // 8
+MIN_LAYOUT_SCALE = 0.5             # Windows smaller than this scale of the default are clipped
+SQUARE_SIZE_STEP = 4               # Square sizes are rounded down to a multiple of this, so few sprite sizes are made
+SPRITE_CACHE_SIZES = 4             # Sprite sets (one per square size) kept in memory
+RESIZE_SETTLE = 0.3                # Seconds without a resize event before the layout follows the window
 
 # Colors
 LIGHT_BROWN = (205, 133, 63)
@@ -18,9 +28,22 @@ HIGHLIGHT_COLOR = (255, 0, 0)      # Red for legal moves
 SELECTED_COLOR = (255, 165, 0)     # Orange for selected piece
 CHECK_COLOR = (255, 0, 0)          # Red for check indicator
 FONT_SIZE = 24
+CAPTURED_FONT_SIZE = 30
+MOVE_LOG_FONT_SIZE = 36
+HUD_BACKGROUND = (0, 0, 0, 170)    # Translucent black behind the performance overlay
+HUD_WIDTH = 280
+HUD_FONT_SIZE = 22
+ANALYSIS_LINES = 3                 # Engine lines shown in the analysis panel
+ANALYSIS_PV_LENGTH = 8             # Moves shown per line
+ANALYSIS_REFRESH = 0.25            # Seconds between analysis panel redraws
+ANALYSIS_WIDTH = 250
+ANALYSIS_Y = 200                   # Top of the panel, between the captured pieces
+BOUNDED_LOG_LINES = 200            # Move log lines kept with bounded history
 
 # Piece images directory
 PIECE_FOLDER = "pieces"
+SPRITE_CACHE_FOLDER = os.path.join(PIECE_FOLDER, "cache")  # Pre-scaled sprite atlases
+AUDIO_FOLDER = "audio"
 
 # Chessboard representation
 EMPTY = 0
@@ -51,11 +74,48 @@ PIECE_VALUES = {
     QUEEN: 9
 }
 
-pygame.mixer.init()
-move_sound = pygame.mixer.Sound(os.path.join("audio", "move.mp3"))
-capture_sound = pygame.mixer.Sound(os.path.join("audio", "capture.mp3"))
-check_sound = pygame.mixer.Sound(os.path.join("audio", "check.mp3"))
-checkmate_sound = pygame.mixer.Sound(os.path.join("audio", "checkmate.mp3"))
+class LazySound:
+    """
+    Stands in for a pygame.mixer.Sound that is only decoded the first time it is
+    played (or when preload_sounds runs), so importing this module stays cheap.
+    If no audio device is available the sound silently does nothing.
+    """
+    def __init__(self, filename):
+        self.path = os.path.join(AUDIO_FOLDER, filename)
+        self.sound = None
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.sound is None and not self.failed:
+                try:
+                    if not pygame.mixer.get_init():
+                        pygame.mixer.init()
+                    self.sound = pygame.mixer.Sound(self.path)
+                except pygame.error:
+                    self.failed = True
+        return self.sound
+
+    def play(self):
+        sound = self.sound or self.load()
+        if sound is not None:
+            sound.play()
+
+move_sound = LazySound("move.mp3")
+capture_sound = LazySound("capture.mp3")
+check_sound = LazySound("check.mp3")
+checkmate_sound = LazySound("checkmate.mp3")
+SOUNDS = [move_sound, capture_sound, check_sound, checkmate_sound]
+
+def preload_sounds():
+    """Decodes all sounds on a background thread so the first move does not stall."""
+    def load_all():
+        for sound in SOUNDS:
+            sound.load()
+    thread = threading.Thread(target=load_all, daemon=True)
+    thread.start()
+    return thread
 
 
 # Piece mapping for FEN
@@ -152,24 +212,203 @@ def parse_fen(fen):
     
     return board, active_color, castling, en_passant_target, halfmove, fullmove
 
+# Compact binary positions: 32 bytes of packed 4-bit squares (two per byte,
+# a8 first), a flags byte (bit 0 = black to move, bits 1-4 = KQkq), an en passant
+# square byte (row * 8 + col, 255 for none) and the two clocks as 16-bit ints.
+POSITION_STRUCT = struct.Struct("<32sBBHH")
+POSITION_SIZE = POSITION_STRUCT.size
+POSITION_KEY_SIZE = 34  # Squares, flags and en passant: the clocks are left out
+NO_EN_PASSANT = 255
+CASTLING_FLAGS = (('K', 2), ('Q', 4), ('k', 8), ('q', 16))
+# Castling field string <-> flag bits for all 16 combinations.
+FLAGS_TO_CASTLING = ["".join(char for char, bit in CASTLING_FLAGS if (i << 1) & bit) or "-" for i in range(16)]
+CASTLING_TO_FLAGS = {rights: i << 1 for i, rights in enumerate(FLAGS_TO_CASTLING)}
+
+# Piece code -> 4-bit square code (white 1-6, black 9-14) and back.
+PIECE_TO_NIBBLE = [0] * ((BLACK | KING) + 1)
+for _code in fen_piece_map.values():
+    PIECE_TO_NIBBLE[_code] = (_code & 7) | (8 if _code & BLACK else 0)
+NIBBLE_TO_PIECE = [EMPTY] * 16
+for _code in fen_piece_map.values():
+    NIBBLE_TO_PIECE[PIECE_TO_NIBBLE[_code]] = _code
+
+# bytes.translate tables so packing and unpacking run in C rather than per square:
+# piece code -> high / low nibble, and packed byte -> piece in its high / low nibble.
+_ENCODE_HIGH = bytes((PIECE_TO_NIBBLE[i] << 4) if i < len(PIECE_TO_NIBBLE) else 0 for i in range(256))
+_ENCODE_LOW = bytes(PIECE_TO_NIBBLE[i] if i < len(PIECE_TO_NIBBLE) else 0 for i in range(256))
+_DECODE_HIGH = bytes(NIBBLE_TO_PIECE[b >> 4] for b in range(256))
+_DECODE_LOW = bytes(NIBBLE_TO_PIECE[b & 15] for b in range(256))
+
+def encode_position(board, active_color, castling, en_passant_target, halfmove=0, fullmove=1):
+    """
+    Packs a position into POSITION_SIZE (38) bytes. The result is hashable, so it
+    can be used directly as a dict key, sent to worker processes or written as a
+    fixed-size record. Use the first POSITION_KEY_SIZE bytes to compare positions
+    while ignoring the clocks.
+    """
+    flat = b"".join(map(bytes, board))
+    squares = (int.from_bytes(flat[0::2].translate(_ENCODE_HIGH), "big") |
+               int.from_bytes(flat[1::2].translate(_ENCODE_LOW), "big")).to_bytes(32, "big")
+    flags = CASTLING_TO_FLAGS[castling] | (1 if active_color == 'b' else 0)
+    ep = NO_EN_PASSANT if en_passant_target is None else en_passant_target[0] * 8 + en_passant_target[1]
+    return POSITION_STRUCT.pack(squares, flags, ep, min(halfmove, 65535), min(fullmove, 65535))
+
+def decode_position(data):
+    """
+    Unpacks bytes made by encode_position and returns the same tuple as parse_fen:
+      (board, active_color, castling, en_passant_target, halfmove, fullmove)
+    """
+    squares, flags, ep, halfmove, fullmove = POSITION_STRUCT.unpack(data)
+    flat = bytearray(64)
+    flat[0::2] = squares.translate(_DECODE_HIGH)
+    flat[1::2] = squares.translate(_DECODE_LOW)
+    board = [list(flat[i:i + 8]) for i in range(0, 64, 8)]
+    active_color = 'b' if flags & 1 else 'w'
+    castling = FLAGS_TO_CASTLING[flags >> 1]
+    en_passant_target = None if ep == NO_EN_PASSANT else divmod(ep, 8)
+    return board, active_color, castling, en_passant_target, halfmove, fullmove
+
+def fen_to_bytes(fen):
+    return encode_position(*parse_fen(fen))
+
+def bytes_to_fen(data):
+    return generate_fen(*decode_position(data))
+
 # Default starting position FEN
 starting_fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 load_board_from_fen(starting_fen)
 
-def load_pieces():
+PIECE_IMAGES = {
+    WHITE | PAWN: "wp", WHITE | KNIGHT: "wn", WHITE | BISHOP: "wb", WHITE | ROOK: "wr", WHITE | QUEEN: "wq", WHITE | KING: "wk",
+    BLACK | PAWN: "bp", BLACK | KNIGHT: "bn", BLACK | BISHOP: "bb", BLACK | ROOK: "br", BLACK | QUEEN: "bq", BLACK | KING: "bk"
+}
+
+def sprite_source_key():
+    """
+    Short digest of the piece PNGs' names, sizes and modification times, so a
+    cached atlas is rebuilt whenever one of the source images changes.
+    """
+    digest = hashlib.sha1()
+    for name in PIECE_IMAGES.values():
+        info = os.stat(os.path.join(PIECE_FOLDER, f"{name}.png"))
+        digest.update(f"{name}:{info.st_size}:{info.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+def build_sprite_atlas(square_size, small_size):
+    """
+    Scales every piece image once and packs them into one surface: the board
+    sized pieces along the top row and the captured-piece icons below them.
+    """
+    atlas = pygame.Surface((len(PIECE_IMAGES) * square_size, square_size + small_size), pygame.SRCALPHA)
+    for i, name in enumerate(PIECE_IMAGES.values()):
+        image = pygame.image.load(os.path.join(PIECE_FOLDER, f"{name}.png"))
+        atlas.blit(pygame.transform.smoothscale(image, (square_size, square_size)), (i * square_size, 0))
+        atlas.blit(pygame.transform.smoothscale(image, (small_size, small_size)), (i * small_size, square_size))
+    return atlas
+
+def load_sprite_atlas(square_size, small_size):
+    """
+    Returns the atlas for the given sizes, loading it from SPRITE_CACHE_FOLDER
+    when an up to date copy exists and building (and caching) it otherwise.
+    """
+    cache_path = os.path.join(SPRITE_CACHE_FOLDER, f"atlas_{square_size}_{small_size}_{sprite_source_key()}.png")
+    if os.path.exists(cache_path):
+        try:
+            return pygame.image.load(cache_path)
+        except pygame.error:
+            pass  # Unreadable cache file; rebuild it below.
+
+    atlas = build_sprite_atlas(square_size, small_size)
+    try:
+        os.makedirs(SPRITE_CACHE_FOLDER, exist_ok=True)
+        # Drop atlases for the same sizes made from older source images.
+        prefix = f"atlas_{square_size}_{small_size}_"
+        for old_name in os.listdir(SPRITE_CACHE_FOLDER):
+            if old_name.startswith(prefix):
+                os.remove(os.path.join(SPRITE_CACHE_FOLDER, old_name))
+        pygame.image.save(atlas, cache_path)
+    except (OSError, pygame.error):
+        pass  # Caching is only an optimisation.
+    return atlas
+
+def load_pieces(square_size=SQUARE_SIZE, small_size=CAPTURED_PIECE_SIZE):
+    atlas = load_sprite_atlas(square_size, small_size)
+    if pygame.display.get_surface() is not None:
+        atlas = atlas.convert_alpha()  # Match the display format for faster blits.
     pieces = {}
     small_pieces = {}
-    piece_map = {
-        WHITE | PAWN: "wp", WHITE | KNIGHT: "wn", WHITE | BISHOP: "wb", WHITE | ROOK: "wr", WHITE | QUEEN: "wq", WHITE | KING: "wk",
-        BLACK | PAWN: "bp", BLACK | KNIGHT: "bn", BLACK | BISHOP: "bb", BLACK | ROOK: "br", BLACK | QUEEN: "bq", BLACK | KING: "bk"
-    }
-    for code, name in piece_map.items():
-        path = os.path.join(PIECE_FOLDER, f"{name}.png")
-        image = pygame.image.load(path)
-        pieces[code] = pygame.transform.smoothscale(image, (SQUARE_SIZE, SQUARE_SIZE))
-        small_pieces[code] = pygame.transform.smoothscale(image, (CAPTURED_PIECE_SIZE, CAPTURED_PIECE_SIZE))
+    for i, code in enumerate(PIECE_IMAGES):
+        pieces[code] = atlas.subsurface((i * square_size, 0, square_size, square_size))
+        small_pieces[code] = atlas.subsurface((i * small_size, square_size, small_size, small_size))
     return pieces, small_pieces
 
+class SpriteCache:
+    """
+    Piece sprites by (square size, icon size), kept for the last
+    SPRITE_CACHE_SIZES sizes used. Resizing the window back to a recent size
+    reuses its sprites, and a new size scales them once (or loads the atlas
+    cached on disk for it).
+    """
+    def __init__(self, capacity=SPRITE_CACHE_SIZES):
+        self.capacity = capacity
+        self.sprites = OrderedDict()
+
+    def get(self, square_size, small_size):
+        """(pieces, small_pieces) for the given sizes, as returned by load_pieces."""
+        key = (square_size, small_size)
+        sprites = self.sprites.get(key)
+        if sprites is not None:
+            self.sprites.move_to_end(key)
+            return sprites
+        sprites = load_pieces(square_size, small_size)
+        self.sprites[key] = sprites
+        if len(self.sprites) > self.capacity:
+            self.sprites.popitem(last=False)
+        return sprites
+
+class Layout:
+    """
+    Screen geometry for one window size. The default layout (the constants
+    above) is scaled uniformly to fit the window and the board centred in it,
+    and everything the GUI draws takes its positions and sizes from here.
+    Fonts are made once per layout and size.
+    """
+    def __init__(self, width=WINDOW_WIDTH, height=WINDOW_HEIGHT):
+        self.width = width
+        self.height = height
+        self.scale = max(MIN_LAYOUT_SCALE, min(width / WINDOW_WIDTH, height / WINDOW_HEIGHT))
+        self.square_size = int(SQUARE_SIZE * self.scale) // SQUARE_SIZE_STEP * SQUARE_SIZE_STEP
+        self.board_size = 8 * self.square_size
+        self.board_x = (width - self.board_size) // 2
+        self.board_y = (height - self.board_size) // 2
+        self.small_size = self.square_size // 2  # Captured piece icons
+        self.log_x = self.board_x + self.board_size + self.scaled(20)
+        self.log_width = self.scaled(200)
+        self.line_height = self.scaled(30)
+        self.scrollbar_width = self.scaled(10)
+        self.hud_width = self.scaled(HUD_WIDTH)
+        self.analysis_width = self.scaled(ANALYSIS_WIDTH)
+        self.analysis_y = height // 2 - self.scaled(WINDOW_HEIGHT // 2 - ANALYSIS_Y)
+        self.fonts = {}
+
+    def scaled(self, length):
+        """A length in pixels at the default window size, scaled to this one."""
+        return max(1, round(length * self.scale))
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = pygame.font.Font(None, self.scaled(size))
+        return font
+
+    def square_origin(self, row, col):
+        """Top left pixel of a board square."""
+        return self.board_x + col * self.square_size, self.board_y + row * self.square_size
+
+    def square_at(self, x, y):
+        """(row, col) under a pixel; either may be outside 0..7 when the pixel is off the board."""
+        return (y - self.board_y) // self.square_size, (x - self.board_x) // self.square_size
+
 def get_algebraic_notation(row, col):
     return f"{chr(97 + col)}{8 - row}"
 
@@ -204,6 +443,26 @@ def find_king(board, color):
                 return (r, c)
     return None
 
+def moved_positions_from_castling(castling):
+    """
+    Builds a moved_positions set from a FEN castling field, marking the king
+    and rook squares whose castling rights have been lost.
+    """
+    moved_positions = set()
+    if 'K' not in castling:
+        moved_positions.add((7, 7))
+    if 'Q' not in castling:
+        moved_positions.add((7, 0))
+    if 'k' not in castling:
+        moved_positions.add((0, 7))
+    if 'q' not in castling:
+        moved_positions.add((0, 0))
+    if 'K' not in castling and 'Q' not in castling:
+        moved_positions.add((7, 4))
+    if 'k' not in castling and 'q' not in castling:
+        moved_positions.add((0, 4))
+    return moved_positions
+
 def get_castling_rights(board, moved_positions):
     rights = ""
     # For White:
@@ -222,6 +481,8 @@ def get_castling_rights(board, moved_positions):
 
 
 def is_square_under_attack(board, pos, attacker_color, moved_positions, en_passant_target):
+    if stats.enabled:
+        stats.incr("attack_checks")
     for r in range(8):
         for c in range(8):
             piece = board[r][c]
@@ -241,6 +502,8 @@ def is_in_check(board, color, moved_positions, en_passant_target):
     return is_square_under_attack(board, king_pos, attacker_color, moved_positions, en_passant_target)
 
 def get_pseudo_legal_moves(board, pos, moved_positions, en_passant_target=None, ignore_castling=False):
+    if stats.enabled:
+        stats.incr("pseudo_move_calls")
     row, col = pos
     piece = board[row][col]
     if piece == EMPTY:
@@ -380,6 +643,8 @@ def get_pseudo_legal_moves(board, pos, moved_positions, en_passant_target=None,
     return moves
 
 def get_legal_moves(board, pos, moved_positions, en_passant_target=None):
+    if stats.enabled:
+        stats.incr("legal_move_calls")
     pseudo_moves = get_pseudo_legal_moves(board, pos, moved_positions, en_passant_target)
     legal_moves = []
     original_piece = board[pos[0]][pos[1]]